@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import numpy as np
+from vector_store import quantize_vectors
+
+try:
+    import hnswlib  # Optional : only needed for the "hnsw" backend
+except ImportError:
+    hnswlib = None
+
+# File paths
+STORE_DIR = "vector_store/"
+ANN_DIR = "ann_index/"
+
+# Default backend and knobs (more lists probed / larger ef = better recall, slower queries)
+ANN_BACKEND = "ivf"  # "ivf", "int8", "hnsw" (needs hnswlib) or "exact"
+IVF_NPROBE = 4
+INT8_RERANK = 4  # The int8 backend re-ranks the k * INT8_RERANK best first-pass candidates with the float32 vectors
+INT8_CHUNK_SIZE = 65_536  # Rows of int8 codes converted at once during the first pass (bounds the temporary memory)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+
+def top_k_rows(scores, k):
+    """Return the positions of the k highest scores of each row, best first (argpartition, then sort the k only)."""
+    n = scores.shape[1]
+    if k is None or k >= n:
+        return np.argsort(-scores, axis=1, kind="stable")
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def inverse_norms(vectors):
+    """1 / l2 norm of each row (0 for null vectors), so cosine = dot * inverse norm without copying the vectors."""
+    norms = np.linalg.norm(vectors, axis=1)
+    return np.divide(1.0, norms, out=np.zeros_like(norms, dtype=np.float32), where=norms > 0).astype(np.float32)
+
+
+def normalize_queries(query_vectors):
+    """l2-normalize query vectors (one per row)."""
+    query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+    norms = np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return query_vectors / norms
+
+
+class ExactIndex:
+    """Brute-force cosine search over all vectors (reference for recall checks)."""
+
+    backend = "exact"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.inv_norms = inverse_norms(vectors)
+
+    def search(self, query_vectors, k=None):
+        """Return (cosine scores, row ids) of the k nearest vectors for each query, best first (k=None : all)."""
+        scores = (normalize_queries(query_vectors) @ self.vectors.T) * self.inv_norms
+        ids = top_k_rows(scores, k)
+        return np.take_along_axis(scores, ids, axis=1), ids
+
+
+class IVFFlatIndex:
+    """Inverted file index : vectors are grouped by nearest centroid, a query only scans its `nprobe` closest lists."""
+
+    backend = "ivf"
+
+    def __init__(self, vectors, centroids, list_offsets, list_ids, nprobe=IVF_NPROBE):
+        self.vectors = vectors
+        self.inv_norms = inverse_norms(vectors)
+        self.centroids = centroids
+        # Rows of list c are list_ids[list_offsets[c]:list_offsets[c + 1]]
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    def search(self, query_vectors, k=10, nprobe=None):
+        """Return (cosine scores, row ids) of the approximate k nearest vectors for each query, best first."""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        query_vectors = normalize_queries(query_vectors)
+        probed_lists = top_k_rows(query_vectors @ self.centroids.T, nprobe)
+
+        all_scores, all_ids = [], []
+        for query_vector, lists in zip(query_vectors, probed_lists):
+            candidates = np.concatenate([self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists])
+            scores = (self.vectors[candidates] @ query_vector) * self.inv_norms[candidates]
+            best = top_k_rows(scores[None, :], k)[0]
+            all_scores.append(scores[best])
+            all_ids.append(candidates[best])
+
+        return pad_results(all_scores, all_ids, k)
+
+
+class QuantizedIndex:
+    """
+    Scalar-quantized index : the first pass scores every product with int8 codes of the l2-normalized vectors
+    (4x smaller than float32, one scale per row), then the best `k * rerank` candidates are re-scored exactly with
+    the float32 vectors (memory-mapped from the vector store, only those rows are read).
+    """
+
+    backend = "int8"
+
+    def __init__(self, vectors, codes, scales, rerank=INT8_RERANK):
+        self.vectors = vectors
+        self.codes = codes  # (n_products, dim) int8
+        self.scales = scales  # Cosine ~= (codes @ normalized query) * scale
+        self.rerank = rerank
+
+    def first_pass(self, query_vectors):
+        """Approximate cosine scores of every product (one row per query), from the int8 codes."""
+        query_vectors = normalize_queries(query_vectors)
+        scores = np.empty((len(query_vectors), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), INT8_CHUNK_SIZE):
+            chunk = self.codes[start:start + INT8_CHUNK_SIZE].astype(np.float32)
+            scores[:, start:start + len(chunk)] = (query_vectors @ chunk.T) * self.scales[start:start + len(chunk)]
+        return scores
+
+    def search(self, query_vectors, k=10, rerank=None):
+        """Return (exact cosine scores, row ids) of the approximate k nearest vectors for each query, best first."""
+        k = min(k or len(self.codes), len(self.codes))
+        query_vectors = normalize_queries(query_vectors)
+        shortlists = top_k_rows(self.first_pass(query_vectors), k * (rerank or self.rerank))
+
+        all_scores, all_ids = [], []
+        for query_vector, candidates in zip(query_vectors, shortlists):
+            rows = np.sort(candidates)  # Rows read in file order
+            scores = (self.vectors[rows] @ query_vector) * inverse_norms(self.vectors[rows])
+            best = top_k_rows(scores[None, :], k)[0]
+            all_scores.append(scores[best])
+            all_ids.append(rows[best])
+
+        return pad_results(all_scores, all_ids, k)
+
+
+def quantize_codes(vectors, chunk_size=INT8_CHUNK_SIZE):
+    """int8 codes and scales of the l2-normalized vectors (by chunks, the float vectors are never copied whole)."""
+    codes = np.empty(vectors.shape, dtype=np.int8)
+    scales = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        codes[start:start + len(chunk)], scales[start:start + len(chunk)] = quantize_vectors(
+            chunk * inverse_norms(chunk)[:, None], "int8")
+    return codes, scales
+
+
+class HNSWIndex:
+    """Graph-based index (hnswlib), `ef_search` trades recall for latency."""
+
+    backend = "hnsw"
+
+    def __init__(self, graph, ef_search=HNSW_EF_SEARCH):
+        self.graph = graph
+        self.ef_search = ef_search
+
+    def search(self, query_vectors, k=10, ef_search=None):
+        """Return (cosine scores, row ids) of the approximate k nearest vectors for each query, best first."""
+        k = min(k or self.graph.get_current_count(), self.graph.get_current_count())
+        self.graph.set_ef(max(ef_search or self.ef_search, k))  # hnswlib needs ef >= k
+        ids, distances = self.graph.knn_query(normalize_queries(query_vectors), k=k)
+        return 1.0 - distances, ids.astype(np.int64)
+
+
+def pad_results(all_scores, all_ids, k):
+    """Stack per-query results into (n_queries, k) arrays, padding short lists with score -inf and id -1."""
+    width = max([len(ids) for ids in all_ids] + [0]) if k is None else k
+    scores = np.full((len(all_ids), width), -np.inf, dtype=np.float32)
+    ids = np.full((len(all_ids), width), -1, dtype=np.int64)
+    for i, (s, r) in enumerate(zip(all_scores, all_ids)):
+        scores[i, :len(s)] = s
+        ids[i, :len(r)] = r
+    return scores, ids
+
+
+def train_kmeans(vectors, nlist, n_iter=20, max_train_size=100_000, seed=0):
+    """Spherical k-means (cosine) on a sample of the vectors, returns l2-normalized centroids."""
+    rng = np.random.default_rng(seed)
+    sample_ids = rng.choice(len(vectors), size=min(len(vectors), max_train_size), replace=False)
+    sample = normalize_queries(vectors[np.sort(sample_ids)])
+
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+    for _ in range(n_iter):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = sample[assignment == c]
+            # Re-seed empty lists with a random vector
+            centroids[c] = members.mean(axis=0) if len(members) else sample[rng.integers(len(sample))]
+        centroids = normalize_queries(centroids)
+    return centroids
+
+
+def assign_lists(vectors, centroids, chunk_size=65_536):
+    """Assign every vector to its nearest centroid, by chunks to bound memory."""
+    inv_norms = inverse_norms(vectors)
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        assignment[start:start + chunk_size] = np.argmax((chunk @ centroids.T) * inv_norms[start:start + chunk_size, None], axis=1)
+    return assignment
+
+
+def build_ann_index(vectors, backend=ANN_BACKEND, nlist=None, nprobe=IVF_NPROBE,
+                    m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, ef_search=HNSW_EF_SEARCH):
+    """Build an ANN index over the vectors (rows of the vector store)."""
+    if backend == "exact":
+        return ExactIndex(vectors)
+
+    if backend == "ivf":
+        nlist = min(nlist or max(1, int(np.sqrt(len(vectors)))), len(vectors))
+        centroids = train_kmeans(vectors, nlist)
+        assignment = assign_lists(vectors, centroids)
+        list_ids = np.argsort(assignment, kind="stable")
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=list_offsets[1:])
+        return IVFFlatIndex(vectors, centroids, list_offsets, list_ids, nprobe=nprobe)
+
+    if backend == "int8":
+        codes, scales = quantize_codes(vectors)
+        return QuantizedIndex(vectors, codes, scales)
+
+    if backend == "hnsw":
+        if hnswlib is None:
+            raise ImportError("The 'hnsw' ANN backend needs the hnswlib package (pip install hnswlib).")
+        graph = hnswlib.Index(space="cosine", dim=vectors.shape[1])
+        graph.init_index(max_elements=len(vectors), ef_construction=ef_construction, M=m)
+        graph.add_items(np.asarray(vectors, dtype=np.float32), np.arange(len(vectors)))
+        return HNSWIndex(graph, ef_search=ef_search)
+
+    raise ValueError(f"Unknown ANN backend: {backend} (expected 'ivf', 'int8', 'hnsw' or 'exact')")
+
+
+def save_ann_index(index, directory=ANN_DIR):
+    """Save an ANN index (the vectors themselves stay in the vector store)."""
+    os.makedirs(directory, exist_ok=True)
+    meta = {"backend": index.backend}
+    if index.backend == "ivf":
+        np.save(os.path.join(directory, "centroids.npy"), index.centroids)
+        np.save(os.path.join(directory, "list_offsets.npy"), index.list_offsets)
+        np.save(os.path.join(directory, "list_ids.npy"), index.list_ids)
+        meta.update({"nlist": index.nlist, "nprobe": index.nprobe, "count": len(index.vectors)})
+    elif index.backend == "int8":
+        np.save(os.path.join(directory, "codes.npy"), index.codes)
+        np.save(os.path.join(directory, "scales.npy"), index.scales)
+        meta.update({"rerank": index.rerank, "count": len(index.codes)})
+    elif index.backend == "hnsw":
+        index.graph.save_index(os.path.join(directory, "hnsw.bin"))
+        meta.update({"ef_search": index.ef_search, "count": index.graph.get_current_count()})
+
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=4)
+
+
+def load_ann_index(vectors, directory=ANN_DIR):
+    """Load a saved ANN index over the given vectors (memory-mapped lists)."""
+    with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    if meta["backend"] == "ivf":
+        return IVFFlatIndex(
+            vectors,
+            np.load(os.path.join(directory, "centroids.npy")),
+            np.load(os.path.join(directory, "list_offsets.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "list_ids.npy"), mmap_mode="r"),
+            nprobe=meta["nprobe"]
+        )
+    if meta["backend"] == "int8":
+        return QuantizedIndex(
+            vectors,
+            np.load(os.path.join(directory, "codes.npy")),  # In memory : the first pass reads all of them
+            np.load(os.path.join(directory, "scales.npy")),
+            rerank=meta["rerank"]
+        )
+    if meta["backend"] == "hnsw":
+        if hnswlib is None:
+            raise ImportError("The 'hnsw' ANN backend needs the hnswlib package (pip install hnswlib).")
+        graph = hnswlib.Index(space="cosine", dim=vectors.shape[1])
+        graph.load_index(os.path.join(directory, "hnsw.bin"), max_elements=meta["count"])
+        return HNSWIndex(graph, ef_search=meta["ef_search"])
+    return ExactIndex(vectors)
+
+
+def load_or_build_ann_index(vectors, directory=ANN_DIR, store_dir=STORE_DIR, backend=ANN_BACKEND):
+    """Load the saved ANN index, (re)building it if it is missing, stale or of another backend."""
+    meta_file = os.path.join(directory, "meta.json")
+    if os.path.exists(meta_file) and os.path.getmtime(meta_file) >= os.path.getmtime(os.path.join(store_dir, "meta.json")):
+        with open(meta_file, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["backend"] == backend and meta.get("count", len(vectors)) == len(vectors):
+            return load_ann_index(vectors, directory)
+
+    index = build_ann_index(vectors, backend=backend)
+    save_ann_index(index, directory)
+    return index
+
+
+def evaluate_ann(index, exact_index, query_vectors, k=10, **search_knobs):
+    """Measure recall@k of an ANN index against the exact search, and the mean latency of both (ms per query)."""
+    start = time.perf_counter()
+    _, exact_ids = exact_index.search(query_vectors, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(exact_ids)
+
+    start = time.perf_counter()
+    _, ann_ids = index.search(query_vectors, k, **search_knobs)
+    ann_ms = (time.perf_counter() - start) * 1000 / len(ann_ids)
+
+    hits = sum(len(set(a[a >= 0]) & set(e)) for a, e in zip(ann_ids, exact_ids))
+    return {"recall": hits / exact_ids.size, "ann_ms": ann_ms, "exact_ms": exact_ms}
+
+
+def quantization_report(index, exact_index, query_vectors, k=10, rerank_factors=(1, 2, 4, 8)):
+    """
+    Recall@k of the int8 index against the exact search for several re-ranking depths, and the memory of both.
+
+    :return: {"rerank": {factor: evaluate_ann report}, "int8_mb": ..., "float32_mb": ..., "max_score_error": ...}
+    """
+    exact_scores = (normalize_queries(query_vectors) @ exact_index.vectors.T) * exact_index.inv_norms
+    return {
+        "rerank": {factor: evaluate_ann(index, exact_index, query_vectors, k, rerank=factor) for factor in rerank_factors},
+        "int8_mb": (index.codes.nbytes + index.scales.nbytes) / 2**20,
+        "float32_mb": len(index.codes) * index.codes.shape[1] * 4 / 2**20,
+        "max_score_error": float(np.abs(index.first_pass(query_vectors) - exact_scores).max()),
+    }
+
+
+if __name__ == "__main__":
+    # Build the ANN index from the vector store, then check its recall using the products as queries
+    from vector_store import load_vector_store
+    store = load_vector_store(STORE_DIR)
+    vectors = store.float_vectors()
+
+    index = build_ann_index(vectors, backend=ANN_BACKEND)
+    save_ann_index(index, ANN_DIR)
+    print(f"✅ {index.backend} ANN index saved in {ANN_DIR}.")
+
+    if index.backend != "exact":
+        report = evaluate_ann(index, ExactIndex(vectors), vectors, k=min(10, len(vectors)))
+        print(f"   Recall@10: {report['recall']:.3f} | ANN {report['ann_ms']:.3f} ms/query | Exact {report['exact_ms']:.3f} ms/query")
+
+    # Recall of the int8 first pass + exact re-ranking, whatever the configured backend
+    quantized = index if index.backend == "int8" else build_ann_index(vectors, backend="int8")
+    report = quantization_report(quantized, ExactIndex(vectors), vectors, k=min(10, len(vectors)))
+    print(f"\n🔍 int8 vectors: {report['int8_mb']:.2f} MB instead of {report['float32_mb']:.2f} MB (max cosine error {report['max_score_error']:.4f})")
+    for factor, result in report["rerank"].items():
+        print(f"   Re-rank top {factor}k: recall@10 {result['recall']:.3f} | {result['ann_ms']:.3f} ms/query")
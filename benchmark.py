@@ -0,0 +1,274 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import zlib
+import argparse
+import tempfile
+import resource
+import numpy as np
+from json_lines import iter_records, write_records
+from product_tokenization import tokenize_products, TOKENIZE_WORKERS
+from product_embedding import embed_stream, load_model, STORE_DTYPE, ENCODE_BATCH_SIZE
+from vector_store import VectorStoreWriter, load_vector_store
+from product_store import write_product_store
+from inverted_index import build_inverted_index, save_inverted_index
+from ann_index import build_ann_index, save_ann_index
+from search_engine import SearchEngine, set_engine
+from search_cache import invalidate_all
+from lexical_search import lexical_search
+from semantic_search import semantic_search
+from hybrid_search import hybrid_search
+
+# File paths
+BASE_PRODUCTS_FILE = "extracted_products.json"  # Real products, their words are used to generate the synthetic ones
+RESULTS_FILE = "benchmark_results.json"
+
+# Catalogue sizes (products), number of timed queries per search, results per query
+SIZES = (1_000, 10_000)  # Up to 1_000_000 with --sizes (the tokenization of 10^6 products takes a while)
+NUM_QUERIES = 200
+TOP_K = 10
+SEED = 0
+
+# A metric more than 20% above its baseline value is reported as a regression
+REGRESSION_THRESHOLD = 1.2
+
+BRANDS = ("GameFuel", "CatCozies", "TimelessFootwear", "ChocoDelight", "StrideAhead", "MagicSteps", "Elevate", "OutdoorGear")
+COUNTRIES = ("usa", "south korea", "italy", "germany", "canada", "south africa", "spain", "netherlands", "japan", "france")
+VARIANTS = ("small", "medium", "large", "red", "blue", "black", "pink", "pack of 6", "pack of 12", "one size")
+
+
+class StubEncoder:
+    """
+    Deterministic stand-in for the SentenceTransformer model (same encode interface) : the vector of a text is the
+    normalized sum of one fixed pseudo-random vector per word. Works offline, and the results are reproducible.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self.word_vectors = {}
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def word_vector(self, word):
+        if word not in self.word_vectors:
+            rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+            self.word_vectors[word] = rng.standard_normal(self.dim).astype(np.float32)
+        return self.word_vectors[word]
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.split():
+                vectors[i] += self.word_vector(word)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms > 0, norms, 1)
+        return vectors[0] if single else vectors
+
+
+def base_vocabulary(path=BASE_PRODUCTS_FILE):
+    """Words of the real product titles and descriptions (synthetic words if the file is missing)."""
+    if not os.path.exists(path):
+        return [f"word{i}" for i in range(2000)]
+    with open(path, "r", encoding="utf-8") as f:
+        products = json.load(f)
+    text = " ".join(p["title"] + " " + p["description"] for p in products).lower()
+    return sorted(set(re.findall(r"[a-z]+", text)))
+
+
+def generate_catalogue(size, seed=SEED, vocabulary=None):
+    """Synthetic products with the same fields as extracted_products.json (words follow a Zipf-like distribution)."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(vocabulary or base_vocabulary())
+    word_probabilities = 1 / np.arange(1, len(vocabulary) + 1)
+    word_probabilities /= word_probabilities.sum()
+
+    products = []
+    for i in range(size):
+        title = " ".join(vocabulary[rng.choice(len(vocabulary), rng.integers(2, 5), p=word_probabilities)]).title()
+        description = " ".join(vocabulary[rng.choice(len(vocabulary), rng.integers(40, 120), p=word_probabilities)])
+        products.append({
+            "url": f"https://example.com/product/{i}",
+            "title": title,
+            "variant": VARIANTS[rng.integers(len(VARIANTS))],
+            "description": description.capitalize() + ".",
+            "price ($)": round(float(rng.uniform(2, 100)), 2),
+            "brand": BRANDS[rng.integers(len(BRANDS))],
+            "total_reviews": int(rng.integers(0, 50)),
+            "mean_mark": round(float(rng.uniform(1, 5)), 1),
+            "last_rating": int(rng.integers(1, 6)),
+            "country_of_origin": COUNTRIES[rng.integers(len(COUNTRIES))],
+            "product_id": f"{i:032x}",
+        })
+    return products
+
+
+def generate_queries(products, count=NUM_QUERIES, seed=SEED):
+    """Queries of 1 to 4 words taken from product titles, brands and countries."""
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for _ in range(count):
+        product = products[rng.integers(len(products))]
+        words = product["title"].lower().split()
+        words = list(rng.choice(words, min(len(words), rng.integers(1, 4)), replace=False))
+        if rng.random() < 0.3:
+            words.append(product["country_of_origin"] if rng.random() < 0.5 else product["brand"].lower())
+        queries.append(" ".join(words))
+    return queries
+
+
+def rss_mb():
+    """(current, peak) resident memory of the process in MB (current is None where /proc is not available)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+    try:
+        with open("/proc/self/statm", "r") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        current = None
+    return current, peak
+
+
+def size_mb(path):
+    """Size of a file or of all the files of a directory, in MB."""
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 1024 ** 2
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 1024 ** 2
+
+
+def percentiles(times):
+    """p50 / p95 / p99 / mean of durations in seconds, in milliseconds."""
+    ms = np.array(times) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean())}
+
+
+def run_size(size, directory, model, num_queries=NUM_QUERIES, workers=TOKENIZE_WORKERS, batch_size=ENCODE_BATCH_SIZE):
+    """Build every artefact of a synthetic catalogue, then time the three searches."""
+    report = {"products": size, "stages": {}, "queries": {}, "sizes_mb": {}}
+    paths = {
+        "products": os.path.join(directory, "products.json"),
+        "tokenized": os.path.join(directory, "tokenized_products.json"),
+        "index": os.path.join(directory, "lexical_index"),
+        "store": os.path.join(directory, "vector_store"),
+        "ann": os.path.join(directory, "ann_index"),
+        "product_store": os.path.join(directory, "product_store"),
+    }
+
+    def stage(name, function):
+        start = time.perf_counter()
+        result = function()
+        current, peak = rss_mb()
+        report["stages"][name] = {"seconds": time.perf_counter() - start, "rss_mb": current, "peak_rss_mb": peak}
+        return result
+
+    products = stage("generation", lambda: generate_catalogue(size))
+    write_records(products, paths["products"])
+    stage("tokenization", lambda: write_records(tokenize_products(iter(products), workers), paths["tokenized"]))
+    stage("embedding", lambda: embed_stream(model, iter_records(paths["tokenized"]),
+                                            VectorStoreWriter(paths["store"], STORE_DTYPE, "benchmark"), batch_size))
+    stage("lexical_index", lambda: save_inverted_index(build_inverted_index(list(iter_records(paths["tokenized"]))), paths["index"]))
+    stage("ann_index", lambda: save_ann_index(build_ann_index(load_vector_store(paths["store"]).float_vectors()), paths["ann"]))
+    stage("product_store", lambda: write_product_store(iter_records(paths["products"]), paths["product_store"], paths["products"]))
+    for name in ("products", "tokenized", "index", "store", "ann", "product_store"):
+        report["sizes_mb"][name] = size_mb(paths[name])
+
+    # Search engine on these files, with the same model (loaded "for free" : its time is in the embedding stage)
+    engine = SearchEngine(products_file=paths["products"], tokenized_file=paths["tokenized"], index_dir=paths["index"],
+                          store_dir=paths["store"], ann_dir=paths["ann"], embeddings_json_file=os.path.join(directory, "none.json"),
+                          product_store_dir=paths["product_store"])
+    engine.load("model", lambda: model)
+    set_engine(engine)
+    report["startup"] = engine.warmup(ann=True)  # semantic_search(top_k=...) is timed too
+
+    searches = {
+        "lexical_search": lambda q: lexical_search(q, top_k=TOP_K),
+        "semantic_search": lambda q: semantic_search(q, top_k=TOP_K),
+        "hybrid_search": lambda q: hybrid_search(q, top_n=TOP_K),
+    }
+    queries = generate_queries(products, num_queries)
+    for name, search in searches.items():
+        times = []
+        for query in queries:
+            invalidate_all()  # Every query is timed without the caches (not counted)
+            start = time.perf_counter()
+            search(query)
+            times.append(time.perf_counter() - start)
+        report["queries"][name] = percentiles(times)
+
+    report["peak_rss_mb"] = rss_mb()[1]
+    return report
+
+
+def flatten(report, prefix=""):
+    """{"1000.queries.hybrid_search.p95_ms": value, ...} for the numeric values of a report."""
+    values = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def compare_with_baseline(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Ratio current / baseline of the timings, memory and sizes, and the metrics above the threshold."""
+    current, previous = flatten(results), flatten(baseline)
+    comparison, regressions = {}, []
+    for metric, value in current.items():
+        if metric.endswith(".products") or not previous.get(metric):
+            continue
+        ratio = value / previous[metric]
+        comparison[metric] = ratio
+        if ratio > threshold and ".generation." not in metric:  # The generation is not part of the code under test
+            regressions.append(metric)
+    return comparison, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the build stages and of the searches on synthetic catalogues.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="Catalogue sizes (products)")
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES, help="Timed queries per search")
+    parser.add_argument("--workers", type=int, default=TOKENIZE_WORKERS, help="Tokenization processes")
+    parser.add_argument("--model", choices=("stub", "real"), default="stub", help="Deterministic stub or the real model")
+    parser.add_argument("--output", default=RESULTS_FILE, help="Where the results are saved")
+    parser.add_argument("--baseline", help="Previous results file to compare with")
+    parser.add_argument("--keep", help="Keep the generated files in this directory")
+    args = parser.parse_args()
+
+    model = StubEncoder() if args.model == "stub" else load_model()
+    results = {}
+    for size in args.sizes:
+        directory = os.path.join(args.keep, str(size)) if args.keep else tempfile.mkdtemp(prefix=f"benchmark_{size}_")
+        os.makedirs(directory, exist_ok=True)
+        print(f"🔍 {size} products ...")
+        try:
+            report = run_size(size, directory, model, args.queries, args.workers)
+        finally:
+            if not args.keep:
+                shutil.rmtree(directory, ignore_errors=True)
+        results[str(size)] = report
+
+        for name, stage in report["stages"].items():
+            print(f"   {name:<16} {stage['seconds']:>9.2f} s   peak RSS {stage['peak_rss_mb']:>8.1f} MB")
+        for name, timing in report["queries"].items():
+            print(f"   {name:<16} p50 {timing['p50_ms']:>8.2f} ms   p95 {timing['p95_ms']:>8.2f} ms   p99 {timing['p99_ms']:>8.2f} ms")
+        print("   index sizes      " + ", ".join(f"{name} {mb:.1f} MB" for name, mb in report["sizes_mb"].items()))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"model": args.model, "results": results}, f, indent=4)
+    print(f"✅ Results saved in {args.output}.")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        comparison, regressions = compare_with_baseline(results, baseline["results"])
+        print(f"\n⏱️ Compared with {args.baseline} : {len(comparison)} metrics, {len(regressions)} regressions")
+        for metric in regressions:
+            print(f"   ⚠️ {metric} x{comparison[metric]:.2f}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,54 @@
+import argparse
+from json_lines import iter_records, RecordWriter
+from product_tokenization import tokenize_products, TOKENIZE_WORKERS, CHUNK_SIZE
+from product_embedding import load_model, embed_stream, MODEL_NAME, STORE_DTYPE, ENCODE_BATCH_SIZE, ENCODE_THREADS
+from vector_store import VectorStoreWriter
+from encoder_backends import ENCODER_BACKENDS, ENCODER_BACKEND
+
+# File paths
+PRODUCTS_FILE = "extracted_products.json"  # A JSON Lines file (.jsonl) is streamed instead of loaded at once
+TOKENIZED_FILE = "tokenized_products.json"
+STORE_DIR = "vector_store/"
+
+
+def build(products_file=PRODUCTS_FILE, tokenized_file=TOKENIZED_FILE, store_dir=STORE_DIR, workers=TOKENIZE_WORKERS,
+          batch_size=ENCODE_BATCH_SIZE, threads=ENCODE_THREADS, chunk_size=CHUNK_SIZE, backend=ENCODER_BACKEND):
+    """
+    Full build in one streaming pass : products are read one by one, tokenized in a process pool, written to the
+    tokenized file and encoded by chunks into the vector store, so memory doesn't grow with the catalogue.
+
+    :return: The new vector store
+    """
+    model = load_model(MODEL_NAME, threads, backend)
+    tokenized_writer = RecordWriter(tokenized_file)
+
+    def written(tokenized_products):
+        # Save each tokenized product on its way to the encoder
+        for tokenized_product in tokenized_products:
+            tokenized_writer.write(tokenized_product)
+            yield tokenized_product
+
+    try:
+        store_writer = VectorStoreWriter(store_dir, dtype=STORE_DTYPE, model_name=MODEL_NAME, backend=backend)
+        tokenized_products = tokenize_products(iter_records(products_file), workers, chunk_size)
+        store = embed_stream(model, written(tokenized_products), store_writer, batch_size, chunk_size)
+        tokenized_writer.close()
+    except BaseException:
+        tokenized_writer.abort()  # No tokenized_products.json.tmp left behind, the previous file stays usable
+        raise
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming tokenization + embedding build.")
+    parser.add_argument("products_file", nargs="?", default=PRODUCTS_FILE)
+    parser.add_argument("--workers", type=int, default=TOKENIZE_WORKERS, help="Tokenization processes")
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE, help="Texts per model forward pass")
+    parser.add_argument("--threads", type=int, default=ENCODE_THREADS, help="CPU threads of the model")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Products in memory per step")
+    parser.add_argument("--backend", default=ENCODER_BACKEND, choices=ENCODER_BACKENDS, help="Encoder backend")
+    args = parser.parse_args()
+
+    store = build(args.products_file, workers=args.workers, batch_size=args.batch_size,
+                  threads=args.threads, chunk_size=args.chunk_size, backend=args.backend)
+    print(f"✅ {len(store)} products tokenized into {TOKENIZED_FILE} and encoded into {STORE_DIR} ({store.dtype}).")
@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import requests
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote, unquote
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# Default politeness and robustness settings
+MAX_WORKERS = 8  # Concurrent requests (all hosts together)
+MIN_DELAY = 1.0  # Minimum delay between two requests to the same host (seconds)
+MAX_RETRIES = 3  # Retries after a network error, a 5xx or a 429 response
+BACKOFF = 1.0  # Base of the exponential backoff between retries (seconds)
+TIMEOUT = 10
+USER_AGENT = "Mozilla/5.0"
+CACHE_DIR = "crawl_cache/"  # Pages + ETag / Last-Modified, for conditional requests
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# URL canonicalization : query parameters that don't change the page (tracking, sessions) are dropped before fetching
+IGNORED_QUERY_PARAMS = {"gclid", "fbclid", "msclkid", "ref", "sessionid", "sid", "phpsessid", "jsessionid"}
+IGNORED_QUERY_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+PATH_SAFE_CHARACTERS = ":@!$&'()*+,;=-._~"  # Left as is in a path segment (an encoded "/" stays encoded)
+
+
+def canonicalize_url(url):
+    """
+    Canonical form of a URL, so that the different spellings of a page are fetched once : lowercase scheme and
+    host, no default port, no fragment, no empty path segment nor trailing slash, the same percent-encoding, the
+    tracking parameters removed and the other query parameters sorted.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    segments = [quote(unquote(segment), safe=PATH_SAFE_CHARACTERS) for segment in parts.path.split("/") if segment]
+    path = "/" + "/".join(segments)
+    params = [
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in IGNORED_QUERY_PARAMS and not name.lower().startswith(IGNORED_QUERY_PREFIXES)
+    ]
+    return urlunsplit((scheme, host, path, urlencode(sorted(params)), ""))
+
+
+class HostRateLimiter:
+    """Politeness scheduler : requests to the same host are spaced by at least `min_delay` seconds."""
+
+    def __init__(self, min_delay=MIN_DELAY):
+        self.min_delay = min_delay
+        self.next_slot = {}  # host -> earliest time of its next request
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.min_delay
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class PageCache:
+    """On-disk copy of the fetched pages with their validators (ETag, Last-Modified), one file per URL."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, url):
+        return os.path.join(self.directory, hashlib.md5(url.encode()).hexdigest() + ".json")
+
+    def get(self, url):
+        if self.directory is None or not os.path.exists(self.path(url)):
+            return None
+        with open(self.path(url), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, url, html, etag=None, last_modified=None):
+        if self.directory is None:
+            return
+        with open(self.path(url), "w", encoding="utf-8") as f:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified, "html": html}, f)
+
+
+class Crawler:
+    """Concurrent fetcher : pooled session, per-host rate limiting, retries with backoff and conditional requests."""
+
+    def __init__(self, max_workers=MAX_WORKERS, min_delay=MIN_DELAY, max_retries=MAX_RETRIES, backoff=BACKOFF,
+                 timeout=TIMEOUT, cache_dir=CACHE_DIR, user_agent=USER_AGENT):
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.rate_limiter = HostRateLimiter(min_delay)
+        self.cache = PageCache(cache_dir)
+        self.stats = {"fetched": 0, "not_modified": 0, "retries": 0, "failed": 0, "duplicate_urls": 0}
+        self.stats_lock = threading.Lock()
+
+        # One session (keep-alive connections) shared by all the threads
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def count(self, stat):
+        with self.stats_lock:
+            self.stats[stat] += 1
+
+    def fetch(self, url):
+        """Return the HTML of a page (from the cache if the server answers 304 Not Modified), or None."""
+        cached = self.cache.get(url)
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self.count("retries")
+            self.rate_limiter.wait(url)
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException:
+                response = None
+
+            if response is not None and response.status_code == 304 and cached is not None:
+                self.count("not_modified")
+                return cached["html"]
+            if response is not None and response.status_code == 200:
+                self.count("fetched")
+                self.cache.put(url, response.text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                return response.text
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                break  # 404 and other client errors : retrying won't help
+
+            if attempt < self.max_retries:
+                # Exponential backoff, or the delay asked by the server
+                retry_after = response.headers.get("Retry-After") if response is not None else None
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+                time.sleep(delay)
+
+        self.count("failed")
+        return None
+
+    def fetch_all(self, urls):
+        """
+        Fetch all the URLs concurrently, return {url: html} (pages that could not be fetched are left out).
+        URLs with the same canonical form (see canonicalize_url) are fetched once.
+        """
+        canonical = {url: canonicalize_url(url) for url in urls}
+        unique_urls = list(dict.fromkeys(canonical.values()))
+        self.stats["duplicate_urls"] += len(canonical) - len(unique_urls)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pages = dict(zip(unique_urls, executor.map(self.fetch, unique_urls)))
+        return {url: pages[canonical[url]] for url in canonical if pages[canonical[url]] is not None}
+
+    def close(self):
+        self.session.close()
+
+
+# Stand-in product site for the self-check (python crawler.py) : a product page, and the statuses answered before it
+STAND_IN_PAGE = """<!DOCTYPE html>
+<html><head><title>web-scraping.dev product {title}</title><!-- tracking --></head>
+<body>
+  <p class="intro">Welcome</p>
+  <p class="product-description lead">{description} &amp; <b>more</b>
+  </p>
+  <span class="product-price">$1,{cents}</span>
+  <button class="btn add-to-cart" data-variant-id="{variant}">Add</button>
+  <table>
+    <tr><td class="feature-label">Material</td><td class="feature-value">Cotton</td></tr>
+    <tr><td class="feature-label"> Brand </td><td class="feature-value">ChocoDelight {title}</td></tr>
+  </table>
+</body></html>
+"""
+STAND_IN_PATHS = {
+    "/product/1": (),  # Served with an ETag, 304 when it matches
+    "/product/2": (503, 503),  # Unavailable twice, then served
+    "/product/3": (503,) * (MAX_RETRIES + 1),  # Always unavailable
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves STAND_IN_PATHS and counts the requests of each path (in server.hits)."""
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        with self.server.lock:
+            hits = self.server.hits.get(path, 0)
+            self.server.hits[path] = hits + 1
+        if path not in STAND_IN_PATHS:
+            self.send_error(404)
+            return
+        failures = STAND_IN_PATHS[path]
+        if hits < len(failures):
+            self.send_response(failures[hits])
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        number = path.rsplit("/", 1)[1]
+        etag = f'"page-{number}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = STAND_IN_PAGE.format(title=f"Box {number}", description=f"Dark chocolate {number}",
+                                    cents=f"{number}99.50", variant=f"{number}-small").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def check_crawler():
+    """
+    Crawl a stand-in local server : retries on 503, conditional requests (ETag / 304) and canonical-URL dedup, then
+    parse the pages with every parser backend of product_extraction (the ones installed).
+
+    :return: The failed checks (empty if everything works)
+    """
+    from product_extraction import PARSER_BACKENDS, parse_html
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.hits, server.lock = {}, threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/product/1?utm_source=mail", f"HTTP://127.0.0.1:{server.server_address[1]}/product/1/#reviews",
+            f"{base}//product/2", f"{base}/product/3", f"{base}/missing"]
+
+    failures = []
+
+    def check(condition, message):
+        if not condition:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        crawler = Crawler(max_workers=4, min_delay=0, backoff=0.01, timeout=5, cache_dir=cache_dir)
+        pages = crawler.fetch_all(urls)
+        crawler.close()
+        check(set(pages) == set(urls[:3]), f"pages fetched for {sorted(pages)}")
+        check(server.hits == {"/product/1": 1, "/product/2": 3, "/product/3": MAX_RETRIES + 1, "/missing": 1},
+              f"requests per path {server.hits}")
+        check(crawler.stats == {"fetched": 2, "not_modified": 0, "retries": 2 + MAX_RETRIES, "failed": 2,
+                                "duplicate_urls": 1}, f"first crawl stats {crawler.stats}")
+
+        # Second crawl with the same cache : the page with an ETag comes back as 304 Not Modified
+        crawler = Crawler(max_workers=4, min_delay=0, backoff=0.01, timeout=5, cache_dir=cache_dir)
+        cached_pages = crawler.fetch_all(urls[:2])
+        crawler.close()
+        check(cached_pages == {url: pages[urls[0]] for url in urls[:2]}, "cached page differs from the fetched one")
+        check(crawler.stats["not_modified"] == 1 and crawler.stats["fetched"] == 0, f"second crawl stats {crawler.stats}")
+    server.shutdown()
+    server.server_close()
+
+    expected = {urls[0]: ("Box 1", "1-small", "Dark chocolate 1 & more", 1199.5, "ChocoDelight Box 1"),
+                urls[2]: ("Box 2", "2-small", "Dark chocolate 2 & more", 1299.5, "ChocoDelight Box 2")}
+    for backend in PARSER_BACKENDS:
+        try:
+            fields = {url: parse_html(html, backend) for url, html in pages.items() if url in expected}
+        except ImportError as error:
+            print(f"⏭️ Parser backend {backend} skipped : {error}")
+            continue
+        check(fields == expected, f"{backend} parser fields {fields}")
+    return failures
+
+
+if __name__ == "__main__":
+    # python crawler.py : self-check against a stand-in local server (exit code 1 if a check fails)
+    failures = check_crawler()
+    for failure in failures:
+        print(f"❌ Unexpected {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ Crawler retries, conditional requests, URL dedup and parser backends work as expected.")
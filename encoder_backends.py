@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+# Encoder of the queries and the products (same model for both), run on CPU by one of the backends :
+#   "torch"     : the sentence-transformers model as is (reference)
+#   "int8"      : the same model with its Linear layers dynamically quantized to int8 (torch)
+#   "onnx"      : the transformer exported once to ONNX and run by onnxruntime (pooling + normalization in numpy)
+#   "onnx_int8" : the ONNX export with int8 weights (onnxruntime dynamic quantization)
+ENCODER_BACKENDS = ("torch", "int8", "onnx", "onnx_int8")
+ENCODER_BACKEND = "torch"
+MODEL_NAME = "multi-qa-MiniLM-L6-cos-v1"
+
+# CPU threads of the encoder (None = library default), and tokens kept per text (None = the model's maximum).
+# Queries are short, but the product texts are long : a lower maximum changes the product embeddings (see parity_report)
+ENCODER_THREADS = None
+MAX_SEQ_LENGTH = None
+
+# ONNX export (made on first use of an ONNX backend, then reused)
+ONNX_DIR = "onnx_model/"
+ONNX_OPSET = 17  # First opset with a LayerNormalization operator (the exporter fails to convert it to older ones)
+
+# Parity check : reference embeddings (legacy JSON, computed with the torch model) and the texts they were made from
+EMBEDDINGS_JSON_FILE = "embeddings_of_products.json"
+TOKENIZED_FILE = "tokenized_products.json"
+
+
+def load_torch_model(model_name=MODEL_NAME, threads=ENCODER_THREADS, max_seq_length=MAX_SEQ_LENGTH, quantize=False):
+    """Load the sentence-transformers model (heavy import), optionally with int8 dynamic quantization."""
+    if threads or quantize:
+        import torch
+        if threads:
+            torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device="cpu") if quantize else SentenceTransformer(model_name)
+    if max_seq_length:
+        model.max_seq_length = max_seq_length
+    if quantize:
+        # Weights of the Linear layers stored in int8, activations quantized on the fly (CPU only)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def onnx_paths(onnx_dir=ONNX_DIR):
+    return {
+        "config": os.path.join(onnx_dir, "encoder.json"),
+        "onnx": os.path.join(onnx_dir, "model.onnx"),
+        "onnx_int8": os.path.join(onnx_dir, "model_int8.onnx"),
+    }
+
+
+def export_onnx(model_name=MODEL_NAME, onnx_dir=ONNX_DIR, opset=ONNX_OPSET):
+    """
+    Export the transformer of the model to ONNX (token embeddings output), with its tokenizer, its pooling and
+    normalization settings (applied in numpy by OnnxEncoder), and an int8 version of the weights.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Pooling, Normalize
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    transformer.config.return_dict = False  # Plain tuple outputs, the first one being the token embeddings
+    pooling = next(module for module in model if isinstance(module, Pooling)).get_config_dict()
+    paths = onnx_paths(onnx_dir)
+
+    os.makedirs(onnx_dir, exist_ok=True)
+    model.tokenizer.save_pretrained(onnx_dir)
+    sample = model.tokenizer(["export of the encoder"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer, tuple(sample[name] for name in input_names), paths["onnx"],
+            input_names=input_names, output_names=["token_embeddings"], opset_version=opset,
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]},
+        )
+
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(paths["onnx"], paths["onnx_int8"], weight_type=QuantType.QInt8)
+
+    config = {
+        "model_name": model_name,
+        "pooling": "cls" if pooling.get("pooling_mode_cls_token") else "max" if pooling.get("pooling_mode_max_tokens") else "mean",
+        "normalize": any(isinstance(module, Normalize) for module in model),
+        "max_seq_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension(),
+    }
+    with open(paths["config"], "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=4)
+    return config
+
+
+class OnnxEncoder:
+    """ONNX export of the model run by onnxruntime on CPU, with the same `encode` as a SentenceTransformer."""
+
+    def __init__(self, onnx_dir=ONNX_DIR, quantized=False, threads=ENCODER_THREADS, max_seq_length=MAX_SEQ_LENGTH):
+        import onnxruntime
+        from transformers import AutoTokenizer
+        paths = onnx_paths(onnx_dir)
+        with open(paths["config"], "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(paths["onnx_int8" if quantized else "onnx"], options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        self.max_seq_length = max_seq_length or self.config["max_seq_length"]
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def pool(self, token_embeddings, attention_mask):
+        if self.config["pooling"] == "cls":
+            return token_embeddings[:, 0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        if self.config["pooling"] == "max":
+            return np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        return (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        vectors = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Texts of similar lengths are batched together (less padding), like sentence-transformers does
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            inputs = self.tokenizer([texts[i] for i in rows], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: inputs[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(["token_embeddings"], feeds)[0]
+            vectors[rows] = self.pool(token_embeddings, inputs["attention_mask"])
+
+        if self.config["normalize"]:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+
+def load_encoder(model_name=MODEL_NAME, backend=ENCODER_BACKEND, threads=ENCODER_THREADS,
+                 max_seq_length=MAX_SEQ_LENGTH, onnx_dir=ONNX_DIR):
+    """Load the encoder of a backend (see ENCODER_BACKENDS), anything with `encode(texts, batch_size)`."""
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend} (expected one of {ENCODER_BACKENDS})")
+    if backend in ("torch", "int8"):
+        return load_torch_model(model_name, threads, max_seq_length, quantize=backend == "int8")
+
+    # The export is made once, and again only if the model changed
+    config_file = onnx_paths(onnx_dir)["config"]
+    config = None
+    if os.path.exists(config_file):
+        with open(config_file, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    if config is None or config["model_name"] != model_name:
+        export_onnx(model_name, onnx_dir)
+    return OnnxEncoder(onnx_dir, quantized=backend == "onnx_int8", threads=threads, max_seq_length=max_seq_length)
+
+
+def parity_report(encoder, reference_file=EMBEDDINGS_JSON_FILE, tokenized_file=TOKENIZED_FILE, batch_size=64):
+    """
+    Cosine between the embeddings of an encoder and the reference embeddings of the products (made with the torch
+    model), and the share of products whose nearest other product is unchanged.
+
+    :return: {"products", "min_cosine", "mean_cosine", "same_neighbour"}
+    """
+    from json_lines import iter_records
+    from product_embedding import product_text
+    with open(reference_file, "r", encoding="utf-8") as f:
+        reference = {p["product_id"]: p["embeddings"] for p in json.load(f)}
+    products = [p for p in iter_records(tokenized_file) if p["product_id"] in reference]
+
+    expected = np.array([reference[p["product_id"]] for p in products], dtype=np.float32)
+    vectors = np.asarray(encoder.encode([product_text(p) for p in products], batch_size=batch_size), dtype=np.float32)
+    expected /= np.maximum(np.linalg.norm(expected, axis=1, keepdims=True), 1e-12)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    cosines = (expected * vectors).sum(axis=1)
+
+    def nearest(matrix):
+        similarities = matrix @ matrix.T
+        np.fill_diagonal(similarities, -np.inf)
+        return similarities.argmax(axis=1)
+
+    return {
+        "products": len(products),
+        "min_cosine": float(cosines.min()) if len(products) else 0.0,
+        "mean_cosine": float(cosines.mean()) if len(products) else 0.0,
+        "same_neighbour": float(np.mean(nearest(expected) == nearest(vectors))) if len(products) > 1 else 1.0,
+    }
+
+
+def latency_report(encoder, texts, batch_size=64):
+    """
+    Encoding time of the texts one by one (a query at a time, like the server without batching) and as one batch.
+
+    :return: {"mean_ms", "p50_ms", "p95_ms" (one text per call), "batch_ms_per_text"}
+    """
+    encoder.encode(texts[:1])  # Warm-up (first call allocations)
+    times = []
+    for text in texts:
+        start = time.perf_counter()
+        encoder.encode([text])
+        times.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    encoder.encode(texts, batch_size=batch_size)
+    batch_time = (time.perf_counter() - start) * 1000
+    return {
+        "mean_ms": float(np.mean(times)),
+        "p50_ms": float(np.percentile(times, 50)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "batch_ms_per_text": batch_time / max(len(texts), 1),
+    }
+
+
+if __name__ == "__main__":
+    # python encoder_backends.py [--backends torch int8 onnx onnx_int8] [--threads N] [--max-seq-length N]
+    parser = argparse.ArgumentParser(description="Cosine parity and latency of the encoder backends.")
+    parser.add_argument("--backends", nargs="+", default=list(ENCODER_BACKENDS), choices=ENCODER_BACKENDS)
+    parser.add_argument("--threads", type=int, default=ENCODER_THREADS, help="CPU threads of the encoder")
+    parser.add_argument("--max-seq-length", type=int, default=MAX_SEQ_LENGTH, help="Tokens kept per text")
+    parser.add_argument("--queries", default="queries.json", help="Queries timed (expanded like the searches)")
+    args = parser.parse_args()
+
+    from lexical_search import preprocess_query
+    with open(args.queries, "r", encoding="utf-8") as f:
+        query_texts = [" ".join(preprocess_query(query)) for query in json.load(f)]
+
+    print(f"\n⏱️ ** Encoder backends : parity with {EMBEDDINGS_JSON_FILE}, latency on {len(query_texts)} queries ** \n")
+    for backend in args.backends:
+        try:
+            encoder = load_encoder(MODEL_NAME, backend, args.threads, args.max_seq_length)
+        except ImportError as error:
+            print(f"⚠️ {backend:<9} skipped ({error})", file=sys.stderr)
+            continue
+        parity = parity_report(encoder)
+        latency = latency_report(encoder, query_texts)
+        print(f"   {backend:<9} cosine min {parity['min_cosine']:.4f} / mean {parity['mean_cosine']:.4f} | "
+              f"same nearest product {parity['same_neighbour']:.3f} | "
+              f"query {latency['mean_ms']:.2f} ms (p95 {latency['p95_ms']:.2f}) | batch {latency['batch_ms_per_text']:.2f} ms/query")
@@ -0,0 +1,154 @@
+import json
+import numpy as np
+from lexical_search import lexical_match_scores, preprocess_query
+from semantic_search import embed_query, semantic_statistics
+from ann_index import normalize_queries
+from ranking import top_k_indices
+from hybrid_search import result_key, hybrid_search
+from search_cache import result_cache
+from search_engine import get_engine
+from search_metrics import stage, count
+
+# Fusion of partial candidate lists (instead of scoring and normalizing every product) :
+#   "global_stats" : the scores keep today's min-max formula, with the per-query maximum taken from the candidates
+#                    (the best product is always among them) and the minimum cosine estimated once for the catalogue
+#   "rrf"          : reciprocal rank fusion, only the ranks of the candidates in each list are used
+FUSION_MODES = ("global_stats", "rrf")
+FUSION_DEPTH = 100  # Candidates taken from each retriever (best lexical matches, ANN neighbours)
+RRF_K = 60  # Usual reciprocal rank fusion constant
+
+
+def rrf_scores(ranks, k=RRF_K):
+    """Reciprocal rank fusion score of 1-based ranks, scaled so that rank 1 gets 1.0 (0 for rank 0 = not ranked)."""
+    ranks = np.asarray(ranks, dtype=np.float64)
+    return np.where(ranks > 0, (k + 1) / (k + np.maximum(ranks, 1)), 0.0)
+
+
+def rank_positions(scores):
+    """1-based rank of each score (ties in array order, like `top_k_indices`)."""
+    ranks = np.empty(len(scores), dtype=np.int64)
+    ranks[top_k_indices(scores)] = np.arange(1, len(scores) + 1)
+    return ranks
+
+
+def partial_candidates(query, depth=FUSION_DEPTH):
+    """
+    Product rows of the `depth` best lexical matches and the `depth` ANN neighbours of the query, with the lexical
+    score of every match (only the postings of the query terms are read) and the exact cosine of the candidates.
+
+    :return: (rows, lexical scores of the rows, lexical ranks of the rows (0 = no match), cosines of the rows)
+    """
+    engine = get_engine()
+    catalogue = engine.catalogue
+    expanded_query_tokens = preprocess_query(query)
+
+    # Lexical : every match is scored (normalized over the matches, as today), the best `depth` become candidates
+    doc_ids, lexical = lexical_match_scores(query, expanded_query_tokens)  # doc_ids sorted
+    lexical_ranks = rank_positions(lexical)
+    lexical_best = catalogue["lexical_rows"][doc_ids[top_k_indices(lexical, depth)]]
+
+    # Semantic : nearest neighbours from the ANN index
+    query_vector = normalize_queries(embed_query(query, expanded_query_tokens))
+    _, ids = engine.ann_index.search(query_vector, depth)
+    semantic_best = catalogue["semantic_rows"][ids[0][ids[0] >= 0]]
+
+    rows = np.union1d(lexical_best, semantic_best)
+    count("fusion_candidates", len(rows))
+
+    # Lexical score and rank of the candidates (0 when they share no token with the query)
+    rows_lexical = np.zeros(len(rows))
+    rows_lexical_ranks = np.zeros(len(rows), dtype=np.int64)
+    if len(doc_ids):
+        candidate_docs = catalogue["lexical_ids"][rows]
+        positions = np.minimum(np.searchsorted(doc_ids, candidate_docs), len(doc_ids) - 1)
+        matched = doc_ids[positions] == candidate_docs  # Never true for -1 (missing from the lexical index)
+        rows_lexical[matched] = lexical[positions[matched]]
+        rows_lexical_ranks[matched] = lexical_ranks[positions[matched]]
+
+    # Exact cosine of the candidates only (products missing from the vector store get the lowest score)
+    semantic_ids = catalogue["semantic_ids"][rows]
+    cosines = np.full(len(rows), -1.0)
+    present = semantic_ids >= 0
+    cosines[present] = (engine.product_vectors[semantic_ids[present]] @ query_vector[0]) * engine.exact_index.inv_norms[semantic_ids[present]]
+    return rows, rows_lexical, rows_lexical_ranks, cosines
+
+
+def hybrid_search_partial(query, top_n=10, lambda_lexical=0.4, lambda_semantic=0.4, lambda_reviews=0.1, lambda_price=0.1,
+                          fusion="global_stats", depth=FUSION_DEPTH):
+    """
+    Hybrid search computed from partial candidate lists (best lexical matches + ANN neighbours) instead of the
+    whole catalogue. Same result format as `hybrid_search` ; with fusion="rrf", the lexical and semantic columns
+    are the reciprocal rank fusion scores.
+
+    :param fusion: "global_stats" or "rrf" (see FUSION_MODES)
+    :param depth: Number of candidates taken from each retriever (larger = closer to the full scoring)
+    """
+    if fusion not in FUSION_MODES:
+        raise ValueError(f"Unknown fusion mode: {fusion} (expected one of {FUSION_MODES})")
+    catalogue = get_engine().catalogue
+
+    key = result_key(query, top_n, lambda_lexical, lambda_semantic, lambda_reviews, lambda_price) + (fusion, depth)
+    results = result_cache.get(key)
+    if results is None:
+        with stage("hybrid_search_partial"):
+            rows, lexical, lexical_ranks, cosines = partial_candidates(query, depth)
+
+            if fusion == "rrf":
+                lexical = rrf_scores(lexical_ranks)
+                semantic = rrf_scores(rank_positions(cosines))
+            else:
+                # Min-max with the candidates' maximum and the estimated catalogue minimum
+                low, high = semantic_statistics()["min_mean"], cosines.max(initial=-1.0)
+                semantic = np.clip((cosines - low) / (high - low), 0.0, 1.0) if high > low else np.zeros(len(rows))
+
+            # Price and review scores are precomputed for the whole catalogue (they don't depend on the query)
+            price_scores, review_scores = catalogue["price_scores"][rows], catalogue["review_scores"][rows]
+            final = lambda_lexical * lexical + lambda_semantic * semantic + lambda_price * price_scores + lambda_reviews * review_scores
+
+            products, prices = catalogue["products"], catalogue["prices"]
+            results = [
+                (final[i], lexical[i], semantic[i], review_scores[i], price_scores[i], prices[rows[i]], products[rows[i]])
+                for i in top_k_indices(final, top_n)
+            ]
+        result_cache.put(key, results)
+
+    return list(results)
+
+
+def fusion_consistency(queries, top_n=10, fusion="global_stats", depth=FUSION_DEPTH):
+    """
+    Compare the partial fusion with the full scoring of `hybrid_search` on some queries.
+
+    :return: {"overlap": mean share of the full top_n found by the partial search, "top1": share of queries with the
+             same best product, "score_error": mean |final score difference| of the products found by both}
+    """
+    overlaps, same_top1, errors = [], [], []
+    for query in queries:
+        full = hybrid_search(query, top_n=top_n)
+        partial = hybrid_search_partial(query, top_n=top_n, fusion=fusion, depth=depth)
+        full_scores = {r[-1]["product_id"]: r[0] for r in full}
+        partial_scores = {r[-1]["product_id"]: r[0] for r in partial}
+        shared = set(full_scores) & set(partial_scores)
+
+        overlaps.append(len(shared) / max(len(full_scores), 1))
+        same_top1.append(bool(full) and bool(partial) and full[0][-1]["product_id"] == partial[0][-1]["product_id"])
+        errors.extend(abs(full_scores[p] - partial_scores[p]) for p in shared)
+
+    return {
+        "overlap": float(np.mean(overlaps)) if overlaps else 0.0,
+        "top1": float(np.mean(same_top1)) if same_top1 else 0.0,
+        "score_error": float(np.mean(errors)) if errors else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    # Consistency of both fusion modes with the full scoring, on the queries of queries.json
+    with open("queries.json", "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    print(f"\n🔍 ** Partial fusion vs full scoring ({len(queries)} queries, top 10, depth {FUSION_DEPTH}) ** \n")
+    statistics = semantic_statistics()
+    print(f"   semantic minimum {statistics['min_mean']:.4f}, calibrated on {statistics['sample_size']} {statistics['source']}")
+    for mode in FUSION_MODES:
+        report = fusion_consistency(queries, top_n=10, fusion=mode)
+        print(f"   {mode:<13} overlap@10 {report['overlap']:.3f} | same top 1 {report['top1']:.3f} | score error {report['score_error']:.4f}")
@@ -1,99 +1,216 @@
-import json
+import asyncio
+import threading
 import numpy as np
-from lexical_search import lexical_search
-from semantic_search import semantic_search
-from sklearn.preprocessing import MinMaxScaler
-
-# Load extracted product data
-with open("extracted_products.json", "r", encoding="utf-8") as f:
-    product_data = json.load(f)
-
-# Extract price and review statistics
-prices = np.array([p["price ($)"] for p in product_data])
-mean_ratings = np.array([p["mean_mark"] for p in product_data])
-total_reviews = np.array([p["total_reviews"] for p in product_data])
-last_ratings = np.array([p["last_rating"] for p in product_data])
-
-# Normalize scores (scales values between 0 and 1)
-scaler = MinMaxScaler()
-
-
-# Normalize Price Scores (Lower Price = Higher Score) #
-# Convert product prices into a NumPy array
-prices = np.array([p["price ($)"] for p in product_data])
-
-# Normalize prices between 0 and 1 (0 = lowest price, 1 = highest price)
-price_scores = scaler.fit_transform(prices.reshape(-1, 1)).flatten()
-
-# Invert scores so that lower prices have higher scores (1 - normalized value)
-price_scores = 1 - price_scores  
-
-# The cheapest product gets a score of 1.0, and the most expensive gets 0.0.
-
-
-
-# Normalize Review Scores (More Reviews + High Ratings = Higher Score) #
-# Extract rating-related values into NumPy arrays
-mean_ratings = np.array([p["mean_mark"] for p in product_data])  # Average rating
-total_reviews = np.array([p["total_reviews"] for p in product_data])  # Total number of reviews
-last_ratings = np.array([p["last_rating"] for p in product_data])  # Most recent rating
-
-# Compute a raw review score: a combination of review count & quality
-# Formula: (mean rating * total reviews) + last rating
-review_scores_raw = (mean_ratings * total_reviews) + last_ratings
-
-# Check if there's variation in review scores (avoid division errors)
-if review_scores_raw.max() > review_scores_raw.min():
-    # Normalize raw review scores between 0 and 1
-    review_scores = scaler.fit_transform(review_scores_raw.reshape(-1, 1)).flatten()
-else:
-    # If all review scores are the same, set them all to 0 (no useful ranking)
-    review_scores = np.zeros_like(review_scores_raw)
-
-# Products with the most positive & frequent reviews get scores closer to 1.0.
-
-
-# Hybrid search function :
-def hybrid_search(query, top_n=None, lambda_lexical=0.4, lambda_semantic=0.4, lambda_reviews=0.1, lambda_price=0.1):
-    """Perform a hybrid search combining lexical, semantic, price, and review-based ranking."""
-    
-    # Get results from both search methods
-    lexical_results = {p["product_id"]: score for score, p in lexical_search(query)}
-    semantic_results = {p["product_id"]: score for score, p in semantic_search(query)}
-
-    # Aggregate scores
-    final_scores = []
-    for i, product in enumerate(product_data):
-        product_id = product["product_id"]  # Use consistent identifier
-
-        # Retrieve scores (default lexical_score to 0 if not found)
-        lexical_score = lexical_results.get(product_id, 0)  # ✅ Ensure missing lexical scores are 0
-        semantic_score = semantic_results.get(product_id, 0)  # Semantic search always provides a score
-        
-        # Get normalized price and review scores
-        price_score = price_scores[i]  # Between 0 and 1
-        review_score = review_scores[i]  # Between 0 and 1
-        real_price = product["price ($)"]
-
-        # Compute weighted final score
-        final_score = (
-            lambda_lexical * lexical_score +
-            lambda_semantic * semantic_score +
-            lambda_price * price_score +
-            lambda_reviews * review_score
+from concurrent.futures import ThreadPoolExecutor
+from lexical_search import lexical_scores, lexical_batch_scores, preprocess_query
+from semantic_search import semantic_scores, semantic_batch_scores
+from ranking import top_k_indices
+from search_cache import result_cache, normalize_query
+from product_filters import filters_key, validate_filters
+from search_engine import get_engine
+from search_metrics import stage, count, profiled
+
+# The products, their normalized price and review scores (lower price = higher score, more reviews + high ratings
+# = higher score, both between 0 and 1) and their rows in both indexes are loaded by the search engine on first use
+
+# Lexical and semantic retrieval are independent : they run concurrently on a shared thread pool
+# (the transformer and NumPy release the GIL), so the latency of a query is the max of both instead of the sum
+SEARCH_THREADS = 4
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def search_executor():
+    """Return the thread pool shared by the retrievers (created on first use)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(SEARCH_THREADS, thread_name_prefix="hybrid-search")
+        return _executor
+
+
+def result_key(query, top_n, lambda_lexical, lambda_semantic, lambda_reviews, lambda_price, filters=None):
+    """Key of the result cache : normalized query + everything that changes the ranking."""
+    return (normalize_query(query), top_n, lambda_lexical, lambda_semantic, lambda_reviews, lambda_price, filters_key(filters))
+
+
+def candidates(filters=None):
+    """
+    Apply the structured filters (price range, minimum mean mark, brand, country) before any scoring.
+
+    :return: (product rows, lexical doc ids, their positions among the rows, vector store rows, their positions),
+             the rows and ids are None without filters (all the products, every index scored in full)
+    """
+    catalogue = get_engine().catalogue
+    if not filters:
+        return None, None, catalogue["lexical_rows"], None, catalogue["semantic_rows"]
+
+    with stage("filters"):
+        rows = get_engine().filter_index.rows(filters)
+        lexical_ids, semantic_ids = catalogue["lexical_ids"][rows], catalogue["semantic_ids"][rows]
+        lexical_positions = np.flatnonzero(lexical_ids >= 0)  # Products missing from an index keep a score of 0
+        semantic_positions = np.flatnonzero(semantic_ids >= 0)
+    count("filtered_candidates", len(rows))
+    return rows, lexical_ids[lexical_positions], lexical_positions, semantic_ids[semantic_positions], semantic_positions
+
+
+def fuse_scores(index_lexical, index_semantic, lambda_lexical, lambda_semantic, lambda_reviews, lambda_price, selection=None):
+    """
+    Move the scores of both search methods (indexed by lexical doc id / vector store row, one row per query for
+    batches) to the product rows and combine them with the price and review scores.
+
+    :param selection: Result of `candidates` (None = no filters)
+    :return: (final, lexical, semantic) score arrays, aligned with the rows of the product store (or the filtered rows)
+    """
+    catalogue = get_engine().catalogue
+    rows, _, lexical_positions, _, semantic_positions = selection if selection is not None else candidates()
+    with stage("fusion"):
+        price_scores, review_scores = catalogue["price_scores"], catalogue["review_scores"]
+        if rows is not None:
+            price_scores, review_scores = price_scores[rows], review_scores[rows]
+        shape = index_lexical.shape[:-1] + (len(price_scores),)
+
+        # Lexical = 0 for products without match
+        lexical = np.zeros(shape)
+        lexical[..., lexical_positions] = index_lexical
+        semantic = np.zeros(shape)
+        semantic[..., semantic_positions] = index_semantic
+
+        # Compute weighted final score (vectorized over all products)
+        final = (
+            lambda_lexical * lexical +
+            lambda_semantic * semantic +
+            lambda_price * price_scores +
+            lambda_reviews * review_scores
         )
-
-        final_scores.append((final_score, lexical_score, semantic_score, review_score, price_score, real_price, product))
-
-    # Sort all products by highest score
-    ranked_results = sorted(final_scores, key=lambda x: x[0], reverse=True)
-
-    # **Apply `top_n` if specified**
-    if top_n is not None:
-        ranked_results = ranked_results[:top_n]
-
-    return ranked_results  # ✅ Returns scores for all products
-
+    return final, lexical, semantic
+
+
+def ranked_results(final, lexical, semantic, top_n, rows=None):
+    """
+    Select the `top_n` best rows (all products if None), only those are sorted and turned into tuples.
+    The product of a result is a ProductRow : a reference to its row of the product store, not a copy.
+    """
+    catalogue = get_engine().catalogue
+    products, prices = catalogue["products"], catalogue["prices"]
+    price_scores, review_scores = catalogue["price_scores"], catalogue["review_scores"]
+    results = []
+    with stage("ranking"):
+        for i in top_k_indices(final, top_n):
+            r = i if rows is None else rows[i]  # Row in the product store
+            results.append((final[i], lexical[i], semantic[i], review_scores[r], price_scores[r], prices[r], products[r]))
+    return results
+
+
+def hybrid_scores(query, lambda_lexical=0.4, lambda_semantic=0.4, lambda_reviews=0.1, lambda_price=0.1, selection=None):
+    """Return (final, lexical, semantic) score arrays, aligned with the rows of the product store (or the filtered rows)."""
+    expanded_query_tokens = preprocess_query(query)  # Tokenized and expanded once, for both search methods
+    rows, lexical_ids, _, semantic_ids, _ = selection if selection is not None else candidates()
+
+    # The semantic search runs on the pool while this thread does the lexical one (only on the filtered products)
+    semantic = search_executor().submit(semantic_scores, query, expanded_query_tokens, semantic_ids)
+    lexical = lexical_scores(query, expanded_query_tokens, lexical_ids)
+    return fuse_scores(lexical, semantic.result(), lambda_lexical, lambda_semantic, lambda_reviews, lambda_price, selection)
+
+
+def search_facets(filters=None):
+    """Facet counts (brand, country, price range, mean mark) of the products matching the filters."""
+    validate_filters(filters)
+    return get_engine().filter_index.facets(candidates(filters)[0])
+
+
+def hybrid_search(query, top_n=None, lambda_lexical=0.4, lambda_semantic=0.4, lambda_reviews=0.1, lambda_price=0.1,
+                  filters=None):
+    """
+    Perform a hybrid search combining lexical, semantic, price, and review-based ranking.
+
+    :param filters: Optional hard constraints, e.g. {"price_max": 20, "country": "usa"} (see product_filters.FILTER_NAMES),
+                    applied before scoring : only the matching products are scored and returned
+    """
+    validate_filters(filters)
+    get_engine().catalogue  # Loaded first : it also checks that the cached results are still valid
+
+    count("queries")
+    key = result_key(query, top_n, lambda_lexical, lambda_semantic, lambda_reviews, lambda_price, filters)
+    results = result_cache.get(key)
+    if results is None:
+        # Timed end to end, and run under cProfile for a sample of the queries (when the metrics are enabled)
+        with stage("hybrid_search"), profiled():
+            selection = candidates(filters)
+            final, lexical, semantic = hybrid_scores(query, lambda_lexical, lambda_semantic, lambda_reviews, lambda_price, selection)
+            results = ranked_results(final, lexical, semantic, top_n, selection[0])
+        result_cache.put(key, results)
+
+    return list(results)  # Copy, so callers can't modify the cached list
+
+
+async def hybrid_search_async(query, top_n=None, lambda_lexical=0.4, lambda_semantic=0.4, lambda_reviews=0.1, lambda_price=0.1,
+                              filters=None):
+    """
+    Same as `hybrid_search`, for an asyncio application : the blocking steps run on the shared thread pool,
+    both search methods concurrently, and the event loop stays free while they run.
+    """
+    validate_filters(filters)
+    loop = asyncio.get_running_loop()
+    executor = search_executor()
+    await loop.run_in_executor(executor, lambda: get_engine().catalogue)
+
+    count("queries")
+    key = result_key(query, top_n, lambda_lexical, lambda_semantic, lambda_reviews, lambda_price, filters)
+    results = result_cache.get(key)
+    if results is None:
+        with stage("hybrid_search"):  # Includes the time waiting for the pool, like a caller would see it
+            selection = candidates(filters)
+            rows, lexical_ids, _, semantic_ids, _ = selection
+            expanded_query_tokens = await loop.run_in_executor(executor, preprocess_query, query)
+            lexical, semantic = await asyncio.gather(
+                loop.run_in_executor(executor, lexical_scores, query, expanded_query_tokens, lexical_ids),
+                loop.run_in_executor(executor, semantic_scores, query, expanded_query_tokens, semantic_ids),
+            )
+            final, lexical, semantic = fuse_scores(lexical, semantic, lambda_lexical, lambda_semantic, lambda_reviews, lambda_price, selection)
+            results = ranked_results(final, lexical, semantic, top_n, rows)
+        result_cache.put(key, results)
+
+    return list(results)
+
+
+def hybrid_search_batch(queries, top_n=None, lambda_lexical=0.4, lambda_semantic=0.4, lambda_reviews=0.1, lambda_price=0.1,
+                        batch_size=64, filters=None):
+    """
+    Perform hybrid search on many queries at once.
+
+    Queries are processed by chunks of `batch_size` : each chunk is tokenized and expanded once, encoded with a
+    single model call, and scored with one matrix product per search method.
+
+    :param filters: Structured filters applied to all the queries (see `hybrid_search`)
+    :return: List with the `hybrid_search` results of each query, in the same order as `queries`
+    """
+    validate_filters(filters)
+    get_engine().catalogue  # Loaded first : it also checks that the cached results are still valid
+
+    # Cached queries are answered directly, the others are computed by chunks
+    count("queries", len(queries))
+    keys = [result_key(q, top_n, lambda_lexical, lambda_semantic, lambda_reviews, lambda_price, filters) for q in queries]
+    results = [result_cache.get(key) for key in keys]
+    missing = [i for i, query_results in enumerate(results) if query_results is None]
+    selection = candidates(filters) if missing else None
+
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        with stage("hybrid_search_batch"), profiled():
+            expanded_token_lists = [preprocess_query(queries[i]) for i in chunk]
+
+            # (queries x products) score matrices of both methods, computed concurrently
+            rows, lexical_ids, _, semantic_ids, _ = selection
+            semantic = search_executor().submit(semantic_batch_scores, [" ".join(t) for t in expanded_token_lists], batch_size, semantic_ids)
+            lexical = lexical_batch_scores(expanded_token_lists, lexical_ids)
+            final, lexical, semantic = fuse_scores(lexical, semantic.result(), lambda_lexical, lambda_semantic, lambda_reviews, lambda_price, selection)
+
+            for q, i in enumerate(chunk):
+                results[i] = ranked_results(final[q], lexical[q], semantic[q], top_n, rows)
+                result_cache.put(keys[i], results[i])
+
+    return [list(query_results) for query_results in results]  # Copies, so callers can't modify the cached lists
 
 
 if __name__ == "__main__":
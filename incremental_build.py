@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import hashlib
+from json_lines import iter_records, write_records
+from product_tokenization import tokenize_product, TEXT_FIELDS
+from product_embedding import load_model, embed_products, product_info, MODEL_NAME, STORE_DTYPE
+from vector_store import patch_vector_store, load_vector_store
+from encoder_backends import ENCODER_BACKEND
+from inverted_index import (build_inverted_index, patch_inverted_index, save_inverted_index, load_inverted_index,
+                            product_fields, weighted_tokens)
+from synonyms import SYNONYMS_FILE, COUNTRY_SYNONYMS_FILE
+from text_analyzer import ANALYZER_VERSION
+
+# File paths
+PRODUCTS_FILE = "extracted_products.json"
+TOKENIZED_FILE = "tokenized_products.json"
+STORE_DIR = "vector_store/"
+INDEX_DIR = "lexical_index/"
+MANIFEST_FILE = "build_manifest.json"  # product_id -> content hash, for each stage
+TOKENIZER_FILES = (SYNONYMS_FILE, COUNTRY_SYNONYMS_FILE)  # Files the tokens depend on, besides the products
+
+
+def content_hash(value):
+    """Stable hash of a JSON-serializable value."""
+    return hashlib.md5(json.dumps(value, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def file_hash(path):
+    """Hash of the content of a file (None if it doesn't exist)."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def tokenizer_fingerprint(files=TOKENIZER_FILES):
+    """Hash of what the tokens depend on besides the products : the analyzer version and the synonym files."""
+    return content_hash({"analyzer_version": ANALYZER_VERSION, "files": {path: file_hash(path) for path in files}})
+
+
+def load_manifest(path=MANIFEST_FILE):
+    manifest = {"tokenizer": None, "tokenization": {}, "embedding": {}, "lexical_index": {}}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            manifest.update(json.load(f))
+    return manifest
+
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+
+
+def diff_hashes(old_hashes, new_hashes):
+    """Return the (added, changed, removed) product ids between two product_id -> hash manifests."""
+    added = [pid for pid in new_hashes if pid not in old_hashes]
+    changed = [pid for pid in new_hashes if pid in old_hashes and old_hashes[pid] != new_hashes[pid]]
+    removed = [pid for pid in old_hashes if pid not in new_hashes]
+    return added, changed, removed
+
+
+def tokenization_input(product):
+    """Everything a tokenized product depends on."""
+    return {field: product[field] for field in ("product_id", "url") + TEXT_FIELDS}
+
+
+def incremental_build(products_file=PRODUCTS_FILE, tokenized_file=TOKENIZED_FILE, store_dir=STORE_DIR,
+                      index_dir=INDEX_DIR, manifest_file=MANIFEST_FILE, adopt=False):
+    """
+    Bring tokenized_products.json, the vector store and the lexical index up to date with the products file,
+    only re-tokenizing, re-encoding and re-indexing the products that were added or changed since the last build.
+    Every product is tokenized again if the analyzer version or the synonym files changed.
+
+    :param adopt: Record the current artefacts as up to date without rebuilding anything (first run on an existing build)
+    :return: Summary with the added / changed / removed product ids of each stage
+    """
+    tokenized = {}
+    if os.path.exists(tokenized_file):
+        tokenized = {p["product_id"]: p for p in iter_records(tokenized_file)}
+
+    manifest = load_manifest(manifest_file)
+    fingerprint = tokenizer_fingerprint()
+    retokenize_all = not adopt and manifest["tokenizer"] != fingerprint
+    summary = {}
+
+    # Step 1: Tokenization (only new or modified products, or products missing from the tokenized file).
+    # The products are streamed, only the tokenized products are kept (in the order of the products file)
+    token_hashes, tokenized_products, to_tokenize = {}, [], set()
+    tokenized_changed = False
+    for product in iter_records(products_file):
+        product_id = product["product_id"]
+        token_hashes[product_id] = content_hash(tokenization_input(product))
+        if retokenize_all or product_id not in tokenized or (
+                not adopt and manifest["tokenization"].get(product_id) != token_hashes[product_id]):
+            tokenized_product = tokenize_product(product)
+            tokenized_changed |= tokenized.get(product_id) != tokenized_product
+            tokenized[product_id] = tokenized_product
+            to_tokenize.add(product_id)
+        tokenized_products.append(tokenized[product_id])
+    added, changed, removed = diff_hashes(manifest["tokenization"], token_hashes)
+    if adopt:
+        added, changed, removed = [], [], []
+    summary["tokenization"] = {"added": added, "changed": changed, "removed": removed, "processed": len(to_tokenize)}
+    if tokenized_changed or list(tokenized) != [p["product_id"] for p in tokenized_products]:
+        write_records(tokenized_products, tokenized_file)  # Only if the tokens, the products or their order changed
+
+    # Step 2: Embeddings (only products whose tokens changed, or missing from the store)
+    embedding_hashes = {p["product_id"]: content_hash(weighted_tokens(p)) for p in tokenized_products}
+    added, changed, removed = diff_hashes(manifest["embedding"], embedding_hashes)
+    if adopt:
+        added, changed, removed = [], [], []
+    stored_ids, stored_order, backend = set(), [], ENCODER_BACKEND
+    if os.path.exists(os.path.join(store_dir, "meta.json")):
+        store = load_vector_store(store_dir)
+        stored_order = [p["product_id"] for p in store.product_info]
+        stored_ids = set(stored_order)
+        backend = store.meta.get("backend") or ENCODER_BACKEND  # The new rows are encoded like the stored ones
+    to_embed = [p for p in tokenized_products if p["product_id"] in set(added + changed) or p["product_id"] not in stored_ids]
+
+    updated_vectors = {}
+    if to_embed:
+        vectors = embed_products(load_model(MODEL_NAME, backend=backend), to_embed)  # The model is only loaded if needed
+        updated_vectors = {p["product_id"]: vector for p, vector in zip(to_embed, vectors)}
+    if updated_vectors or stored_order != [p["product_id"] for p in tokenized_products]:
+        patch_vector_store(product_info(tokenized_products), updated_vectors, store_dir, dtype=STORE_DTYPE, model_name=MODEL_NAME,
+                           backend=backend)
+    summary["embedding"] = {"added": added, "changed": changed, "removed": removed, "processed": len(to_embed)}
+
+    # Step 3: Lexical index. Only the postings of the products whose tokens changed are rebuilt, the others are kept;
+    # IDF, average lengths and weights depend on the whole catalogue, they are recomputed from the postings
+    index_hashes = {p["product_id"]: content_hash(product_fields(p)) for p in tokenized_products}
+    added, changed, removed = diff_hashes(manifest["lexical_index"], index_hashes)
+    if adopt:
+        added, changed, removed = [], [], []
+    index = load_inverted_index(index_dir) if os.path.exists(os.path.join(index_dir, "meta.json")) else None
+    indexed_order = [d["product_id"] for d in index.documents] if index is not None else []
+    indexed_ids = set(indexed_order)
+    to_index = [p for p in tokenized_products if p["product_id"] in set(added + changed) or p["product_id"] not in indexed_ids]
+    rebuilt = index is None or "fields" not in index.meta  # Missing, or saved before the per-field postings
+    if rebuilt:
+        save_inverted_index(build_inverted_index(tokenized_products), index_dir)
+    elif to_index or indexed_order != list(index_hashes):
+        save_inverted_index(patch_inverted_index(index, list(index_hashes), to_index), index_dir)
+    summary["lexical_index"] = {"added": added, "changed": changed, "removed": removed,
+                                "processed": len(tokenized_products) if rebuilt else len(to_index), "rebuilt": rebuilt}
+
+    manifest.update(tokenizer=fingerprint, tokenization=token_hashes, embedding=embedding_hashes, lexical_index=index_hashes)
+    save_manifest(manifest, manifest_file)
+    return summary
+
+
+if __name__ == "__main__":
+    # python incremental_build.py [--adopt]
+    summary = incremental_build(adopt="--adopt" in sys.argv)
+
+    for stage in ("tokenization", "embedding", "lexical_index"):
+        s = summary[stage]
+        print(f"✅ {stage}: {len(s['added'])} added, {len(s['changed'])} changed, {len(s['removed'])} removed "
+              f"-> {s['processed']} products processed")
+    if summary["lexical_index"]["rebuilt"]:
+        print("   (the lexical index was rebuilt from all the tokens)")
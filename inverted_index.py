@@ -0,0 +1,406 @@
+import os
+import json
+import numpy as np
+from collections import Counter
+from scipy import sparse
+
+# File paths
+TOKENIZED_FILE = "tokenized_products.json"
+INDEX_DIR = "lexical_index/"
+
+# BM25 parameters (same defaults as rank_bm25.BM25Okapi, so scores stay comparable)
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
+# Field weights, applied at scoring time (BM25F) instead of duplicating the tokens of the important fields
+FIELD_BOOSTS = {"title": 10, "variant": 5, "description": 1, "brand": 10, "country": 10, "synonyms": 5}
+LEGACY_FIELD = "tokens"  # Old tokenized files : one bag of already duplicated tokens, weight 1
+
+# Arrays saved in the index directory (one .npy file each)
+ARRAY_NAMES = ("term_offsets", "posting_docs", "posting_tfs", "doc_lengths", "bm25_idf", "tfidf_idf")
+
+
+def product_fields(tokenized_product):
+    """Return the {field: tokens} of a tokenized product (old files only have a "tokens" list)."""
+    if "fields" in tokenized_product:
+        return tokenized_product["fields"]
+    return {LEGACY_FIELD: tokenized_product["tokens"]}
+
+
+def weighted_tokens(tokenized_product, boosts=None):
+    """Flat token list where each field is repeated by its boost (e.g. the text given to the embedding model)."""
+    boosts = FIELD_BOOSTS if boosts is None else boosts
+    tokens = []
+    for field, field_tokens in product_fields(tokenized_product).items():
+        tokens.extend(field_tokens * int(boosts.get(field, 1)))
+    return tokens
+
+
+class InvertedIndex:
+    """Term -> (doc id, term frequency per field) postings with precomputed BM25F and TF-IDF statistics."""
+
+    def __init__(self, directory, vocabulary, documents, meta, arrays, boosts=None):
+        self.directory = directory
+        self.vocabulary = vocabulary  # List of terms, the position is the term id
+        self.term_ids = {term: term_id for term_id, term in enumerate(vocabulary)}
+        self.documents = documents  # product_id, url, title, variant for each doc id
+        self.meta = meta
+        self.num_docs = meta["num_docs"]
+        self.avgdl = meta["avgdl"]
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.fields = meta["fields"]
+
+        # Postings of term t are posting_docs[term_offsets[t]:term_offsets[t + 1]]
+        self.term_offsets = arrays["term_offsets"]
+        self.posting_docs = arrays["posting_docs"]
+        self.posting_tfs = arrays["posting_tfs"]  # (n_postings, n_fields) term counts
+        self.doc_lengths = arrays["doc_lengths"]  # (n_docs, n_fields) field lengths
+        self.bm25_idf = arrays["bm25_idf"]
+        self.tfidf_idf = arrays["tfidf_idf"]
+        # BM25F and TF-IDF weight of every posting, saved with the index for the boosts of meta.json
+        self.stored_weights = (arrays["bm25_weights"], arrays["tfidf_weights"]) if "bm25_weights" in arrays else None
+        self.set_boosts(FIELD_BOOSTS if boosts is None else boosts)
+
+    def set_boosts(self, boosts):
+        """Change the field weights (no rebuild needed, the statistics that depend on them are recomputed lazily)."""
+        self.boosts = dict(boosts)
+        self.field_weights = np.array([self.boosts.get(field, 1.0) for field in self.fields], dtype=np.float64)
+        self._field_statistics = None
+        self._weight_matrices = None  # Built on first batch query
+
+    def field_statistics(self):
+        """
+        Statistics that depend on the field weights (computed once per set of boosts).
+
+        :return: (BM25F scale of each (doc, field) : weight / length normalization, l2 norm of each TF-IDF doc vector)
+        """
+        if self._field_statistics is None:
+            # BM25F : each field is normalized by its own average length (over the whole catalogue for a shard)
+            if "average_lengths" in self.meta:
+                average_lengths = np.array(self.meta["average_lengths"], dtype=np.float64)
+            elif self.num_docs:
+                average_lengths = self.doc_lengths.mean(axis=0)
+            else:
+                average_lengths = np.ones(len(self.fields))
+            average_lengths[average_lengths == 0] = 1.0
+            length_norms = 1 - self.b + self.b * self.doc_lengths / average_lengths
+            bm25_scales = self.field_weights / length_norms
+
+            # TF-IDF uses the weighted term frequency (same as duplicating the tokens of each field)
+            docs = np.asarray(self.posting_docs)
+            term_of_posting = np.repeat(np.arange(len(self.vocabulary)), np.diff(self.term_offsets))
+            posting_weights = (self.posting_tfs @ self.field_weights) * self.tfidf_idf[term_of_posting]
+            tfidf_doc_norms = np.sqrt(np.bincount(docs, weights=posting_weights ** 2, minlength=self.num_docs))
+            tfidf_doc_norms[tfidf_doc_norms == 0] = 1.0
+
+            self._field_statistics = (bm25_scales, tfidf_doc_norms)
+        return self._field_statistics
+
+    def postings(self, term_id):
+        """Return the (doc ids, per-field term frequencies) posting list of a term."""
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return self.posting_docs[start:end], self.posting_tfs[start:end]
+
+    def posting_weights(self, docs, tfs, term_ids):
+        """BM25F and TF-IDF weights of postings (docs, per-field tfs) of the given terms."""
+        bm25_scales, tfidf_doc_norms = self.field_statistics()
+        # Pseudo term frequency : sum over the fields of weight * tf / length normalization of the field
+        bm25_tfs = (tfs * bm25_scales[docs]).sum(axis=1)
+        bm25 = self.bm25_idf[term_ids] * bm25_tfs * (self.k1 + 1) / (bm25_tfs + self.k1)
+        tfidf = (tfs @ self.field_weights) * self.tfidf_idf[term_ids] / tfidf_doc_norms[docs]
+        return bm25, tfidf
+
+    def score(self, query_tokens):
+        """
+        Score one query with a sparse vector x CSR matrix product per model. Only the rows of the query terms are
+        read, so the documents sharing no token with the query are never touched (implicit candidate filter).
+
+        :param query_tokens: List of (expanded) query tokens, repeated tokens count several times
+        :return: (doc ids, TF-IDF cosine scores, BM25 scores), only for matching documents
+        """
+        tfidf_scores, bm25_scores = self.score_batch([query_tokens])
+
+        # Matching documents are the non-zero TF-IDF scores (TF-IDF weights are > 0 wherever a token is shared)
+        tfidf_scores.sort_indices()
+        doc_ids = tfidf_scores.indices.astype(np.int64)
+        return doc_ids, tfidf_scores.data, bm25_scores[:, doc_ids].toarray().ravel()
+
+    def weight_matrices(self):
+        """Term x document CSR matrices of the BM25F and TF-IDF weight of every posting (built once, on first use)."""
+        if self._weight_matrices is None:
+            docs = np.asarray(self.posting_docs)
+            if self.stored_weights is not None and self.boosts == self.meta.get("boosts"):
+                # Weights precomputed at build time for these boosts (memory-mapped)
+                bm25, tfidf = self.stored_weights
+            else:
+                tfs = np.asarray(self.posting_tfs, dtype=np.float64)
+                term_of_posting = np.repeat(np.arange(len(self.vocabulary)), np.diff(self.term_offsets))
+                bm25, tfidf = self.posting_weights(docs, tfs, term_of_posting)
+
+            shape = (len(self.vocabulary), self.num_docs)
+            self._weight_matrices = (
+                sparse.csr_matrix((bm25, docs, self.term_offsets), shape=shape),
+                sparse.csr_matrix((tfidf, docs, self.term_offsets), shape=shape),
+            )
+        return self._weight_matrices
+
+    def shard(self, doc_ids):
+        """
+        In-memory index of a subset of the documents (local doc id = position in the sorted `doc_ids`), which keeps
+        the statistics of the whole index (IDF, average field lengths, weights), so it gives the same scores.
+        """
+        doc_ids = np.sort(np.asarray(doc_ids, dtype=np.int64))
+        local_ids = np.full(self.num_docs, -1, dtype=np.int64)
+        local_ids[doc_ids] = np.arange(len(doc_ids))
+
+        docs = np.asarray(self.posting_docs)
+        keep = local_ids[docs] >= 0
+        term_of_posting = np.repeat(np.arange(len(self.vocabulary)), np.diff(self.term_offsets))
+        term_offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_of_posting[keep], minlength=len(self.vocabulary)), out=term_offsets[1:])
+
+        bm25_weights, tfidf_weights = self.weight_matrices()
+        average_lengths = self.doc_lengths.mean(axis=0) if self.num_docs else np.ones(len(self.fields))
+        meta = dict(self.meta, num_docs=len(doc_ids), average_lengths=average_lengths.tolist(), boosts=self.boosts)
+        arrays = {
+            "term_offsets": term_offsets,
+            "posting_docs": local_ids[docs[keep]].astype(np.int32),
+            "posting_tfs": np.asarray(self.posting_tfs)[keep],
+            "doc_lengths": np.asarray(self.doc_lengths)[doc_ids],
+            "bm25_idf": np.asarray(self.bm25_idf),
+            "tfidf_idf": np.asarray(self.tfidf_idf),
+            "bm25_weights": bm25_weights.data[keep],
+            "tfidf_weights": tfidf_weights.data[keep],
+        }
+        documents = [self.documents[i] for i in doc_ids]
+        return InvertedIndex(None, self.vocabulary, documents, meta, arrays, boosts=self.boosts)
+
+    def query_matrix(self, query_token_lists):
+        """Sparse (n_queries x n_terms) matrix of query term counts, unknown terms are ignored."""
+        rows, cols = [], []
+        for row, query_tokens in enumerate(query_token_lists):
+            term_ids = [self.term_ids[t] for t in query_tokens if t in self.term_ids]
+            rows.extend([row] * len(term_ids))
+            cols.extend(term_ids)
+        # Duplicate (row, term) entries are summed, which gives the term counts
+        return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(query_token_lists), len(self.vocabulary)))
+
+    def score_batch(self, query_token_lists):
+        """
+        Score many queries at once with one sparse product per model.
+
+        :param query_token_lists: List of (expanded) token lists, one per query
+        :return: (TF-IDF cosine scores, BM25 scores), two sparse (n_queries x n_docs) matrices,
+                 non-zero only for the documents sharing at least one token with the query
+        """
+        bm25_weights, tfidf_weights = self.weight_matrices()
+        query_counts = self.query_matrix(query_token_lists)
+
+        # l2-normalized TF-IDF query vectors
+        query_tfidf = query_counts.multiply(self.tfidf_idf.reshape(1, -1)).tocsr()
+        query_norms = np.sqrt(np.asarray(query_tfidf.multiply(query_tfidf).sum(axis=1))).ravel()
+        query_norms[query_norms == 0] = 1.0
+        query_tfidf = sparse.diags(1 / query_norms) @ query_tfidf
+
+        return (query_tfidf @ tfidf_weights).tocsr(), (query_counts @ bm25_weights).tocsr()
+
+
+def build_inverted_index(tokenized_products, k1=BM25_K1, b=BM25_B, epsilon=BM25_EPSILON):
+    """Build the postings (with the term count of each field) and the global statistics from the tokenized products."""
+    fields = {}  # Field name -> column, in order of appearance
+    for product in tokenized_products:
+        for field in product_fields(product):
+            fields.setdefault(field, len(fields))
+
+    vocabulary = {}
+    postings = []  # postings[term_id] = {doc_id: tf of each field}
+    doc_lengths = np.zeros((len(tokenized_products), len(fields)), dtype=np.int32)
+
+    for doc_id, product in enumerate(tokenized_products):
+        for field, tokens in product_fields(product).items():
+            doc_lengths[doc_id, fields[field]] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                if term not in vocabulary:
+                    vocabulary[term] = len(vocabulary)
+                    postings.append({})
+                postings[vocabulary[term]].setdefault(doc_id, np.zeros(len(fields), dtype=np.int32))[fields[field]] = tf
+
+    # Flatten postings into offsets + contiguous arrays (CSR layout, one row per term)
+    term_offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in postings], out=term_offsets[1:])
+    posting_docs = np.array([doc_id for p in postings for doc_id in p], dtype=np.int32)
+    posting_tfs = np.array([tfs for p in postings for tfs in p.values()], dtype=np.int32)
+    posting_tfs = posting_tfs.reshape(len(posting_docs), len(fields))
+
+    documents = [document_info(p) for p in tokenized_products]
+    return index_from_postings(list(vocabulary), documents, list(fields), term_offsets, posting_docs, posting_tfs,
+                               doc_lengths, k1, b, epsilon)
+
+
+def document_info(tokenized_product):
+    """Product fields kept with the index for each doc id."""
+    return {
+        "product_id": tokenized_product["product_id"],
+        "url": tokenized_product["url"],
+        "title": tokenized_product.get("title"),
+        "variant": tokenized_product.get("variant", "N/A")
+    }
+
+
+def index_from_postings(vocabulary, documents, fields, term_offsets, posting_docs, posting_tfs, doc_lengths,
+                        k1=BM25_K1, b=BM25_B, epsilon=BM25_EPSILON):
+    """Index of CSR postings (sorted by doc id in each term), with the global statistics computed from them."""
+    num_docs = len(documents)
+    doc_freqs = np.diff(term_offsets)
+    avgdl = float(doc_lengths.sum(axis=1).mean()) if num_docs else 0.0
+
+    # BM25 IDF, with the same epsilon floor as rank_bm25 for very common terms
+    bm25_idf = np.log(num_docs - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+    if len(bm25_idf):
+        bm25_idf[bm25_idf < 0] = epsilon * bm25_idf.mean()
+
+    # Smoothed TF-IDF IDF : the formula of sklearn's TfidfVectorizer, but not the same scores as the old vectorizer,
+    # which split its text again (lowercase, multi-word synonyms like "united states" split, 1-character tokens
+    # dropped) : here every index token is a term, like for BM25
+    tfidf_idf = np.log((1 + num_docs) / (1 + doc_freqs)) + 1
+
+    meta = {"num_docs": num_docs, "avgdl": avgdl, "k1": k1, "b": b, "epsilon": epsilon, "fields": list(fields)}
+    arrays = {
+        "term_offsets": term_offsets,
+        "posting_docs": posting_docs,
+        "posting_tfs": posting_tfs,
+        "doc_lengths": doc_lengths,
+        "bm25_idf": bm25_idf,
+        "tfidf_idf": tfidf_idf,
+    }
+    return InvertedIndex(None, list(vocabulary), documents, meta, arrays)
+
+
+def patch_inverted_index(index, product_ids, updated_products):
+    """
+    Index of the documents `product_ids` (in this order, doc id = position) made from an existing index : the
+    `updated_products` (tokenized, added or changed) are indexed, the postings of the other documents are kept as
+    they are (their tokens are not read again), and the removed documents are dropped. The global statistics (IDF,
+    average lengths, weights) depend on every document, they are recomputed from the postings.
+    """
+    update = build_inverted_index(updated_products)
+    updated_ids = {p["product_id"] for p in updated_products}
+    positions = {product_id: doc_id for doc_id, product_id in enumerate(product_ids)}
+    fields = list(index.fields) + [field for field in update.fields if field not in index.fields]
+    vocabulary = list(index.vocabulary) + [term for term in update.vocabulary if term not in index.term_ids]
+    term_ids = {term: term_id for term_id, term in enumerate(vocabulary)}
+
+    # New doc id of each old document (-1 : removed or indexed again) and of each updated document
+    old_doc_ids = np.array([-1 if d["product_id"] in updated_ids else positions.get(d["product_id"], -1)
+                            for d in index.documents], dtype=np.int64)
+    new_doc_ids = np.array([positions[p["product_id"]] for p in updated_products], dtype=np.int64)
+    field_columns = [fields.index(field) for field in update.fields]
+
+    # Postings kept from the index, then the postings of the updated documents
+    old_docs = old_doc_ids[np.asarray(index.posting_docs)]
+    kept = old_docs >= 0
+    old_terms = np.repeat(np.arange(len(index.vocabulary)), np.diff(index.term_offsets))
+    update_terms = np.array([term_ids[term] for term in update.vocabulary], dtype=np.int64)
+    terms = np.concatenate([old_terms[kept], update_terms[np.repeat(np.arange(len(update.vocabulary)),
+                                                                    np.diff(update.term_offsets))]])
+    docs = np.concatenate([old_docs[kept], new_doc_ids[np.asarray(update.posting_docs)]])
+    tfs = np.zeros((len(docs), len(fields)), dtype=np.int32)
+    tfs[:kept.sum(), :len(index.fields)] = np.asarray(index.posting_tfs)[kept]
+    tfs[kept.sum():, field_columns] = update.posting_tfs
+
+    doc_lengths = np.zeros((len(product_ids), len(fields)), dtype=np.int32)
+    kept_docs = old_doc_ids >= 0
+    doc_lengths[old_doc_ids[kept_docs], :len(index.fields)] = np.asarray(index.doc_lengths)[kept_docs]
+    doc_lengths[np.ix_(new_doc_ids, field_columns)] = update.doc_lengths
+    documents = [None] * len(product_ids)
+    for old_doc_id, doc_id in enumerate(old_doc_ids):
+        if doc_id >= 0:
+            documents[doc_id] = index.documents[old_doc_id]
+    for document, doc_id in zip(update.documents, new_doc_ids):
+        documents[doc_id] = document
+    if any(document is None for document in documents):
+        raise ValueError("Some products are neither in the index nor in the updated products")
+
+    # Terms no document uses any more are dropped, the postings are sorted by term then doc id (CSR layout)
+    used = np.bincount(terms, minlength=len(vocabulary)) > 0
+    new_term_ids = np.cumsum(used) - 1
+    terms = new_term_ids[terms]
+    order = np.lexsort((docs, terms))
+    term_offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=int(used.sum())), out=term_offsets[1:])
+    return index_from_postings([term for term, keep in zip(vocabulary, used) if keep], documents, fields,
+                               term_offsets, docs[order].astype(np.int32), tfs[order], doc_lengths,
+                               index.k1, index.b, index.meta.get("epsilon", BM25_EPSILON))
+
+
+def save_inverted_index(index, directory=INDEX_DIR):
+    """Save the index: one .npy file per array (memory-mappable) and small JSON side files."""
+    os.makedirs(directory, exist_ok=True)
+    bm25_weights, tfidf_weights = index.weight_matrices()
+    arrays = {name: getattr(index, name) for name in ARRAY_NAMES}
+    arrays.update(bm25_weights=bm25_weights.data, tfidf_weights=tfidf_weights.data)  # For the current boosts
+    for name, array in arrays.items():
+        # Through a temporary file, so a running search that memory-maps the old index is not affected
+        np.save(os.path.join(directory, f"{name}.tmp.npy"), array)
+        os.replace(os.path.join(directory, f"{name}.tmp.npy"), os.path.join(directory, f"{name}.npy"))
+
+    with open(os.path.join(directory, "vocabulary.json"), "w", encoding="utf-8") as f:
+        json.dump(index.vocabulary, f)
+    with open(os.path.join(directory, "documents.json"), "w", encoding="utf-8") as f:
+        json.dump(index.documents, f)
+    # meta.json is written last, so its presence means the index is complete
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(dict(index.meta, boosts=index.boosts), f, indent=4)
+    index.directory = directory
+
+    # Arrays of older index formats (e.g. tfidf_doc_norms.npy) and leftovers of an interrupted save
+    for name in os.listdir(directory):
+        if name.endswith(".npy") and name[:-len(".npy")] not in arrays:
+            os.remove(os.path.join(directory, name))
+
+
+def load_inverted_index(directory=INDEX_DIR):
+    """Load a saved index, the posting arrays are memory-mapped (not read into RAM)."""
+    with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    with open(os.path.join(directory, "vocabulary.json"), "r", encoding="utf-8") as f:
+        vocabulary = json.load(f)
+    with open(os.path.join(directory, "documents.json"), "r", encoding="utf-8") as f:
+        documents = json.load(f)
+
+    arrays = {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        for name in ARRAY_NAMES + ("bm25_weights", "tfidf_weights")
+        if name in ARRAY_NAMES or os.path.exists(os.path.join(directory, f"{name}.npy"))
+    }
+    return InvertedIndex(directory, vocabulary, documents, meta, arrays)
+
+
+def load_json_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_or_build_index(tokenized_file=TOKENIZED_FILE, directory=INDEX_DIR):
+    """Load the saved index, (re)building it first if it is missing or older than the tokenized products."""
+    meta_file = os.path.join(directory, "meta.json")
+    if not os.path.exists(meta_file) or os.path.getmtime(meta_file) < os.path.getmtime(tokenized_file) \
+            or "fields" not in load_json_file(meta_file):  # Index saved before the per-field postings
+        with open(tokenized_file, "r", encoding="utf-8") as f:
+            tokenized_products = json.load(f)
+        save_inverted_index(build_inverted_index(tokenized_products), directory)
+
+    return load_inverted_index(directory)
+
+
+if __name__ == "__main__":
+    with open(TOKENIZED_FILE, "r", encoding="utf-8") as f:
+        tokenized_products = json.load(f)
+
+    index = build_inverted_index(tokenized_products)
+    save_inverted_index(index, INDEX_DIR)
+
+    print(f"✅ Inverted index saved in {INDEX_DIR} ({index.num_docs} products, {len(index.vocabulary)} terms, "
+          f"{len(index.posting_docs)} postings, fields: {', '.join(index.fields)}).")
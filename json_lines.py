@@ -0,0 +1,113 @@
+import os
+import json
+from itertools import islice
+
+
+def iter_records(path):
+    """
+    Yield the records of a file one by one : a JSON Lines file (.jsonl) is streamed line by line,
+    a JSON list file (.json, the original format) has to be loaded at once.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def batched(iterable, size):
+    """Yield lists of `size` items (the last one can be shorter)."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class RecordWriter:
+    """
+    Write records one by one, as JSON Lines (.jsonl) or as a JSON list that json.load can still read (.json).
+    The file is written under a temporary name and only replaces the previous one when closed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.json_lines = path.endswith(".jsonl")
+        self.count = 0
+        self.file = open(path + ".tmp", "w", encoding="utf-8")
+        if not self.json_lines:
+            self.file.write("[")
+
+    def write(self, record):
+        if self.json_lines:
+            self.file.write(json.dumps(record) + "\n")
+        else:
+            self.file.write(("," if self.count else "") + "\n    " + json.dumps(record))
+        self.count += 1
+
+    def close(self):
+        if not self.json_lines:
+            self.file.write("\n]")
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
+        return self.count
+
+    def abort(self):
+        """Stop writing and remove the temporary file (the previous file is left as is)."""
+        self.file.close()
+        if os.path.exists(self.path + ".tmp"):
+            os.remove(self.path + ".tmp")
+
+
+def write_records(records, path):
+    """Write an iterable of records incrementally, return the number of records."""
+    writer = RecordWriter(path)
+    try:
+        for record in records:
+            writer.write(record)
+        return writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+class JsonLinesAppender:
+    """
+    Append records to a JSON Lines file, each one flushed as soon as it is written : if the process stops, the
+    records written so far are kept. With resume=True the records already in the file are kept (a last line cut
+    by a crash is removed), otherwise the file starts empty.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.count = 0
+        if resume and os.path.exists(path):
+            remove_partial_line(path)
+            self.file = open(path, "a", encoding="utf-8")
+        else:
+            self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+        return self.count
+
+
+def remove_partial_line(path, chunk_size=64 * 1024):
+    """Cut a file after its last newline (the end of the last complete record)."""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline >= 0:
+                f.truncate(start + newline + 1)
+                return
+            position = start
+        f.truncate(0)
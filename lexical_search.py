@@ -1,100 +1,81 @@
-import json
-import nltk
 import numpy as np
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords, wordnet
-from nltk.stem import WordNetLemmatizer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from rank_bm25 import BM25Okapi
-
-# Download required NLTK data
-nltk.download("punkt")
-nltk.download("stopwords")
-nltk.download("wordnet")
-
-# Initialize NLTK tools
-lemmatizer = WordNetLemmatizer()
-stop_words = set(stopwords.words("english"))
-
-# Load tokenized product data
-with open("tokenized_products.json", "r", encoding="utf-8") as f:
-    tokenized_products = json.load(f)
-
-def tokenize(text):
-    """Tokenize, remove stopwords, and lemmatize."""
-    text = text.lower()
-    words = word_tokenize(text)
-    words = [w for w in words if w.isalnum()]
-    words = [lemmatizer.lemmatize(w) for w in words if w not in stop_words]
-    return words
-
-def get_synonyms(word):
-    """Retrieve up to 3 synonyms for a given word."""
-    synonyms = set()
-    for synset in wordnet.synsets(word):
-        for lemma in synset.lemmas():
-            synonyms.add(lemma.name().replace("_", " "))
-
-    return sorted(list(synonyms))[:3]  # **Sort synonyms to make results stable**
-
-def expand_query(query_tokens):
-    """Expand the query using synonyms."""
-    expanded_tokens = query_tokens[:]
-    for token in query_tokens:
-        expanded_tokens.extend(get_synonyms(token))
-
-    return sorted(expanded_tokens)  # **Sorting ensures stable results**
-
-# **Initialize TF-IDF and BM25 ONCE to keep scores consistent**
-product_texts = [" ".join(product["tokens"]) for product in tokenized_products]
-
-tfidf_vectorizer = TfidfVectorizer(norm='l2', use_idf=True, smooth_idf=True)  # **Fix TF-IDF variability**
-tfidf_matrix = tfidf_vectorizer.fit_transform(product_texts)  # Compute once
-
-bm25_corpus = [product["tokens"] for product in tokenized_products]
-bm25_model = BM25Okapi(bm25_corpus)  # **Ensure BM25 is initialized once**
-
-def lexical_search(query):
-    """Search products using TF-IDF + BM25 and return scores for all products."""
-    query_tokens = tokenize(query)
-    expanded_query_tokens = expand_query(query_tokens)
-
-    # Pre-filter products: Keep only those that share at least one token with the query
-    filtered_products = [
-        product for product in tokenized_products
-        if any(token in product["tokens"] for token in expanded_query_tokens)
-    ]
-
-    if not filtered_products:
-        return []  # No relevant products found
-
-    # Continue with existing scoring process...
-    product_texts = [" ".join(product["tokens"]) for product in filtered_products]
-    tfidf_matrix = tfidf_vectorizer.fit_transform(product_texts)
-    query_vector = tfidf_vectorizer.transform([" ".join(expanded_query_tokens)])
-    cosine_similarities = (tfidf_matrix @ query_vector.T).toarray().flatten()
-
-    bm25_corpus = [product["tokens"] for product in filtered_products]
-    bm25_model = BM25Okapi(bm25_corpus)
-    bm25_scores = bm25_model.get_scores(expanded_query_tokens)
-
-    final_scores = 0.5 * cosine_similarities + 0.5 * np.array(bm25_scores)
+from synonyms import expand_query
+from ranking import min_max_normalize, top_k_indices
+from search_cache import token_cache, normalize_query
+from search_engine import get_engine
+from text_analyzer import analyze
+from search_metrics import stage, count
+
+# NLTK tools and the inverted index (built once from tokenized_products.json, then memory-mapped)
+# are loaded by the search engine on first use, not at import
+
+def preprocess_query(query):
+    """Tokenize and expand the query (cached by normalized query)."""
+    return token_cache.get_or_compute(normalize_query(query), lambda: expand_query(analyze(query)))
+
+def lexical_match_scores(query, expanded_query_tokens=None, candidates=None):
+    """
+    Return (doc ids, normalized TF-IDF + BM25 scores) of the products sharing at least one token with the query
+    (and among the `candidates` doc ids, if given : the scores are then normalized over the candidates only).
+    """
+    if expanded_query_tokens is None:
+        expanded_query_tokens = preprocess_query(query)
+
+    # Only products sharing at least one token with the query are in the postings of its terms
+    with stage("lexical_scoring"):
+        doc_ids, cosine_similarities, bm25_scores = get_engine().lexical_index.score(expanded_query_tokens)
+        if candidates is not None:
+            keep = np.isin(doc_ids, candidates)
+            doc_ids, cosine_similarities, bm25_scores = doc_ids[keep], cosine_similarities[keep], bm25_scores[keep]
+    count("lexical_matches", len(doc_ids))
+
+    if len(doc_ids) == 0:
+        return doc_ids, np.array([])  # No relevant products found
+
+    final_scores = 0.5 * cosine_similarities + 0.5 * bm25_scores
 
     # Normalize scores
-    min_score, max_score = np.min(final_scores), np.max(final_scores)
-    if max_score > min_score:
-        final_scores = (final_scores - min_score) / (max_score - min_score)
-    else:
-        final_scores = np.zeros_like(final_scores)
-
-    # Rank and return results
-    ranked_products = sorted(
-        zip(final_scores, filtered_products),
-        key=lambda x: x[0],
-        reverse=True
-    )
-
-    return [(score, {"product_id": product["product_id"], **product}) for score, product in ranked_products]
+    return doc_ids, min_max_normalize(final_scores)
+
+def lexical_scores(query, expanded_query_tokens=None, candidates=None):
+    """
+    Return the normalized lexical score of every product, as an array indexed by the index doc id (0 = no match),
+    or only of the `candidates` doc ids (array aligned with them) if given.
+    """
+    doc_ids, final_scores = lexical_match_scores(query, expanded_query_tokens, candidates)
+    scores = np.zeros(get_engine().lexical_index.num_docs)
+    scores[doc_ids] = final_scores
+    return scores if candidates is None else scores[candidates]
+
+def lexical_batch_scores(expanded_token_lists, candidates=None):
+    """Return the normalized lexical scores of many (already expanded) queries, one row per query (and per candidate)."""
+    with stage("lexical_scoring"):
+        tfidf_scores, bm25_scores = get_engine().lexical_index.score_batch(expanded_token_lists)
+        if candidates is not None:
+            tfidf_scores, bm25_scores = tfidf_scores[:, candidates], bm25_scores[:, candidates]
+    count("lexical_matches", tfidf_scores.nnz)
+    if tfidf_scores.shape[1] == 0:  # No candidate (e.g. the filters match no product)
+        return np.zeros(tfidf_scores.shape)
+    final_scores = (0.5 * tfidf_scores + 0.5 * bm25_scores).toarray()  # Summed while sparse, densified once
+
+    # Normalize each row over its matching products (TF-IDF is > 0 exactly where a token is shared)
+    matches = np.zeros(final_scores.shape, dtype=bool)
+    matches[tfidf_scores.nonzero()] = True
+    min_scores = np.where(matches, final_scores, np.inf).min(axis=1, keepdims=True)
+    max_scores = np.where(matches, final_scores, -np.inf).max(axis=1, keepdims=True)
+    min_scores[~matches.any(axis=1)] = 0.0  # Queries without any match
+    spread = np.where(max_scores > min_scores, max_scores - min_scores, np.inf)
+    return np.where(matches, (final_scores - min_scores) / spread, 0.0)
+
+def lexical_search(query, top_k=None):
+    """Search products using TF-IDF + BM25 and return the ranked matching products (all, or the top_k best)."""
+    doc_ids, final_scores = lexical_match_scores(query)
+
+    # Rank and return results (ties keep the catalogue order)
+    ranking = top_k_indices(final_scores, top_k)
+
+    documents = get_engine().lexical_index.documents
+    return [(final_scores[i], documents[doc_ids[i]]) for i in ranking]
 
 
 if __name__ == "__main__":
@@ -1,18 +1,47 @@
+import os
 import json
-from hybrid_search import hybrid_search  # Import the hybrid search function
+import argparse
+from hybrid_search import hybrid_search_batch  # Import the batched hybrid search function
+from search_engine import get_engine
+from json_lines import JsonLinesAppender, iter_records
 
 # File paths
 QUERY_FILE = "queries.json"  # Input queries
-OUTPUT_FILE = "search_results.json"  # Output results
+OUTPUT_FILE = "search_results.jsonl"  # Output results, one line per query, written as soon as they are ready
+JSON_OUTPUT_FILE = "search_results.json"  # Same results as one JSON object {query: results}
 
-def perform_batch_search(queries, weights, save_top_n=None):
+def format_results(search_results):
+    """Turn the hybrid search results of one query into JSON-ready dictionaries."""
+    return [
+        {
+            "rank": rank + 1,
+            "title": product["title"],
+            "variant": product["variant"],
+            "brand": product.get("brand", "Unknown"),
+            "country_of_origin": product.get("country_of_origin", "Unknown"),
+            "url": product["url"],
+            "total_score": round(float(score), 4),
+            "lexical_score": round(float(lexical), 4),
+            "semantic_score": round(float(semantic), 4),
+            "review_score": round(float(review), 4),
+            "price_score": round(float(price), 4),
+            "real_price": f"${real_price:.2f}"
+        }
+        for rank, (score, lexical, semantic, review, price, real_price, product) in enumerate(search_results)
+    ]
+
+def perform_batch_search(queries, weights, save_top_n=None, batch_size=64, output_file=None, resume=False):
     """
     Performs hybrid search on multiple queries and outputs results in JSON format.
 
     :param queries: List of query strings
     :param weights: Dictionary with weights for lexical, semantic, reviews, and price
     :param save_top_n: Number of top results to save per query (None = save all)
-    :return: Dictionary with search results
+    :param batch_size: Number of queries tokenized, encoded and scored together
+    :param output_file: JSON Lines file where the results of each query ({"query": ..., "results": [...]}) are written
+                        and flushed as soon as its batch is done, instead of being kept in memory
+    :param resume: Keep the queries already in output_file (e.g. after a crash) and only search the others
+    :return: Dictionary with search results (without output_file), else the number of queries written
     """
     # Unpack weights
     lambda_lexical = weights["lexical"]
@@ -21,62 +50,85 @@ def perform_batch_search(queries, weights, save_top_n=None):
     lambda_price = weights["price"]
 
     results = {}
+    writer = None
+    if output_file is not None:
+        writer = JsonLinesAppender(output_file, resume=resume)
+        done = {record["query"] for record in iter_records(output_file)} if resume else set()
+        queries = [query for query in dict.fromkeys(queries) if query not in done]  # Each query written once
+
+    # Run hybrid search batch by batch with new weights,
+    # only the top `save_top_n` results are ranked (None = all 46 products)
+    print(f"\n🔍 Searching for {len(queries)} queries ...")
+    try:
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            batch_results = hybrid_search_batch(batch,
+                                                top_n=save_top_n,
+                                                lambda_lexical=lambda_lexical,
+                                                lambda_semantic=lambda_semantic,
+                                                lambda_reviews=lambda_reviews,
+                                                lambda_price=lambda_price,
+                                                batch_size=batch_size)
+
+            for query, search_results in zip(batch, batch_results):
+                # Store results (written right away to the output file, if any)
+                if writer is not None:
+                    writer.write({"query": query, "results": format_results(search_results)})
+                else:
+                    results[query] = format_results(search_results)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return results if writer is None else writer.count
+
+
+def write_results_json(results_file=OUTPUT_FILE, json_file=JSON_OUTPUT_FILE):
+    """
+    Turn the JSON Lines results into one JSON object {query: results}, indented like json.dump(..., indent=4),
+    one query at a time (the whole results are never in memory).
+    """
+    count = 0
+    with open(json_file + ".tmp", "w", encoding="utf-8") as f:
+        f.write("{")
+        for record in iter_records(results_file):
+            indented_results = json.dumps(record["results"], indent=4).replace("\n", "\n    ")
+            f.write(("," if count else "") + f"\n    {json.dumps(record['query'])}: {indented_results}")
+            count += 1
+        f.write("\n}" if count else "}")
+    os.replace(json_file + ".tmp", json_file)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hybrid search of the queries of queries.json.")
+    parser.add_argument("--resume", action="store_true", help=f"Keep the queries already in {OUTPUT_FILE}")
+    args = parser.parse_args()
+
+    # Load the indexes and the model now, and show how long each stage takes
+    startup = get_engine().warmup()
+    print(f"⏱️ Startup: {startup['total_ms']:.0f} ms ({', '.join(f'{stage} {ms:.0f} ms' for stage, ms in startup['stages'].items())})")
+
+    # Load queries from JSON file
+    with open(QUERY_FILE, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    # Set custom weights (modify here directly)
+    weights = {
+        "lexical": 0.4,   # Adjust BM25 + TF-IDF weight
+        "semantic": 0.4,  # Adjust sentence embedding weight
+        "reviews": 0.1,   # Adjust review influence
+        "price": 0.1      # Adjust price influence
+    }
+
+    # Set how many results to save per query (None = save all 46)
+    save_top_n = 10  # Change this value to limit saved results
+
+    # Run batch search, the results of each batch are saved as soon as they are ready
+    written = perform_batch_search(queries, weights, save_top_n=save_top_n, output_file=OUTPUT_FILE, resume=args.resume)
+
+    # Save results to JSON
+    count = write_results_json(OUTPUT_FILE, JSON_OUTPUT_FILE)
 
-    for query in queries:
-        print(f"\n🔍 Searching for: **{query}** ...")
-
-        # Run hybrid search with new weights
-        search_results = hybrid_search(query,
-                                       lambda_lexical=lambda_lexical,
-                                       lambda_semantic=lambda_semantic,
-                                       lambda_reviews=lambda_reviews,
-                                       lambda_price=lambda_price)
-
-        # Keep all 46 products but limit saving based on `save_top_n`
-        if save_top_n is not None:
-            search_results = search_results[:save_top_n]  # Keep only top `save_top_n` results
-
-        # Store results
-        results[query] = [
-            {
-                "rank": rank + 1,
-                "title": product["title"],
-                "variant": product["variant"],
-                "brand": product.get("brand", "Unknown"),  
-                "country_of_origin": product.get("country_of_origin", "Unknown"), 
-                "url": product["url"],
-                "total_score": round(score, 4),
-                "lexical_score": round(lexical, 4),
-                "semantic_score": round(semantic, 4),
-                "review_score": round(review, 4),
-                "price_score": round(price, 4),
-                "real_price": f"${real_price:.2f}"
-            }
-            for rank, (score, lexical, semantic, review, price, real_price, product) in enumerate(search_results)
-        ]
-
-    return results
-
-# Load queries from JSON file
-with open(QUERY_FILE, "r", encoding="utf-8") as f:
-    queries = json.load(f)
-
-# Set custom weights (modify here directly)
-weights = {
-    "lexical": 0.4,   # Adjust BM25 + TF-IDF weight
-    "semantic": 0.4,  # Adjust sentence embedding weight
-    "reviews": 0.1,   # Adjust review influence
-    "price": 0.1      # Adjust price influence
-}
-
-# Set how many results to save per query (None = save all 46)
-save_top_n = 10  # Change this value to limit saved results
-
-# Run batch search
-search_results = perform_batch_search(queries, weights, save_top_n=save_top_n)
-
-# Save results to JSON
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(search_results, f, indent=4)
-
-print(f"\n✅ Search results saved to `{OUTPUT_FILE}` with top {save_top_n} results per query.")
+    print(f"\n✅ Search results of {count} queries ({written} searched now) saved to `{OUTPUT_FILE}` and "
+          f"`{JSON_OUTPUT_FILE}` with top {save_top_n} results per query.")
@@ -1,31 +1,65 @@
-import json
-from sentence_transformers import SentenceTransformer
+from vector_store import VectorStoreWriter
+from json_lines import iter_records, batched
+from inverted_index import weighted_tokens
+from encoder_backends import load_encoder, ENCODER_BACKEND
 
 # File paths
 TOKENIZED_FILE = "tokenized_products.json"
-OUTPUT_FILE = "embeddings_of_products.json"
-
-# Load data
-with open(TOKENIZED_FILE, "r", encoding="utf-8") as f:
-    tokenized_products = json.load(f)
-
-# Load embedding model
-model = SentenceTransformer("multi-qa-MiniLM-L6-cos-v1")
-
-# Generate embeddings with structured format
-embeddings_index = [
-    {
-        "product_id": p["product_id"],  # ✅ Keep the unique identifier
-        "url": p["url"],
-        "title": p.get("title"),
-        "variant": p.get("variant"),
-        "embeddings": model.encode(" ".join(p["tokens"])).tolist()
-    }
-    for p in tokenized_products
-]
-
-# Save results
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(embeddings_index, f, indent=4)
-
-print(f"✅ Embeddings saved in {OUTPUT_FILE}.")
+OUTPUT_DIR = "vector_store/"
+MODEL_NAME = "multi-qa-MiniLM-L6-cos-v1"
+
+# Storage type of the vectors : "float32", or "float16" / "int8" to quantize them
+STORE_DTYPE = "float32"
+
+# Encoding : number of texts per forward pass of the model, and CPU threads of the encoder (None = library default)
+ENCODE_BATCH_SIZE = 64
+ENCODE_THREADS = None
+CHUNK_SIZE = 1000  # Products read, encoded and written at a time
+
+
+def load_model(model_name=MODEL_NAME, threads=ENCODE_THREADS, backend=ENCODER_BACKEND):
+    """Load the embedding model (heavy import, only done when something has to be encoded)."""
+    return load_encoder(model_name, backend, threads)
+
+
+def product_text(tokenized_product):
+    """Text given to the model for a product."""
+    # The text keeps the field weighting (title x10, ...), so that it is also taken into account by semantic search
+    return " ".join(weighted_tokens(tokenized_product))
+
+
+def embed_products(model, tokenized_products, batch_size=ENCODE_BATCH_SIZE):
+    """Generate the embeddings of the products (one row per product), from their tokens, encoded by batches."""
+    return model.encode([product_text(p) for p in tokenized_products], batch_size=batch_size)
+
+
+def product_info(tokenized_products):
+    """Side table of the vector store : product info of each row."""
+    return [
+        {
+            "product_id": p["product_id"],  # ✅ Keep the unique identifier
+            "url": p["url"],
+            "title": p.get("title"),
+            "variant": p.get("variant")
+        }
+        for p in tokenized_products
+    ]
+
+
+def embed_stream(model, tokenized_products, writer, batch_size=ENCODE_BATCH_SIZE, chunk_size=CHUNK_SIZE):
+    """Encode a stream of tokenized products chunk by chunk, appending the vectors to a VectorStoreWriter."""
+    try:
+        for chunk in batched(tokenized_products, chunk_size):
+            writer.add(embed_products(model, chunk, batch_size), product_info(chunk))
+    except BaseException:
+        writer.abort()  # No temporary files left behind, the previous store stays usable
+        raise
+    return writer.close()
+
+
+if __name__ == "__main__":
+    # Stream the tokenized products, encode them by batches and save the results in the binary vector store
+    writer = VectorStoreWriter(OUTPUT_DIR, dtype=STORE_DTYPE, model_name=MODEL_NAME, backend=ENCODER_BACKEND)
+    store = embed_stream(load_model(), iter_records(TOKENIZED_FILE), writer)
+
+    print(f"✅ Embeddings saved in {OUTPUT_DIR} ({len(store)} vectors, {store.dtype}).")
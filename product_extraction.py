@@ -1,56 +1,256 @@
 import os
+import re
 import json
-import requests
 import hashlib
-from bs4 import BeautifulSoup
-from time import sleep
-from random import randint
+import argparse
+from html import unescape
+from html.entities import html5
+from html.parser import HTMLParser
+import numpy as np
+from crawler import Crawler, canonicalize_url
 
 # Define file paths
 DATA_DIR = "initial_index_files/"
 DESCRIPTION_FILE = os.path.join(DATA_DIR, "description_index.json")
 REVIEWS_FILE = os.path.join(DATA_DIR, "reviews_index.json")
 ORIGIN_FILE = os.path.join(DATA_DIR, "origin_index.json")
+OUTPUT_FILE = "extracted_products.json"
+FINGERPRINTS_FILE = "crawl_fingerprints.json"  # canonical url -> page hash, parsed fields, SimHash, duplicate of
+
+# Page parsers : "stream" reads the page once with the standard library parser and only keeps the text of the
+# elements we need (no tree), "lxml" uses the lxml library if installed (faster), "bs4" is the former BeautifulSoup
+# parser, kept as the reference
+PARSER_BACKENDS = ("stream", "lxml", "bs4")
+PARSER_BACKEND = "stream"
+TITLE_PREFIX = "web-scraping.dev product "
+
+# Near-duplicate detection on the parsed fields (products with a different title but almost the same content)
+SIMHASH_BITS = 64
+NEAR_DUPLICATE_BITS = 3  # Maximum number of differing SimHash bits
+SIMHASH_TOKEN = re.compile(r"\w+")
+
+
+def load_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
 
-# Load JSON files
-with open(DESCRIPTION_FILE, "r") as f:
-    description_data = json.load(f)
+def extract_urls(description_data):
+    """Extract the unique product URLs (sorted, so the extraction order is stable)."""
+    urls = set()
+    for category in description_data.values():
+        urls.update(category.keys())
 
-with open(REVIEWS_FILE, "r") as f:
-    reviews_data = json.load(f)
+    return sorted(url for url in urls if url.startswith("http"))
 
-with open(ORIGIN_FILE, "r") as f:
-    origin_data = json.load(f)
 
-# Extract unique product URLs
-urls = set()
-for category in description_data.values():
-    urls.update(category.keys())
+def group_urls(urls):
+    """Group the URLs by canonical form (first seen order) : canonical url -> [urls]."""
+    groups = {}
+    for url in urls:
+        groups.setdefault(canonicalize_url(url), []).append(url)
+    return groups
 
-urls = {url for url in urls if url.startswith("http")}
-print(f"✅ Found {len(urls)} valid product URLs.")
 
-# Function to fetch and parse product details
-def fetch_html(url):
+def build_country_map(origin_data):
+    """Reverse the origin index once : url -> country of origin."""
+    return {url: country for country, urls in origin_data.items() for url in urls}
+
+
+def parse_price(text):
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        return response.text if response.status_code == 200 else None
-    except requests.RequestException:
-        return None
+        return float(text.strip().replace("$", "").replace(",", ""))
+    except ValueError:
+        return "Unknown"
+
+
+# Elements whose content is not text for BeautifulSoup, elements keeping their whitespace, elements without end tag
+NON_TEXT_ELEMENTS = {"script", "style", "template"}
+PREFORMATTED_ELEMENTS = {"pre", "textarea"}
+ASCII_SPACES = str.maketrans("", "", " \n\t\f\r")
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta",
+                 "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex",
+                 "nextid", "spacer"}
+
+
+class ProductPageParser(HTMLParser):
+    """
+    Single pass over a product page : the text of the elements we need is collected while the page is read, without
+    building a tree. Elements are matched like the BeautifulSoup parser does (first match in document order), so
+    both give the same fields.
+    """
+
+    # field -> (tag, class) of its element
+    TARGETS = {"title": ("title", None), "description": ("p", "product-description"),
+               "price": ("span", "product-price")}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = []  # Open elements : (tag, element number)
+        self.elements = 0
+        self.non_text = 0  # Open script / style / template elements
+        self.preformatted = 0  # Open pre / textarea elements
+        self.data = []  # Text read since the last tag
+        self.texts = {}  # field -> text parts (a field is in it once its element was found)
+        self.open_fields = {}  # field -> element number, while its element is open
+        self.variant = "Unknown"
+        self.variant_found = False
+        self.label_position = None  # (parent element number, depth) of the open "feature-label" cell
+        self.brand_search = None  # Position of the "Brand" label, once it is closed
+        self.brand_done = False
+
+    def start_field(self, field, number):
+        self.texts[field] = []
+        self.open_fields[field] = number
+
+    def end_data(self):
+        # Like BeautifulSoup, a text made only of whitespace becomes a single newline or space
+        text = "".join(self.data)
+        self.data = []
+        if text and not self.preformatted and not text.translate(ASCII_SPACES):
+            text = "\n" if "\n" in text else " "
+        if text and not self.non_text:
+            for field in self.open_fields:
+                self.texts[field].append(text)
+
+    def handle_starttag(self, tag, attrs):
+        self.end_data()
+        attributes = dict(attrs)
+        classes = (attributes.get("class") or "").split()
+        parent = self.stack[-1][1] if self.stack else 0
+        depth = len(self.stack)
+        self.elements += 1
+        number = self.elements
+
+        for field, (target_tag, target_class) in self.TARGETS.items():
+            if tag == target_tag and field not in self.texts and (target_class is None or target_class in classes):
+                self.start_field(field, number)
+        if tag == "button" and not self.variant_found and "add-to-cart" in classes:
+            self.variant_found = True
+            if attributes.get("data-variant-id") is not None:
+                self.variant = attributes["data-variant-id"]
+        if tag == "td" and not self.brand_done:
+            if self.brand_search is None and "feature-label" in classes and "label" not in self.open_fields:
+                self.start_field("label", number)
+                self.label_position = (parent, depth)
+            elif self.brand_search == (parent, depth) and "feature-value" in classes:
+                self.start_field("brand", number)
+                self.brand_done = True
+
+        if tag in VOID_ELEMENTS:
+            self.end_element(number)
+        else:
+            self.stack.append((tag, number))
+            self.non_text += tag in NON_TEXT_ELEMENTS
+            self.preformatted += tag in PREFORMATTED_ELEMENTS
+
+    def handle_endtag(self, tag):
+        self.end_data()
+        # Like BeautifulSoup : the end tag closes the last open element of that name, and the ones opened after it
+        for position in range(len(self.stack) - 1, -1, -1):
+            if self.stack[position][0] == tag:
+                for open_tag, number in reversed(self.stack[position:]):
+                    self.non_text -= open_tag in NON_TEXT_ELEMENTS
+                    self.preformatted -= open_tag in PREFORMATTED_ELEMENTS
+                    self.end_element(number)
+                del self.stack[position:]
+                return
+
+    def end_element(self, number):
+        for field, field_number in list(self.open_fields.items()):
+            if field_number == number:
+                del self.open_fields[field]
+                if field == "label":
+                    # The brand is in the next "feature-value" cell of the same row as the "Brand" label
+                    if "".join(self.texts.pop("label")).strip().lower() == "brand":
+                        self.brand_search = self.label_position
+        if self.brand_search is not None and not self.brand_done and number == self.brand_search[0]:
+            self.brand_done = True  # End of the row without a value
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_comment(self, data):
+        self.end_data()
+
+    handle_decl = handle_pi = handle_comment
+
+    def unknown_decl(self, data):
+        self.end_data()
+        if data.upper().startswith("CDATA["):  # Text for BeautifulSoup
+            self.data.append(data[len("CDATA["):])
+            self.end_data()
+
+    def handle_entityref(self, name):
+        self.handle_data(html5.get(name + ";", "&" + name))
+
+    def handle_charref(self, name):
+        self.handle_data(unescape(f"&#{name};"))
+
+    def fields(self):
+        def text(field):
+            return "".join(self.texts[field]) if field in self.texts else None
+
+        title, description, price, brand = text("title"), text("description"), text("price"), text("brand")
+        return (
+            title.replace(TITLE_PREFIX, "").strip() if title is not None else "Unknown",
+            self.variant,
+            description.strip() if description is not None else "No description",
+            parse_price(price) if price is not None else "Unknown",
+            brand.strip() if brand is not None else "Unknown",
+        )
+
+
+def parse_html_stream(html):
+    parser = ProductPageParser()
+    parser.feed(html)
+    parser.close()
+    parser.end_data()
+    return parser.fields()
+
+
+def parse_html_lxml(html):
+    """Same fields with lxml (XPath on the parsed page)."""
+    import lxml.html
+    document = lxml.html.document_fromstring(html)
+
+    def first(path):
+        elements = document.xpath(path)
+        return elements[0] if elements else None
+
+    def with_class(name):
+        return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+    title_tag = first("//title")
+    title = title_tag.text_content().replace(TITLE_PREFIX, "").strip() if title_tag is not None else "Unknown"
+    variant_tag = first(f"//button[{with_class('add-to-cart')}]")
+    variant = variant_tag.get("data-variant-id", "Unknown") if variant_tag is not None else "Unknown"
+    description_tag = first(f"//p[{with_class('product-description')}]")
+    description = description_tag.text_content().strip() if description_tag is not None else "No description"
+    price_tag = first(f"//span[{with_class('product-price')}]")
+    price = parse_price(price_tag.text_content()) if price_tag is not None else "Unknown"
+
+    brand = "Unknown"
+    for label in document.xpath(f"//td[{with_class('feature-label')}]"):
+        if label.text_content().strip().lower() == "brand":
+            brand_value = label.xpath(f"following-sibling::td[{with_class('feature-value')}][1]")
+            brand = brand_value[0].text_content().strip() if brand_value else "Unknown"
+            break
+    return title, variant, description, price, brand
 
-def parse_html(html):
+
+def parse_html_bs4(html):
+    """Reference parser (BeautifulSoup), each element looked up once."""
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(html, "html.parser")
-    title = soup.find("title").text.replace("web-scraping.dev product ", "").strip() if soup.find("title") else "Unknown"
+    title_tag = soup.find("title")
+    title = title_tag.text.replace(TITLE_PREFIX, "").strip() if title_tag else "Unknown"
     variant_tag = soup.find("button", class_="add-to-cart")
     variant = variant_tag["data-variant-id"] if variant_tag and "data-variant-id" in variant_tag.attrs else "Unknown"
-    description = soup.find("p", class_="product-description").text.strip() if soup.find("p", class_="product-description") else "No description"
-
+    description_tag = soup.find("p", class_="product-description")
+    description = description_tag.text.strip() if description_tag else "No description"
     price_tag = soup.find("span", class_="product-price")
-    try:
-        price = float(price_tag.text.strip().replace("$", "").replace(",", "")) if price_tag else "Unknown"
-    except ValueError:
-        price = "Unknown"
+    price = parse_price(price_tag.text) if price_tag else "Unknown"
 
     brand = "Unknown"
     for label in soup.find_all("td", class_="feature-label"):
@@ -58,22 +258,92 @@ def parse_html(html):
             brand_value = label.find_next_sibling("td", class_="feature-value")
             brand = brand_value.text.strip() if brand_value else "Unknown"
             break
-
     return title, variant, description, price, brand
 
-# Step 1: Scrape and process products (without assigning IDs)
-product_list = []
-for url in urls:
-    print(f"🔍 Scraping: {url}")
-    html_content = fetch_html(url)
-    if not html_content:
-        continue
 
-    title, variant, description, price, brand = parse_html(html_content)
-    review_info = reviews_data.get(url, {"total_reviews": 0, "mean_mark": 0, "last_rating": 0})
-    country_of_origin = next((country for country, urls in origin_data.items() if url in urls), "Unknown")
+PARSERS = {"stream": parse_html_stream, "lxml": parse_html_lxml, "bs4": parse_html_bs4}
+
+
+# Function to parse product details
+def parse_html(html, backend=PARSER_BACKEND):
+    """:return: (title, variant, description, price, brand) of a product page"""
+    if backend not in PARSERS:
+        raise ValueError(f"Unknown parser backend: {backend} (expected one of {PARSER_BACKENDS})")
+    return PARSERS[backend](html)
+
+
+def page_hash(html):
+    """Exact fingerprint of a page : an unchanged page is not parsed again."""
+    return hashlib.md5(html.encode()).hexdigest()
+
+
+def simhash(text, bits=SIMHASH_BITS):
+    """SimHash of the words of a text : similar texts get fingerprints that differ by a few bits."""
+    words, counts = np.unique(SIMHASH_TOKEN.findall(text.lower()), return_counts=True)
+    if not len(words):
+        return 0
+    hashes = np.array([int.from_bytes(hashlib.md5(word.encode()).digest()[:8], "little") for word in words],
+                      dtype=np.uint64)
+    word_bits = (hashes[:, None] >> np.arange(bits, dtype=np.uint64)) & np.uint64(1)
+    weights = (np.where(word_bits == 1, 1, -1) * counts[:, None]).sum(axis=0)
+    return sum(1 << int(bit) for bit in np.flatnonzero(weights > 0))
+
+
+def fields_simhash(fields):
+    """SimHash of the content of a product (title, description and brand : the variants of a product share it)."""
+    title, variant, description, price, brand = fields
+    return simhash(f"{title} {description} {brand}")
+
+
+def near_duplicates(fingerprints, max_bits=NEAR_DUPLICATE_BITS, bits=SIMHASH_BITS):
+    """
+    Pairs of products with a different title whose SimHash differ by at most `max_bits` bits. The fingerprints are
+    cut into max_bits + 1 bands : two near-duplicates have at least one identical band, so only the products
+    sharing a band are compared.
+
+    :param fingerprints: {url: {"simhash": int, "fields": [title, ...]}}
+    :return: [(url, url, differing bits)]
+    """
+    band_bits = bits // (max_bits + 1)
+    buckets = {}
+    for url, fingerprint in fingerprints.items():
+        for band in range(max_bits + 1):
+            band_value = fingerprint["simhash"] >> (band * band_bits) & ((1 << band_bits) - 1)
+            buckets.setdefault((band, band_value), []).append(url)
+
+    pairs = {}
+    for urls in buckets.values():
+        for i, first in enumerate(urls):
+            for second in urls[i + 1:]:
+                distance = bin(fingerprints[first]["simhash"] ^ fingerprints[second]["simhash"]).count("1")
+                titles = fingerprints[first]["fields"][0].lower(), fingerprints[second]["fields"][0].lower()
+                if distance <= max_bits and titles[0] != titles[1]:
+                    pairs[(first, second)] = distance
+    return [(first, second, distance) for (first, second), distance in pairs.items()]
+
+
+def load_fingerprints(path=FINGERPRINTS_FILE):
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_fingerprints(fingerprints, path=FINGERPRINTS_FILE):
+    if path is None:
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fingerprints, f, indent=4)
 
-    product_entry = {
+
+def build_product(url, fields, reviews_data, url_country, aliases=()):
+    """Join the parsed fields of a page with its reviews and its country of origin (looked up under any of its URLs)."""
+    title, variant, description, price, brand = fields
+    urls = [url, *aliases]
+    review_info = next((reviews_data[u] for u in urls if u in reviews_data),
+                       {"total_reviews": 0, "mean_mark": 0, "last_rating": 0})
+
+    return {
         "url": url,
         "title": title,
         "variant": variant,
@@ -83,33 +353,128 @@ for url in urls:
         "total_reviews": review_info["total_reviews"],
         "mean_mark": review_info["mean_mark"],
         "last_rating": review_info["last_rating"],
-        "country_of_origin": country_of_origin,
+        "country_of_origin": next((url_country[u] for u in urls if u in url_country), "Unknown"),
     }
-    product_list.append(product_entry)
-    sleep(randint(1, 3))
 
-# Step 2: Remove duplicates
-unique_products = []
-seen_products = set()
 
-for product in product_list:
-    key = (product["title"].lower(), product["variant"].lower(), product["price ($)"], product["brand"].lower())
-    if key not in seen_products:
-        seen_products.add(key)
-        unique_products.append(product)
+def product_key(product):
+    return product["title"].lower(), product["variant"].lower(), product["price ($)"], product["brand"].lower()
+
+
+def remove_duplicates(product_list):
+    """Keep the first product of each (title, variant, price, brand)."""
+    unique_products = []
+    seen_products = set()
+
+    for product in product_list:
+        key = product_key(product)
+        if key not in seen_products:
+            seen_products.add(key)
+            unique_products.append(product)
+    return unique_products
+
 
-# Step 3: Assign unique IDs after removing duplicates
 def generate_product_id(product):
     """Create a unique product ID using a hash of key attributes."""
     key = f"{product['title'].lower()}|{product['variant'].lower()}|{product['price ($)']}|{product['brand'].lower()}"
     return hashlib.md5(key.encode()).hexdigest()
 
-for product in unique_products:
-    product["product_id"] = generate_product_id(product)  # ✅ Assign unique ID
 
-# Step 4: Save results
-OUTPUT_FILE = "extracted_products.json"
-with open(OUTPUT_FILE, "w") as f:
-    json.dump(unique_products, f, indent=4)
+def extract_products(urls, crawler, reviews_data, url_country, fingerprints_file=FINGERPRINTS_FILE,
+                     backend=PARSER_BACKEND, recheck=False):
+    """
+    Fetch (concurrently) and parse the pages, remove duplicates and assign IDs.
+
+    The URLs are canonicalized before fetching (each page is fetched once), and the fingerprints of the last crawl
+    avoid work : a page with the same hash is not parsed again, and a URL that was a duplicate of another product is
+    not fetched again while that product's page is unchanged.
+
+    :param recheck: Fetch every URL, even the known duplicates
+    :return: (unique products, summary of the crawl)
+    """
+    groups = group_urls(urls)
+    known = load_fingerprints(fingerprints_file)
+    summary = {"urls": len(urls), "canonical_urls": len(groups), "skipped_duplicates": 0, "parsed": 0, "reused": 0}
+
+    # Step 1: Fetch the pages, except the known duplicates of unchanged pages (fetched in a second round otherwise)
+    def known_duplicate(url):
+        return not recheck and known.get(url, {}).get("duplicate_of") in known
+    pages = crawler.fetch_all(url for url in groups if not known_duplicate(url))
+    digests = {url: page_hash(html) for url, html in pages.items()}
+    unchanged = {url for url, digest in digests.items() if url in known and known[url]["page_hash"] == digest}
+    second_round = [url for url in groups if known_duplicate(url) and known[url]["duplicate_of"] not in unchanged]
+    pages.update(crawler.fetch_all(second_round))
+    digests.update((url, page_hash(pages[url])) for url in second_round if url in pages)
+    summary["skipped_duplicates"] = sum(known_duplicate(url) for url in groups) - len(second_round)
+
+    # Step 2: Parse the pages (the same page under different URLs, or unchanged since the last crawl, is parsed once)
+    fingerprints, parsed = {}, {}
+    for url in groups:
+        if url not in pages:
+            if known_duplicate(url) and url not in second_round:
+                fingerprints[url] = known[url]  # Still a duplicate of an unchanged page
+            continue
+        digest = digests[url]
+        if digest not in parsed:
+            if url in known and known[url]["page_hash"] == digest:
+                parsed[digest] = tuple(known[url]["fields"])
+            else:
+                parsed[digest] = parse_html(pages[url], backend)
+                summary["parsed"] += 1
+        fingerprints[url] = {"page_hash": digest, "fields": list(parsed[digest]),
+                             "simhash": fields_simhash(parsed[digest]), "duplicate_of": None}
+    summary["reused"] = len(pages) - summary["parsed"]
+
+    product_list = [
+        build_product(url, fingerprints[url]["fields"], reviews_data, url_country, aliases=groups[url])
+        for url in groups if url in pages
+    ]
+
+    # Step 3: Remove duplicates (and remember them for the next crawl)
+    unique_products = remove_duplicates(product_list)
+    first_url = {}
+    for product in product_list:
+        first_url.setdefault(product_key(product), product["url"])
+        if first_url[product_key(product)] != product["url"]:
+            fingerprints[product["url"]]["duplicate_of"] = first_url[product_key(product)]
+    save_fingerprints(fingerprints, fingerprints_file)
+    summary["near_duplicates"] = near_duplicates({
+        url: fingerprint for url, fingerprint in fingerprints.items() if fingerprint["duplicate_of"] is None
+    })
+
+    # Step 4: Assign unique IDs after removing duplicates
+    for product in unique_products:
+        product["product_id"] = generate_product_id(product)  # ✅ Assign unique ID
+    return unique_products, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl the product pages into extracted_products.json.")
+    parser.add_argument("--parser", default=PARSER_BACKEND, choices=PARSER_BACKENDS, help="HTML parser backend")
+    parser.add_argument("--recheck", action="store_true", help="Fetch the known duplicates again")
+    args = parser.parse_args()
+
+    # Load JSON files
+    description_data = load_json(DESCRIPTION_FILE)
+    reviews_data = load_json(REVIEWS_FILE)
+    url_country = build_country_map(load_json(ORIGIN_FILE))
+
+    urls = extract_urls(description_data)
+    print(f"✅ Found {len(urls)} valid product URLs.")
+
+    crawler = Crawler()
+    print(f"🔍 Scraping {len(urls)} URLs with {crawler.max_workers} workers ...")
+    unique_products, summary = extract_products(urls, crawler, reviews_data, url_country, backend=args.parser,
+                                                recheck=args.recheck)
+    crawler.close()
+    print(f"   {crawler.stats}")
+    print(f"   {summary['canonical_urls']} canonical URLs, {summary['skipped_duplicates']} known duplicates not fetched, "
+          f"{summary['parsed']} pages parsed, {summary['reused']} reused")
+    for first, second, distance in summary["near_duplicates"]:
+        print(f"⚠️ Near-duplicate products ({distance} bits) : {first} / {second}")
+
+    # Step 5: Save results
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(unique_products, f, indent=4)
 
-print(f"✅ Extraction complete! {len(unique_products)} unique products saved in {OUTPUT_FILE}.")
+    print(f"✅ Extraction complete! {len(unique_products)} unique products saved in {OUTPUT_FILE}.")
@@ -0,0 +1,176 @@
+import numpy as np
+from product_store import ProductStore
+
+# Structured filters accepted by the searches (all optional) :
+#   price_min / price_max : price range in $ (bounds included)
+#   min_mark : minimum mean review mark
+#   brand / country : one value or a list of accepted values (case-insensitive)
+FILTER_NAMES = ("price_min", "price_max", "min_mark", "brand", "country")
+NUMERIC_FILTERS = ("price_min", "price_max", "min_mark")
+
+# Buckets of the price facet ($) and thresholds of the mean mark facet
+PRICE_FACET_BOUNDS = (10, 25, 50, 100)
+MARK_FACET_THRESHOLDS = (4, 3, 2, 1)
+
+
+def validate_filters(filters):
+    """
+    Check a filters dict (see FILTER_NAMES) : numbers (int or float) for the bounds, a string or a list of strings
+    for brand / country. None values are ignored. Raise ValueError if anything else is given.
+    """
+    if filters is None:
+        return
+    if not isinstance(filters, dict):
+        raise ValueError(f"Filters must be a dict, not {type(filters).__name__}")
+    unknown = set(filters) - set(FILTER_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown filters: {sorted(unknown)} (expected some of {FILTER_NAMES})")
+
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name in NUMERIC_FILTERS:
+            if isinstance(value, bool) or not isinstance(value, (int, float, np.integer, np.floating)) or np.isnan(value):
+                raise ValueError(f"Invalid filter {name}: {value!r} (expected a number)")
+        elif not isinstance(value, str) and not (
+                isinstance(value, (list, tuple, set)) and all(isinstance(v, str) for v in value)):
+            raise ValueError(f"Invalid filter {name}: {value!r} (expected a string or a list of strings)")
+
+
+def numeric_column(products, field):
+    """Values of a numeric field as floats (NaN when unknown, e.g. a price that could not be parsed)."""
+    if isinstance(products, ProductStore):
+        return np.array(products.column(field), dtype=np.float64)
+    values = np.full(len(products), np.nan)
+    for i, product in enumerate(products):
+        if isinstance(product.get(field), (int, float)):
+            values[i] = product[field]
+    return values
+
+
+def text_column(products, field):
+    """Values of a text field (read from the string table of a product store, or from a list of products)."""
+    if isinstance(products, ProductStore):
+        return products.column(field)
+    return [product[field] for product in products]
+
+
+class SortedColumn:
+    """Numeric field sorted once, so a range filter is two binary searches."""
+
+    def __init__(self, values):
+        self.size = len(values)
+        known = np.flatnonzero(~np.isnan(values))
+        self.rows = known[np.argsort(values[known], kind="stable")]  # Product rows by increasing value
+        self.values = values[self.rows]
+
+    def range_mask(self, low=None, high=None):
+        """Bitmap (boolean array over the products) of the values in [low, high], None = unbounded."""
+        start = 0 if low is None else np.searchsorted(self.values, low, side="left")
+        end = len(self.values) if high is None else np.searchsorted(self.values, high, side="right")
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.rows[start:end]] = True
+        return mask
+
+
+class BitmapColumn:
+    """Categorical field : one bitmap per distinct value (values are compared in lower case)."""
+
+    def __init__(self, labels):
+        keys = [str(label).strip().lower() for label in labels]
+        self.labels = {}  # Lower case key -> label as first seen, for display
+        for key, label in zip(keys, labels):
+            self.labels.setdefault(key, label)
+        self.keys = list(self.labels)
+        code_of = {key: code for code, key in enumerate(self.keys)}
+        self.codes = np.array([code_of[key] for key in keys], dtype=np.int32)
+        self.bitmaps = {key: self.codes == code for code, key in enumerate(self.keys)}
+
+    def mask(self, wanted):
+        """Bitmap of the products having one of the wanted values."""
+        mask = np.zeros(len(self.codes), dtype=bool)
+        for value in ([wanted] if isinstance(wanted, str) else wanted):
+            bitmap = self.bitmaps.get(value.strip().lower())
+            if bitmap is not None:
+                mask |= bitmap
+        return mask
+
+    def counts(self, rows):
+        """{label: number of products} among the given rows, most frequent first."""
+        counts = np.bincount(self.codes[rows], minlength=len(self.keys))
+        order = np.argsort(-counts, kind="stable")
+        return {self.labels[self.keys[code]]: int(counts[code]) for code in order if counts[code]}
+
+
+class ProductFilterIndex:
+    """
+    Sorted-array (price, mean mark) and bitmap (brand, country) indexes over the rows of the products (a ProductStore,
+    or the list of the products file).
+    """
+
+    def __init__(self, products):
+        self.size = len(products)
+        self.prices = numeric_column(products, "price ($)")
+        self.marks = numeric_column(products, "mean_mark")
+        self.price = SortedColumn(self.prices)
+        self.mean_mark = SortedColumn(self.marks)
+        self.brand = BitmapColumn(text_column(products, "brand"))
+        self.country = BitmapColumn(text_column(products, "country_of_origin"))
+
+    def mask(self, price_min=None, price_max=None, min_mark=None, brand=None, country=None):
+        """Bitmap of the products matching all the given filters."""
+        mask = np.ones(self.size, dtype=bool)
+        if price_min is not None or price_max is not None:
+            mask &= self.price.range_mask(price_min, price_max)
+        if min_mark is not None:
+            mask &= self.mean_mark.range_mask(min_mark, None)
+        if brand is not None:
+            mask &= self.brand.mask(brand)
+        if country is not None:
+            mask &= self.country.mask(country)
+        return mask
+
+    def rows(self, filters):
+        """Sorted product rows matching a {filter name: value} dict."""
+        validate_filters(filters)
+        return np.flatnonzero(self.mask(**filters))
+
+    def facets(self, rows=None):
+        """Facet counts (brand, country, price range, mean mark) over the given product rows (all if None)."""
+        rows = np.arange(self.size) if rows is None else np.asarray(rows)
+
+        prices = self.prices[rows]
+        prices = prices[~np.isnan(prices)]
+        bounds = (0,) + PRICE_FACET_BOUNDS
+        buckets = np.bincount(np.searchsorted(PRICE_FACET_BOUNDS, prices, side="right"), minlength=len(bounds))
+        price_labels = [f"${low}-{high}" for low, high in zip(bounds, PRICE_FACET_BOUNDS)] + [f"${bounds[-1]}+"]
+
+        marks = self.marks[rows]
+        return {
+            "brand": self.brand.counts(rows),
+            "country_of_origin": self.country.counts(rows),
+            "price": {label: int(count) for label, count in zip(price_labels, buckets) if count},
+            "mean_mark": {f"{threshold}+": int((marks >= threshold).sum()) for threshold in MARK_FACET_THRESHOLDS},
+        }
+
+
+def filters_key(filters):
+    """Hashable, order-independent form of a filters dict (for cache keys)."""
+    if not filters:
+        return None
+    return tuple(sorted(
+        (name, tuple(sorted(v.lower() for v in value)) if isinstance(value, (list, tuple, set))
+         else value.lower() if isinstance(value, str) else value)
+        for name, value in filters.items() if value is not None
+    ))
+
+
+if __name__ == "__main__":
+    import json
+    with open("extracted_products.json", "r", encoding="utf-8") as f:
+        products = json.load(f)
+
+    filter_index = ProductFilterIndex(products)
+    rows = filter_index.rows({"price_max": 20, "min_mark": 4})
+    print(f"✅ {len(rows)} products under $20 with a mean mark of at least 4")
+    print(json.dumps(filter_index.facets(rows), indent=4))
@@ -0,0 +1,194 @@
+import os
+import json
+import numpy as np
+from collections.abc import Mapping
+from json_lines import iter_records
+from vector_store import save_array
+
+# File paths
+PRODUCTS_FILE = "extracted_products.json"  # A JSON Lines file (.jsonl) is streamed instead of loaded at once
+STORE_DIR = "product_store/"
+
+# Fields of a product (in the order of the products file). The numeric ones are memory-mapped float64 columns
+# (NaN when unknown, e.g. a price that could not be parsed), the text ones are int32 ids in a string table
+PRODUCT_FIELDS = ("url", "title", "variant", "description", "price ($)", "brand", "total_reviews", "mean_mark",
+                  "last_rating", "country_of_origin", "product_id")
+NUMERIC_COLUMNS = {"price ($)": "price", "mean_mark": "mean_mark", "total_reviews": "total_reviews",
+                   "last_rating": "last_rating"}  # field -> column file
+# Which numeric values were ints in the products file is kept per value in integers.npy (e.g. mean_mark is 0 without
+# reviews, a float otherwise), so they are read back with the same type. Stores written without it use these fields
+INTEGER_FIELDS = ("total_reviews", "last_rating")
+STRING_FIELDS = tuple(field for field in PRODUCT_FIELDS if field not in NUMERIC_COLUMNS)
+SHARED_STRING_FIELDS = ("title", "variant", "brand", "country_of_origin")  # Repeated values, stored once
+UNKNOWN = "Unknown"
+
+
+class ProductRow(Mapping):
+    """
+    A product of the store, referenced by its row : the fields are read from the columns when accessed, so search
+    results don't carry copies of the products. Pickled (disk cache, other processes) as a plain dict.
+    """
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = int(row)
+
+    def __getitem__(self, field):
+        return self.store.value(self.row, field)
+
+    def __iter__(self):
+        return iter(PRODUCT_FIELDS)
+
+    def __len__(self):
+        return len(PRODUCT_FIELDS)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def __repr__(self):
+        return f"ProductRow({self.row}, {dict(self)!r})"
+
+
+class ProductStore:
+    """Products stored by columns : memory-mapped numeric arrays, and the ids of the text fields in a string table."""
+
+    def __init__(self, directory, numeric, integers, codes, offsets, strings, meta):
+        self.directory = directory
+        self.numeric = numeric  # field -> (n_products,) float64 column
+        self.integers = integers  # (n_products, len(NUMERIC_COLUMNS)) bool, True where the value was an int (or None)
+        self.numeric_column = {field: i for i, field in enumerate(NUMERIC_COLUMNS)}
+        self.codes = codes  # (n_products, len(STRING_FIELDS)) string ids
+        self.offsets = offsets  # Byte range of string i in `strings` : offsets[i]:offsets[i + 1]
+        self.strings = strings  # UTF-8 bytes of all the strings, one after the other
+        self.meta = meta
+        self.string_column = {field: i for i, field in enumerate(STRING_FIELDS)}
+        self.product_rows = None  # product_id -> row, built on first use
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def __getitem__(self, row):
+        return ProductRow(self, row)
+
+    def __iter__(self):
+        return (ProductRow(self, row) for row in range(len(self)))
+
+    def string(self, string_id):
+        return bytes(self.strings[self.offsets[string_id]:self.offsets[string_id + 1]]).decode("utf-8")
+
+    def value(self, row, field):
+        """Value of a field of a product, as in the products file."""
+        if field in self.numeric:
+            value = self.numeric[field][row]
+            if np.isnan(value):
+                return UNKNOWN
+            if self.integers is None:
+                return int(value) if field in INTEGER_FIELDS else float(value)
+            return int(value) if self.integers[row, self.numeric_column[field]] else float(value)
+        if field not in self.string_column:
+            raise KeyError(field)
+        return self.string(self.codes[row, self.string_column[field]])
+
+    def column(self, field):
+        """Whole column of a field : a float64 array (numeric field, NaN = unknown) or a list of strings."""
+        if field in self.numeric:
+            return self.numeric[field]
+        codes = self.codes[:, self.string_column[field]]
+        if field in SHARED_STRING_FIELDS:
+            distinct, inverse = np.unique(codes, return_inverse=True)  # Each distinct value decoded once
+            values = [self.string(string_id) for string_id in distinct]
+            return [values[i] for i in inverse]
+        return [self.string(string_id) for string_id in codes]
+
+    def record(self, row):
+        """The product of a row as a dict (like in the products file)."""
+        return {field: self.value(row, field) for field in PRODUCT_FIELDS}
+
+    def rows_of(self, product_ids):
+        """Rows of some products, by product_id."""
+        if self.product_rows is None:
+            self.product_rows = {product_id: row for row, product_id in enumerate(self.column("product_id"))}
+        return np.array([self.product_rows[product_id] for product_id in product_ids], dtype=np.int64)
+
+
+def write_product_store(products, directory=STORE_DIR, source=None):
+    """
+    Write the products (any iterable, read once) as columns : one .npy array per numeric field (and the int/float type
+    of the values in integers.npy), the string ids of the text fields in codes.npy, and the strings in strings.bin
+    (UTF-8) with their offsets in offsets.npy.
+    """
+    os.makedirs(directory, exist_ok=True)
+    numeric = {field: [] for field in NUMERIC_COLUMNS}
+    integers = []
+    codes = []
+    offsets = [0]
+    shared_ids = {}  # Strings of the repeated fields -> string id
+
+    with open(os.path.join(directory, "strings.tmp.bin"), "wb") as strings:
+        def add_string(text):
+            data = text.encode("utf-8")
+            strings.write(data)
+            offsets.append(offsets[-1] + len(data))
+            return len(offsets) - 2
+
+        for product in products:
+            for field in NUMERIC_COLUMNS:
+                value = product.get(field)
+                numeric[field].append(value if isinstance(value, (int, float)) else np.nan)
+            integers.append([isinstance(product.get(field), int) for field in NUMERIC_COLUMNS])
+            row = []
+            for field in STRING_FIELDS:
+                text = str(product.get(field, UNKNOWN))
+                if field in SHARED_STRING_FIELDS:
+                    if text not in shared_ids:
+                        shared_ids[text] = add_string(text)
+                    row.append(shared_ids[text])
+                else:
+                    row.append(add_string(text))
+            codes.append(row)
+
+    for field, column in NUMERIC_COLUMNS.items():
+        save_array(os.path.join(directory, f"{column}.npy"), np.array(numeric[field], dtype=np.float64))
+    save_array(os.path.join(directory, "integers.npy"), np.array(integers, dtype=bool).reshape(-1, len(NUMERIC_COLUMNS)))
+    save_array(os.path.join(directory, "codes.npy"), np.array(codes, dtype=np.int32).reshape(-1, len(STRING_FIELDS)))
+    save_array(os.path.join(directory, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    os.replace(os.path.join(directory, "strings.tmp.bin"), os.path.join(directory, "strings.bin"))
+
+    # meta.json is written last, so its presence means the store is complete
+    meta = {"count": len(codes), "strings": len(offsets) - 1, "string_fields": list(STRING_FIELDS), "source": source}
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=4)
+    return load_product_store(directory)
+
+
+def load_product_store(directory=STORE_DIR):
+    """Load a product store, every file is memory-mapped (zero-copy, nothing is decoded until it is read)."""
+    with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    numeric = {field: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r")
+               for field, column in NUMERIC_COLUMNS.items()}
+    integers_file = os.path.join(directory, "integers.npy")
+    integers = np.load(integers_file, mmap_mode="r") if os.path.exists(integers_file) else None
+    codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode="r")
+    offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+    strings_file = os.path.join(directory, "strings.bin")
+    # An empty file can't be memory-mapped
+    strings = np.memmap(strings_file, dtype=np.uint8, mode="r") if os.path.getsize(strings_file) else np.zeros(0, np.uint8)
+    return ProductStore(directory, numeric, integers, codes, offsets, strings, meta)
+
+
+def load_or_build_product_store(products_file=PRODUCTS_FILE, directory=STORE_DIR):
+    """Load the product store, (re)building it first if it is missing or older than the products file."""
+    meta_file = os.path.join(directory, "meta.json")
+    if not os.path.exists(meta_file) or os.path.getmtime(meta_file) < os.path.getmtime(products_file):
+        return write_product_store(iter_records(products_file), directory, source=products_file)
+    return load_product_store(directory)
+
+
+if __name__ == "__main__":
+    store = write_product_store(iter_records(PRODUCTS_FILE), STORE_DIR, source=PRODUCTS_FILE)
+    size = sum(os.path.getsize(os.path.join(STORE_DIR, name)) for name in os.listdir(STORE_DIR))
+    print(f"✅ {len(store)} products saved in {STORE_DIR} ({store.meta['strings']} strings, {size / 1024:.0f} KB).")
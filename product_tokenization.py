@@ -1,58 +1,26 @@
-import json
-import nltk
-from nltk.corpus import stopwords, wordnet
-from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
-
-# Download required NLTK data
-nltk.download("punkt")
-nltk.download("stopwords")
-nltk.download("wordnet")
+import os
+from concurrent.futures import ProcessPoolExecutor
+from json_lines import iter_records, batched, write_records
+from synonyms import get_synonyms, get_country_synonyms
+from text_analyzer import analyze_many
 
 # Load input and output file paths
 INPUT_FILE = "extracted_products.json"
 OUTPUT_FILE = "tokenized_products.json"
-COUNTRY_SYNONYMS_FILE = "initial_index_files/origin_synonyms.json"  # Adjust path if needed
-
-# Load extracted products data
-with open(INPUT_FILE, "r", encoding="utf-8") as f:
-    products = json.load(f)
-
-# Load country synonyms
-with open(COUNTRY_SYNONYMS_FILE, "r", encoding="utf-8") as f:
-    country_synonyms_dict = json.load(f)  
 
-# Initialize NLTK tools
-lemmatizer = WordNetLemmatizer()
-stop_words = set(stopwords.words("english"))
+# Parallel tokenization : number of worker processes, and products sent to the pool at a time
+TOKENIZE_WORKERS = os.cpu_count() or 1
+CHUNK_SIZE = 1000
 
-# Function to tokenize and lemmatize text
-def tokenize(text):
-    """Tokenize, remove stopwords, and lemmatize text."""
-    text = text.lower()
-    words = word_tokenize(text)
-    words = [w for w in words if w.isalnum()]
-    words = [lemmatizer.lemmatize(w) for w in words if w not in stop_words]
-    return words
+# Text fields of a product that are tokenized (a change in any of them means the product must be re-tokenized)
+TEXT_FIELDS = ("title", "variant", "description", "brand", "country_of_origin")
 
-# Function to generate synonyms (from WordNet)
-def get_synonyms(word):
-    """Retrieve synonyms for a given word using WordNet."""
-    synonyms = set()
-    for synset in wordnet.synsets(word):
-        for lemma in synset.lemmas():
-            synonyms.add(lemma.name().replace("_", " "))  # Convert to readable format
-    return list(synonyms)[:3]  # Limit to 3 synonyms
-
-# Process products and generate tokens
-tokenized_products = []
-for product in products:
-    # Tokenize fields
-    title_tokens = tokenize(product["title"])
-    variant_tokens = tokenize(product["variant"])
-    description_tokens = tokenize(product["description"])
-    brand_tokens = tokenize(product["brand"])
-    country_tokens = tokenize(product["country_of_origin"])
+def tokenize_product(product):
+    """Generate the tokens of each field of one product."""
+    # Tokenize fields (shared analyzer : tokenize, remove stopwords, and lemmatize)
+    title_tokens, variant_tokens, description_tokens, brand_tokens, country_tokens = analyze_many(
+        product[field] for field in TEXT_FIELDS
+    )
 
     # Get synonyms for important fields
     synonym_tokens = set()  # Use a set to remove duplicates
@@ -63,33 +31,53 @@ for product in products:
 
     # Add country synonyms from `origin_synonyms.json` (in case they aren't already in the synonyms provided by WordNet)
     for country in country_tokens:
-        if country in country_synonyms_dict:
-            synonym_tokens.update(country_synonyms_dict[country])
+        synonym_tokens.update(get_country_synonyms(country))
 
     # Convert back to list after removing duplicates
-    synonym_tokens = sorted(synonym_tokens)  
+    synonym_tokens = sorted(synonym_tokens)
 
-    # Replicate title and variant tokens for weighting
-    weighted_tokens = (
-        title_tokens * 10 +  # More weight for title
-        variant_tokens * 5 +  # More weight for variant
-        description_tokens +
-        brand_tokens * 10 +
-        country_tokens * 10 +
-        synonym_tokens * 5  # Add synonyms (for country and title)
-    )
-
-    # Store tokenized result with `product_id`
-    tokenized_products.append({
+    # Store the tokens of each field separately : the field weights (title x10, variant x5, ...) are applied
+    # at scoring time by the inverted index (BM25F, see FIELD_BOOSTS), instead of duplicating the tokens
+    return {
         "product_id": product["product_id"],  # Keep the unique identifier
         "url": product["url"],
         "title": product["title"],
         "variant": product["variant"],
-        "tokens": weighted_tokens
-    })
-
-# Save tokenized data
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(tokenized_products, f, indent=4)
-
-print(f"✅ Tokenization complete! Results saved in {OUTPUT_FILE}.")
+        "fields": {
+            "title": title_tokens,
+            "variant": variant_tokens,
+            "description": description_tokens,
+            "brand": brand_tokens,
+            "country": country_tokens,
+            "synonyms": synonym_tokens  # Synonyms of the title and country tokens
+        }
+    }
+
+
+def tokenize_products(products, workers=TOKENIZE_WORKERS, chunk_size=CHUNK_SIZE):
+    """
+    Tokenize a stream of products in a process pool, and yield the tokenized products in the same order.
+    At most two chunks are in memory : the one being tokenized by the workers and the one being consumed.
+    """
+    if workers <= 1:
+        yield from map(tokenize_product, products)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = None
+        for chunk in batched(products, chunk_size):
+            # Submit the next chunk before handing out the results of the previous one
+            results = executor.map(tokenize_product, chunk, chunksize=max(1, len(chunk) // (4 * workers)))
+            if pending is not None:
+                yield from pending
+            pending = results
+        if pending is not None:
+            yield from pending
+
+
+if __name__ == "__main__":
+    # Stream the products (JSON Lines, or the JSON list of product_extraction.py), tokenize them in parallel
+    # and write the results as they come
+    count = write_records(tokenize_products(iter_records(INPUT_FILE)), OUTPUT_FILE)
+
+    print(f"✅ Tokenization of {count} products complete! Results saved in {OUTPUT_FILE}.")
@@ -0,0 +1,21 @@
+import numpy as np
+
+
+def min_max_normalize(scores):
+    """Normalize scores between 0 and 1 (all zeros if every score is the same)."""
+    if len(scores) == 0:
+        return np.zeros_like(scores, dtype=np.float64)
+    min_score, max_score = np.min(scores), np.max(scores)
+    if max_score > min_score:  # Avoid division by zero
+        return (scores - min_score) / (max_score - min_score)
+    return np.zeros_like(scores, dtype=np.float64)
+
+
+def top_k_indices(scores, k=None):
+    """Positions of the k highest scores, best first (argpartition, then only the k selected are sorted)."""
+    if k is not None and k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    # Sort by decreasing score, then by position for ties (same order as a stable full sort)
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
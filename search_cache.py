@@ -0,0 +1,190 @@
+import os
+import time
+import atexit
+import shelve
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Default sizes (number of entries) and time-to-live (seconds) of the caches
+TOKEN_CACHE_SIZE = 10_000
+EMBEDDING_CACHE_SIZE = 10_000
+RESULT_CACHE_SIZE = 2_000
+CACHE_TTL = 3600
+
+# Optional on-disk tier (None = memory only), e.g. "search_cache/"
+CACHE_DIR = None
+
+
+class LRUCache:
+    """Bounded cache with LRU + TTL eviction, hit/miss counters and an optional on-disk tier."""
+
+    def __init__(self, name, maxsize, ttl=CACHE_TTL, disk_dir=CACHE_DIR):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl  # None = entries never expire
+        self.entries = OrderedDict()  # key -> (expiry time, value), least recently used first
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        self.disk = None
+        if disk_dir is not None:
+            self.enable_disk(disk_dir)
+
+    def enable_disk(self, disk_dir):
+        """Persist entries in a shelve file, so a warm cache survives restarts."""
+        os.makedirs(disk_dir, exist_ok=True)
+        self.close()
+        self.disk = shelve.open(os.path.join(disk_dir, self.name))
+
+    def expiry(self):
+        return time.time() + self.ttl if self.ttl is not None else float("inf")
+
+    def get(self, key, default=None):
+        """Return the cached value (and mark it as recently used), or `default`."""
+        disk_key = cache_key(key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.disk is not None:
+                entry = self.disk.get(disk_key)
+                if entry is not None:
+                    self.entries[key] = entry  # Promote to memory
+
+            if entry is not None and entry[0] > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                self.evict()
+                return entry[1]
+
+            # Missing or expired
+            if entry is not None:
+                del self.entries[key]
+                if self.disk is not None and disk_key in self.disk:
+                    del self.disk[disk_key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries beyond `maxsize`."""
+        entry = (self.expiry(), value)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            if self.disk is not None:
+                self.disk[cache_key(key)] = entry
+                self.disk.sync()  # Flushed right away, a crash doesn't lose (or corrupt) the stored entries
+            self.evict()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value, or compute, store and return it."""
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def evict(self):
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (memory and disk), the counters are kept."""
+        with self.lock:
+            self.entries.clear()
+            if self.disk is not None:
+                self.disk.clear()
+
+    def sync(self):
+        """Write the pending changes of the disk tier to its file."""
+        with self.lock:
+            if self.disk is not None:
+                self.disk.sync()
+
+    def close(self):
+        """Close the disk tier (the cache goes on in memory only)."""
+        with self.lock:
+            if self.disk is not None:
+                self.disk.close()
+                self.disk = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+MISSING = object()
+
+
+def cache_key(key):
+    """String key for the disk tier (shelve only accepts strings)."""
+    return hashlib.md5(repr(key).encode()).hexdigest()
+
+
+def normalize_query(query):
+    """Normalized form of a query used as cache key (case and extra spaces don't matter)."""
+    return " ".join(query.lower().split())
+
+
+# Normalized query -> expanded tokens, expanded text -> embedding vector, (query, weights, top_n) -> ranked results
+token_cache = LRUCache("tokens", TOKEN_CACHE_SIZE)
+embedding_cache = LRUCache("embeddings", EMBEDDING_CACHE_SIZE)
+result_cache = LRUCache("results", RESULT_CACHE_SIZE)
+all_caches = (token_cache, embedding_cache, result_cache)
+
+index_version = None
+
+
+def file_version(*paths):
+    """Version string of the index files, from their modification times (missing files are skipped)."""
+    return "|".join(f"{path}:{os.path.getmtime(path)}" for path in paths if os.path.exists(path))
+
+
+def set_index_version(version):
+    """Declare the version of the loaded indexes, the caches are invalidated when it changes."""
+    global index_version
+    if CACHE_DIR is not None:
+        # The disk tier remembers the version it was filled with
+        with shelve.open(os.path.join(CACHE_DIR, "version")) as stored:
+            if stored.get("index_version") != version:
+                invalidate_all()
+            stored["index_version"] = version
+    elif index_version is not None and version != index_version:
+        invalidate_all()
+    index_version = version
+
+
+def invalidate_all():
+    """Empty all caches (e.g. after an index or a model change)."""
+    for cache in all_caches:
+        cache.clear()
+
+
+def enable_disk_cache(directory="search_cache/"):
+    """Turn on the on-disk tier of all caches."""
+    global CACHE_DIR
+    CACHE_DIR = directory
+    for cache in all_caches:
+        cache.enable_disk(directory)
+    if index_version is not None:
+        set_index_version(index_version)  # Drop what was stored for other indexes
+
+
+def close_caches():
+    """Flush and close the disk tier of all caches (called at exit, and when the search server stops)."""
+    for cache in all_caches:
+        cache.close()
+
+
+atexit.register(close_caches)
+
+
+def cache_stats():
+    """Hit/miss counters of every cache."""
+    return {cache.name: cache.stats() for cache in all_caches}
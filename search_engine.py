@@ -0,0 +1,278 @@
+import os
+import time
+import threading
+import numpy as np
+import nltk
+from inverted_index import load_or_build_index
+from vector_store import load_or_convert_vector_store
+from product_store import load_or_build_product_store
+from ann_index import ExactIndex, load_or_build_ann_index
+from synonyms import get_synonym_service, SYNONYMS_FILE
+from ranking import min_max_normalize
+from product_filters import ProductFilterIndex
+from search_cache import file_version, set_index_version
+from encoder_backends import load_encoder, ENCODER_BACKEND, ENCODER_THREADS, MAX_SEQ_LENGTH
+
+# File paths
+PRODUCTS_FILE = "extracted_products.json"
+TOKENIZED_FILE = "tokenized_products.json"
+EMBEDDINGS_JSON_FILE = "embeddings_of_products.json"
+INDEX_DIR = "lexical_index/"
+STORE_DIR = "vector_store/"
+PRODUCT_STORE_DIR = "product_store/"
+ANN_DIR = "ann_index/"
+MODEL_NAME = "multi-qa-MiniLM-L6-cos-v1"  # Same embedding model as the products
+
+# NLTK data needed by the tokenizer (any of the listed paths is enough)
+NLTK_RESOURCES = {
+    "punkt": ("tokenizers/punkt_tab", "tokenizers/punkt"),
+    "stopwords": ("corpora/stopwords", "corpora/stopwords.zip"),
+    "wordnet": ("corpora/wordnet", "corpora/wordnet.zip"),
+}
+
+
+def ensure_nltk_data():
+    """Check that the NLTK data is installed locally (never downloads, so it works on offline hosts)."""
+    missing = []
+    for name, paths in NLTK_RESOURCES.items():
+        for path in paths:
+            try:
+                nltk.data.find(path)
+                break
+            except LookupError:
+                continue
+        else:
+            missing.append(name)
+
+    if missing:
+        raise LookupError(
+            f"Missing NLTK data: {', '.join(missing)}. "
+            f"Install it once with: python -m nltk.downloader {' '.join(missing)}"
+        )
+
+
+class SearchEngine:
+    """
+    All the resources of the searches (NLTK data, indexes, embedding model, product catalogue).
+
+    Nothing is loaded when the engine is created : each resource is loaded on first use (or by `warmup()`),
+    and the time spent in each loading stage is recorded for `startup_report()`.
+    """
+
+    def __init__(self, products_file=PRODUCTS_FILE, tokenized_file=TOKENIZED_FILE, index_dir=INDEX_DIR,
+                 store_dir=STORE_DIR, embeddings_json_file=EMBEDDINGS_JSON_FILE, ann_dir=ANN_DIR, model_name=MODEL_NAME,
+                 encoder_backend=ENCODER_BACKEND, product_store_dir=PRODUCT_STORE_DIR, encoder_threads=ENCODER_THREADS,
+                 max_seq_length=MAX_SEQ_LENGTH):
+        self.products_file = products_file
+        self.tokenized_file = tokenized_file
+        self.index_dir = index_dir
+        self.store_dir = store_dir
+        self.embeddings_json_file = embeddings_json_file
+        self.ann_dir = ann_dir
+        self.model_name = model_name
+        self.encoder_backend = encoder_backend  # "torch", "int8", "onnx" or "onnx_int8" (see encoder_backends.py)
+        self.product_store_dir = product_store_dir
+        self.encoder_threads = encoder_threads  # CPU threads of the encoder (None = backend default)
+        self.max_seq_length = max_seq_length  # Tokens per text kept by the encoder
+
+        self.resources = {}  # Stage name -> loaded resource
+        self.stage_times = {}  # Stage name -> loading time (seconds)
+        self.loading = []  # Time spent in nested stage loads, one accumulator per stage being loaded
+        self.lock = threading.RLock()
+
+    def load(self, stage, loader):
+        """Return the resource of a stage, loading (and timing) it the first time."""
+        if stage not in self.resources:
+            with self.lock:
+                if stage not in self.resources:
+                    start = time.perf_counter()
+                    self.loading.append(0.0)
+                    try:
+                        resource = loader()
+                    finally:
+                        nested_time = self.loading.pop()
+                    elapsed = time.perf_counter() - start
+
+                    # Stages loaded by this one (dependencies) are only counted in their own time
+                    self.stage_times[stage] = elapsed - nested_time
+                    if self.loading:
+                        self.loading[-1] += elapsed
+                    self.resources[stage] = resource
+        return self.resources[stage]
+
+    # --- Query analysis ---
+
+    @property
+    def nltk_tools(self):
+        """(stop words, lemmatizer, English Punkt sentence tokenizer), after checking the local NLTK data."""
+        def load_nltk():
+            ensure_nltk_data()
+            from nltk.corpus import stopwords
+            from nltk.stem import WordNetLemmatizer
+            try:
+                from nltk.tokenize.punkt import PunktTokenizer  # punkt_tab (NLTK >= 3.8.2)
+                punkt = PunktTokenizer("english")
+            except ImportError:
+                punkt = nltk.data.load("tokenizers/punkt/english.pickle")
+            return set(stopwords.words("english")), WordNetLemmatizer(), punkt
+        return self.load("nltk", load_nltk)
+
+    @property
+    def stop_words(self):
+        return self.nltk_tools[0]
+
+    @property
+    def lemmatizer(self):
+        return self.nltk_tools[1]
+
+    @property
+    def sentence_tokenizer(self):
+        return self.nltk_tools[2]
+
+    @property
+    def synonyms(self):
+        return self.load("synonyms", get_synonym_service)
+
+    # --- Lexical search ---
+
+    @property
+    def lexical_index(self):
+        return self.load("lexical_index", lambda: load_or_build_index(self.tokenized_file, self.index_dir))
+
+    # --- Semantic search ---
+
+    @property
+    def vector_store(self):
+        return self.load("vector_store", lambda: load_or_convert_vector_store(self.store_dir, self.embeddings_json_file))
+
+    @property
+    def product_vectors(self):
+        return self.load("product_vectors", self.vector_store.float_vectors)
+
+    @property
+    def exact_index(self):
+        return self.load("exact_index", lambda: ExactIndex(self.product_vectors))
+
+    @property
+    def ann_index(self):
+        return self.load("ann_index", lambda: load_or_build_ann_index(self.product_vectors, self.ann_dir, self.store_dir))
+
+    @property
+    def model(self):
+        # Heavy import (torch or onnxruntime), only done when needed
+        def load_model():
+            backend = self.vector_store.meta.get("backend")
+            if backend is not None and backend != self.encoder_backend:
+                print(f"⚠️ The vector store was encoded with the {backend} backend, the queries use {self.encoder_backend}")
+            return load_encoder(self.model_name, self.encoder_backend, self.encoder_threads, self.max_seq_length)
+        return self.load("model", load_model)
+
+    # --- Hybrid search ---
+
+    @property
+    def product_store(self):
+        """Columnar copy of the products file (memory-mapped), rebuilt when the products file changes."""
+        return self.load("product_store", lambda: load_or_build_product_store(self.products_file, self.product_store_dir))
+
+    @property
+    def catalogue(self):
+        """Products, their normalized price and review scores, and their rows in the lexical index / vector store."""
+        return self.load("catalogue", self.load_catalogue)
+
+    def load_catalogue(self):
+        products = self.product_store
+
+        # Normalize Price Scores (Lower Price = Higher Score) : the cheapest product gets 1.0, the most expensive 0.0
+        prices = np.asarray(products.column("price ($)"), dtype=np.float64)
+        price_scores = 1 - min_max_normalize(prices)
+
+        # Normalize Review Scores (More Reviews + High Ratings = Higher Score)
+        # Formula: (mean rating * total reviews) + last rating, then normalized between 0 and 1
+        mean_ratings = np.asarray(products.column("mean_mark"), dtype=np.float64)
+        total_reviews = np.asarray(products.column("total_reviews"), dtype=np.float64)
+        last_ratings = np.asarray(products.column("last_rating"), dtype=np.float64)
+        review_scores = min_max_normalize((mean_ratings * total_reviews) + last_ratings)
+
+        # Row of each product in the store, and the matching rows of the lexical index and the vector store
+        lexical_rows = products.rows_of(d["product_id"] for d in self.lexical_index.documents)
+        semantic_rows = products.rows_of(p["product_id"] for p in self.vector_store.product_info)
+
+        # And the reverse : lexical doc id / vector store row of each product (-1 if missing from the index)
+        lexical_ids = np.full(len(products), -1, dtype=np.int64)
+        lexical_ids[lexical_rows] = np.arange(len(lexical_rows))
+        semantic_ids = np.full(len(products), -1, dtype=np.int64)
+        semantic_ids[semantic_rows] = np.arange(len(semantic_rows))
+
+        # Cached results are only valid for the loaded indexes and products
+        set_index_version(file_version(
+            os.path.join(self.index_dir, "meta.json"),
+            os.path.join(self.store_dir, "meta.json"),
+            self.products_file,
+            os.path.join(self.product_store_dir, "meta.json"),
+            SYNONYMS_FILE
+        ))
+
+        return {
+            "products": products,  # ProductStore : products[row] is a ProductRow (fields read when accessed)
+            "prices": prices,  # Real prices ($)
+            "price_scores": price_scores,
+            "review_scores": review_scores,
+            "lexical_rows": lexical_rows,
+            "semantic_rows": semantic_rows,
+            "lexical_ids": lexical_ids,
+            "semantic_ids": semantic_ids,
+        }
+
+    @property
+    def filter_index(self):
+        """Sorted-array and bitmap indexes of the products, for the structured filters and the facets."""
+        return self.load("filter_index", lambda: ProductFilterIndex(self.catalogue["products"]))
+
+    # --- Startup ---
+
+    def warmup(self, ann=False):
+        """
+        Load every resource of the hybrid search now (instead of on the first query), return the startup report.
+
+        :param ann: Also load (or build) the ANN index, only used by semantic_search(top_k=...) and fusion.py
+        """
+        self.nltk_tools
+        self.synonyms
+        self.lexical_index
+        self.exact_index
+        if ann:
+            self.ann_index
+        self.model
+        self.catalogue
+        return self.startup_report()
+
+    def startup_report(self):
+        """Loading time of each stage loaded so far, in milliseconds."""
+        stages = {stage: round(seconds * 1000, 2) for stage, seconds in self.stage_times.items()}
+        return {"stages": stages, "total_ms": round(sum(stages.values()), 2)}
+
+
+engine = None  # Shared engine, created (empty) on first use
+
+
+def get_engine():
+    """Return the shared search engine (creating it does not load anything)."""
+    global engine
+    if engine is None:
+        engine = SearchEngine()
+    return engine
+
+
+def set_engine(new_engine):
+    """Replace the shared search engine (e.g. to use other files)."""
+    global engine
+    engine = new_engine
+
+
+if __name__ == "__main__":
+    # Load what the hybrid search needs and print how long each stage takes
+    report = get_engine().warmup()
+    print("\n⏱️ ** Startup time per stage ** \n")
+    for stage, ms in report["stages"].items():
+        print(f"   {stage:<16} {ms:>10.2f} ms")
+    print(f"   {'total':<16} {report['total_ms']:>10.2f} ms")
@@ -0,0 +1,238 @@
+import io
+import time
+import random
+import pstats
+import cProfile
+import threading
+from contextlib import nullcontext
+from search_cache import cache_stats
+
+# Off by default : when disabled, `stage()` returns a shared no-op context and `count()` returns at once
+METRICS_ENABLED = False
+
+# Fraction of the (uncached) queries run under cProfile, 0 = never
+PROFILE_SAMPLE_RATE = 0.0
+
+# Upper bounds (seconds) of the latency histogram buckets, for Prometheus
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Prefix of the Prometheus metric names
+METRIC_PREFIX = "product_search"
+
+NO_OP = nullcontext()
+
+
+class StageStats:
+    """Number of calls, total / max time and latency histogram of one stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # Last one = above the largest bound
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+
+class StageTimer:
+    """Context manager adding the time spent in its block to a stage."""
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Per-stage timers, counters and sampled cProfile statistics of the query path (thread-safe)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}  # Stage name -> StageStats
+        self.counters = {}  # Counter name -> value
+        self.profile = None  # pstats.Stats of all the profiled queries
+        self.profiled_queries = 0
+        self.profiling = threading.Lock()  # Only one cProfile can run at a time
+
+    def observe(self, name, seconds):
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.observe(seconds)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_profile(self, profiler):
+        with self.lock:
+            if self.profile is None:
+                self.profile = pstats.Stats(profiler)
+            else:
+                self.profile.add(profiler)
+            self.profiled_queries += 1
+
+    def reset(self):
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+            self.profile = None
+            self.profiled_queries = 0
+
+    def snapshot(self):
+        """Structured view of everything collected so far (times in milliseconds)."""
+        with self.lock:
+            stages = {
+                name: {
+                    "count": stats.count,
+                    "total_ms": round(stats.total * 1000, 3),
+                    "mean_ms": round(stats.total * 1000 / stats.count, 3),
+                    "max_ms": round(stats.max * 1000, 3),
+                }
+                for name, stats in self.stages.items()
+            }
+            counters = dict(self.counters)
+            profiled_queries = self.profiled_queries
+        return {
+            "enabled": METRICS_ENABLED,
+            "stages": stages,
+            "counters": counters,
+            "caches": cache_stats(),
+            "profiled_queries": profiled_queries,
+        }
+
+    def prometheus(self):
+        """Everything collected so far, in the Prometheus text exposition format."""
+        name = f"{METRIC_PREFIX}_stage_seconds"
+        lines = [f"# HELP {name} Time spent in each stage of the query path.", f"# TYPE {name} histogram"]
+        with self.lock:
+            for stage, stats in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats.buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {stats.total:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {stats.count}')
+            counters = sorted(self.counters.items())
+
+        for counter, value in counters:
+            metric = f"{METRIC_PREFIX}_{counter}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+
+        # The caches count their own hits and misses, even when the metrics are disabled
+        caches = cache_stats()
+        for field, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("size", "gauge")):
+            metric = f"{METRIC_PREFIX}_cache_{field}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines += [f'{metric}{{cache="{cache}"}} {stats[field]}' for cache, stats in caches.items()]
+        return "\n".join(lines) + "\n"
+
+    def profile_report(self, limit=20, sort="cumulative"):
+        """The `limit` most expensive functions of the profiled queries, as pstats prints them."""
+        with self.lock:
+            if self.profile is None:
+                return "No profiled query (set a profile sample rate with enable_metrics)"
+            output = io.StringIO()
+            self.profile.stream = output
+            self.profile.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+metrics = Metrics()  # Shared metrics of the process
+
+
+def stage(name):
+    """Time a block of the query path : `with stage("encode"): ...` (no-op when the metrics are disabled)."""
+    if not METRICS_ENABLED:
+        return NO_OP
+    return StageTimer(metrics, name)
+
+
+def count(name, value=1):
+    """Add to a counter (e.g. the number of candidates), no-op when the metrics are disabled."""
+    if METRICS_ENABLED:
+        metrics.increment(name, value)
+
+
+class SampledProfile:
+    """Run a block under cProfile (only the calling thread is profiled), its statistics are added to the metrics."""
+
+    def __init__(self):
+        self.profiler = None
+
+    def __enter__(self):
+        if metrics.profiling.acquire(blocking=False):  # Skip the sample if another query is being profiled
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler is not None:
+            self.profiler.disable()
+            metrics.profiling.release()
+            metrics.add_profile(self.profiler)
+        return False
+
+
+def profiled():
+    """Profile a block for a sample of the calls (PROFILE_SAMPLE_RATE), no-op otherwise."""
+    if not METRICS_ENABLED or PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return NO_OP
+    return SampledProfile()
+
+
+def enable_metrics(profile_sample_rate=None):
+    """Start collecting the metrics (and profiling a sample of the queries, if a rate is given)."""
+    global METRICS_ENABLED, PROFILE_SAMPLE_RATE
+    METRICS_ENABLED = True
+    if profile_sample_rate is not None:
+        PROFILE_SAMPLE_RATE = profile_sample_rate
+
+
+def disable_metrics():
+    """Stop collecting the metrics (what was collected is kept until `metrics.reset()`)."""
+    global METRICS_ENABLED
+    METRICS_ENABLED = False
+
+
+def metrics_snapshot():
+    return metrics.snapshot()
+
+
+def prometheus_metrics():
+    return metrics.prometheus()
+
+
+if __name__ == "__main__":
+    import json
+    from hybrid_search import hybrid_search
+
+    # Time a few queries stage by stage, one of two under cProfile
+    enable_metrics(profile_sample_rate=0.5)
+    for query in ("red energy drink", "gluten free pasta", "organic green tea", "red energy drink"):
+        hybrid_search(query, top_n=10)
+
+    print("\n⏱️ ** Time per stage ** \n")
+    for name, stats in metrics_snapshot()["stages"].items():
+        print(f"   {name:<18} {stats['count']:>5} calls {stats['mean_ms']:>10.3f} ms (max {stats['max_ms']:.3f} ms)")
+    print(json.dumps(metrics_snapshot()["counters"], indent=4))
+    print(metrics.profile_report(limit=10))
@@ -0,0 +1,237 @@
+import sys
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from hybrid_search import hybrid_search_batch
+from product_filters import filters_key, validate_filters
+from search_engine import get_engine
+from search_metrics import enable_metrics, metrics_snapshot, prometheus_metrics
+from search_cache import close_caches
+from main import format_results
+
+# Server address
+HOST = "127.0.0.1"
+PORT = 8000
+
+# Micro-batching : concurrent queries arriving within BATCH_WINDOW_MS of the first one are searched together
+# (one model call for the whole batch), up to MAX_BATCH_SIZE queries
+BATCH_WINDOW_MS = 5
+MAX_BATCH_SIZE = 64
+REQUEST_TIMEOUT = 30  # Seconds a request waits for its results before answering 504
+
+# Weights used when a request doesn't give them (same defaults as hybrid_search)
+DEFAULT_WEIGHTS = {"lexical": 0.4, "semantic": 0.4, "reviews": 0.1, "price": 0.1}
+DEFAULT_TOP_N = 10
+
+# Per-stage timers and counters of the query path, served on /metrics (1% of the queries are profiled)
+COLLECT_METRICS = True
+PROFILE_SAMPLE_RATE = 0.01
+
+
+class MicroBatcher:
+    """Collect the queries of concurrent requests into small batches, searched by one background thread."""
+
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE):
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.queries = 0
+        self.thread = threading.Thread(target=self.run, name="micro-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, query, top_n, weights, filters):
+        """Queue a query, return a Future of its hybrid search results."""
+        future = Future()
+        self.queue.put((query, top_n, weights, filters, future))
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            # Wait a little for other queries, the first one never waits more than the window
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.process(batch)
+            except Exception as error:  # The thread must survive anything, or every later request would wait forever
+                for item in batch:
+                    if not item[-1].done():
+                        item[-1].set_exception(error)
+
+    def process(self, batch):
+        """Search the queries of a batch, grouped by parameters (one hybrid_search_batch call per group)."""
+        groups = {}
+        for item in batch:
+            query, top_n, weights, filters, future = item
+            try:
+                key = (top_n, tuple(sorted(weights.items())), filters_key(filters))
+            except Exception as error:  # Only this request fails
+                future.set_exception(error)
+                continue
+            groups.setdefault(key, []).append(item)
+
+        for items in groups.values():
+            _, top_n, weights, filters, _ = items[0]
+            try:
+                results = hybrid_search_batch([item[0] for item in items],
+                                              top_n=top_n,
+                                              lambda_lexical=weights["lexical"],
+                                              lambda_semantic=weights["semantic"],
+                                              lambda_reviews=weights["reviews"],
+                                              lambda_price=weights["price"],
+                                              batch_size=self.max_batch_size,
+                                              filters=filters)
+            except Exception as error:  # Reported to each request of the group
+                for item in items:
+                    item[-1].set_exception(error)
+                continue
+            for item, search_results in zip(items, results):
+                item[-1].set_result(search_results)
+
+        self.batches += 1
+        self.queries += len(batch)
+
+
+def search_parameters(body):
+    """Read and check (top_n, weights, filters) of a request body, raise ValueError if invalid."""
+    top_n = body.get("top_n", DEFAULT_TOP_N)
+    if top_n is not None and (isinstance(top_n, bool) or not isinstance(top_n, int) or top_n < 1):
+        raise ValueError("top_n must be a positive integer or null")
+
+    weights = dict(DEFAULT_WEIGHTS)
+    for name, value in body.get("weights", {}).items():
+        if name not in DEFAULT_WEIGHTS or isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Invalid weight: {name} (expected numbers for {list(DEFAULT_WEIGHTS)})")
+        weights[name] = value
+
+    filters = body.get("filters") or None
+    validate_filters(filters)  # Unknown filters and wrong value types (e.g. {"min_mark": "4"}) are rejected here
+    return top_n, weights, filters
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health        : the process is up
+    GET  /ready         : the indexes and the model are loaded (503 until then)
+    GET  /metrics       : per-stage timers, counters and cache statistics (Prometheus text format)
+    GET  /metrics.json  : the same as a JSON object
+    POST /search        : {"query": "...", "top_n": 10, "weights": {...}, "filters": {...}}
+    POST /search/batch  : same, with "queries": [...] instead of "query" (one result list per query, in order)
+    """
+
+    server_version = "ProductSearch/1.0"
+
+    def send_json(self, status, data):
+        self.send_body(status, json.dumps(data), "application/json")
+
+    def send_body(self, status, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            batcher = self.server.batcher
+            self.send_json(200, {"status": "ok", "batches": batcher.batches, "queries": batcher.queries})
+        elif self.path == "/ready":
+            if self.server.ready.is_set():
+                self.send_json(200, {"ready": True, "startup": self.server.startup})
+            else:
+                self.send_json(503, {"ready": False, "error": self.server.startup_error})
+        elif self.path == "/metrics":
+            self.send_body(200, prometheus_metrics(), "text/plain; version=0.0.4")
+        elif self.path == "/metrics.json":
+            self.send_json(200, metrics_snapshot())
+        else:
+            self.send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ("/search", "/search/batch"):
+            self.send_json(404, {"error": f"Unknown path: {self.path}"})
+            return
+        if not self.server.ready.is_set():
+            self.send_json(503, {"error": "The search engine is still loading"})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path == "/search":
+                queries = [body["query"]]
+            else:
+                queries = body["queries"]
+            if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+                raise ValueError("queries must be strings")
+            top_n, weights, filters = search_parameters(body)
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            self.send_json(400, {"error": f"Invalid request: {error}"})
+            return
+
+        # Every distinct query joins the current micro-batch, this thread just waits for its results
+        futures = {q: self.server.batcher.submit(q, top_n, weights, filters) for q in dict.fromkeys(queries)}
+        deadline = time.monotonic() + REQUEST_TIMEOUT
+        try:
+            results = {q: format_results(future.result(timeout=max(deadline - time.monotonic(), 0)))
+                       for q, future in futures.items()}
+        except TimeoutError:
+            self.send_json(504, {"error": f"No results after {REQUEST_TIMEOUT} s"})
+            return
+        except Exception as error:
+            self.send_json(500, {"error": str(error)})
+            return
+
+        if self.path == "/search":
+            self.send_json(200, {"query": queries[0], "results": results[queries[0]]})
+        else:
+            # One item per query of the request, in the same order (repeated queries included)
+            self.send_json(200, {"results": [{"query": q, "results": results[q]} for q in queries]})
+
+    def log_message(self, format, *args):
+        pass  # No line per request on the console
+
+
+def create_server(host=HOST, port=PORT, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE):
+    """Create the HTTP server and start loading the search engine in the background (see /ready)."""
+    server = ThreadingHTTPServer((host, port), SearchRequestHandler)
+    server.daemon_threads = True
+    server.batcher = MicroBatcher(window_ms, max_batch_size)
+    server.ready = threading.Event()
+    server.startup = None
+    server.startup_error = None
+
+    def warmup():
+        try:
+            server.startup = get_engine().warmup()
+            server.ready.set()
+        except Exception as error:
+            server.startup_error = str(error)
+
+    threading.Thread(target=warmup, name="warmup", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    # python search_server.py [port]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT
+    if COLLECT_METRICS:
+        enable_metrics(PROFILE_SAMPLE_RATE)
+    server = create_server(HOST, port)
+    print(f"🔍 Search server listening on http://{HOST}:{port} (loading the indexes, see /ready)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+        close_caches()
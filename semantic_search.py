@@ -1,97 +1,130 @@
+import os
 import json
 import numpy as np
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords, wordnet
-from nltk.stem import WordNetLemmatizer
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-
-# Download required NLTK data
-nltk.download("punkt")
-nltk.download("stopwords")
-nltk.download("wordnet")
-
-# Initialize NLTK tools
-lemmatizer = WordNetLemmatizer()
-stop_words = set(stopwords.words("english"))
-
-# Load the same embedding model used for products
-model = SentenceTransformer("multi-qa-MiniLM-L6-cos-v1")  # Ensure consistency
-
-# Load product embeddings
-with open("embeddings_of_products.json", "r", encoding="utf-8") as f:
-    product_embeddings = json.load(f)
-
-# Extract embeddings and product info
-product_vectors = np.array([p["embeddings"] for p in product_embeddings])
-product_info = [
-    {
-        "product_id": p["product_id"],  # Keep product_id for tracking
-        "url": p["url"],
-        "title": p["title"],
-        "variant": p.get("variant", "N/A")
-    }
-    for p in product_embeddings
-]
-
-def tokenize(text):
-    """Tokenize, remove stopwords, and lemmatize."""
-    text = text.lower()
-    words = word_tokenize(text)
-    words = [w for w in words if w.isalnum()]
-    words = [lemmatizer.lemmatize(w) for w in words if w not in stop_words]
-    return words
-
-def get_synonyms(word):
-    """Retrieve up to 3 synonyms for a given word."""
-    synonyms = set()
-    for synset in wordnet.synsets(word):
-        for lemma in synset.lemmas():
-            synonyms.add(lemma.name().replace("_", " "))
-    
-    return sorted(list(synonyms))[:3]  # **Sort synonyms to make results stable**
-
-def expand_query(query_tokens):
-    """Expand the query using synonyms."""
-    expanded_tokens = query_tokens[:]
-    for token in query_tokens:
-        expanded_tokens.extend(get_synonyms(token))
-    
-    return sorted(expanded_tokens)  # **Sorting ensures stable results**
-
-def semantic_search(query):
-    """Perform semantic search using cosine similarity with normalized scores for all products."""
-    
-    # Tokenize and expand the query before embedding
-    query_tokens = tokenize(query)
-    expanded_query_tokens = expand_query(query_tokens)
+from ann_index import normalize_queries
+from ranking import min_max_normalize, top_k_indices
+from search_cache import embedding_cache
+from search_engine import get_engine
+from lexical_search import preprocess_query
+from search_metrics import stage, count
+
+# NLTK tools, the embedding model (the same one used for products), the product embeddings
+# (memory-mapped binary store) and the exact / ANN indexes are loaded by the search engine on first use, not at import
+
+# Estimate of the lowest cosine of a query over the catalogue, the lower bound of the scores of the ANN search (and of
+# fusion.py) : queries used to estimate it (kept apart from the evaluation queries), else a sample of the products
+CALIBRATION_QUERIES_FILE = "calibration_queries.json"
+CALIBRATION_SAMPLE = 1000
+
+def encode_queries(expanded_query_texts, batch_size=64):
+    """Embed expanded query texts, only the ones missing from the embedding cache go through the model (one call)."""
+    vectors = [embedding_cache.get(text) for text in expanded_query_texts]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        with stage("encode"):
+            encoded = get_engine().model.encode([expanded_query_texts[i] for i in missing], batch_size=batch_size)
+        count("encoded_queries", len(missing))
+        for i, vector in zip(missing, encoded):
+            embedding_cache.put(expanded_query_texts[i], vector)
+            vectors[i] = vector
+    return np.array(vectors, dtype=np.float32).reshape(len(expanded_query_texts), -1)
+
+def embed_query(query, expanded_query_tokens=None):
+    """Tokenize and expand the query (unless already done), then embed it with the same model as the products."""
+    if expanded_query_tokens is None:
+        expanded_query_tokens = preprocess_query(query)
     expanded_query_text = " ".join(expanded_query_tokens)  # Convert back to text
 
     # Generate query embedding using the processed query
-    query_embedding = model.encode(expanded_query_text).reshape(1, -1)
-
-    # Compute cosine similarity with all product embeddings
-    similarities = cosine_similarity(query_embedding, product_vectors)[0]
-
-    # Normalize scores between 0 and 1
-    min_score = np.min(similarities)
-    max_score = np.max(similarities)
-
-    if max_score > min_score:  # Avoid division by zero
-        normalized_scores = (similarities - min_score) / (max_score - min_score)
-    else:
-        normalized_scores = np.zeros_like(similarities)  # If all scores are the same, set them to 0
-
-    # Rank all products by normalized similarity score
-    ranked_results = sorted(
-        zip(normalized_scores, product_info),
-        key=lambda x: x[0],
-        reverse=True
-    )
-
-    # Return scores for all products (even those with score 0), keeping `product_id`
-    return [(score, product) for score, product in ranked_results]
+    return encode_queries([expanded_query_text])
+
+def candidate_vectors(candidates=None):
+    """(vectors, inverse norms) of the candidate vector store rows (all the products if None)."""
+    engine = get_engine()
+    if candidates is None:
+        return engine.product_vectors, engine.exact_index.inv_norms
+    return engine.product_vectors[candidates], engine.exact_index.inv_norms[candidates]
+
+def semantic_scores(query, expanded_query_tokens=None, candidates=None):
+    """
+    Return the normalized semantic score of every product, as an array indexed by the vector store row,
+    or only of the `candidates` rows (only those vectors are read) if given.
+    """
+    vectors, inv_norms = candidate_vectors(candidates)
+    query_vector = normalize_queries(embed_query(query, expanded_query_tokens))[0]
+    with stage("cosine_similarity"):
+        similarities = (vectors @ query_vector) * inv_norms
+    return min_max_normalize(similarities)
+
+def semantic_batch_scores(expanded_query_texts, batch_size=64, candidates=None):
+    """Return the normalized semantic scores of many (already expanded) queries, one row per query (and per candidate)."""
+    # One encode call for all the queries, then one matrix product with all the (candidate) product embeddings
+    vectors, inv_norms = candidate_vectors(candidates)
+    query_vectors = normalize_queries(encode_queries(list(expanded_query_texts), batch_size))
+    with stage("cosine_similarity"):
+        similarities = (query_vectors @ vectors.T) * inv_norms
+    if similarities.shape[1] == 0:  # No candidate (e.g. the filters match no product)
+        return similarities
+
+    min_scores = similarities.min(axis=1, keepdims=True)
+    max_scores = similarities.max(axis=1, keepdims=True)
+    spread = np.where(max_scores > min_scores, max_scores - min_scores, np.inf)
+    return (similarities - min_scores) / spread
+
+def semantic_statistics(queries_file=CALIBRATION_QUERIES_FILE, sample_size=CALIBRATION_SAMPLE, seed=0):
+    """
+    Distribution of the per-query minimum cosine over the catalogue, estimated once (on first use) with the queries
+    of `queries_file` (or a sample of the products as pseudo-queries if there is no such file). The queries should
+    not be the ones the search is evaluated on.
+    """
+    def compute():
+        engine = get_engine()
+        vectors, inv_norms = engine.product_vectors, engine.exact_index.inv_norms
+        if queries_file is not None and os.path.exists(queries_file):
+            with open(queries_file, "r", encoding="utf-8") as f:
+                texts = [" ".join(preprocess_query(query)) for query in json.load(f)[:sample_size]]
+            queries = normalize_queries(encode_queries(texts))
+            source = f"queries of {queries_file}"
+        else:
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False))
+            queries = normalize_queries(vectors[sample])
+            source = "product pseudo-queries"
+        minimums = np.concatenate([
+            ((queries[start:start + 256] @ vectors.T) * inv_norms).min(axis=1)
+            for start in range(0, len(queries), 256)
+        ])
+        return {"min_mean": float(minimums.mean()), "min_std": float(minimums.std()), "sample_size": len(queries),
+                "source": source}
+    return get_engine().load("semantic_statistics", compute)
+
+def semantic_search(query, top_k=None, exact=False):
+    """
+    Perform semantic search using cosine similarity with normalized scores.
+
+    :param query: Query string
+    :param top_k: Number of results to return (None = all products, ranked exactly)
+    :param exact: Use the brute-force search even when top_k is set (to validate the ANN results)
+    :return: List of (score, product info), best first
+    """
+    product_info = get_engine().vector_store.product_info
+
+    if top_k is None or exact:
+        # Cosine similarity with all product embeddings, only the top_k are sorted
+        normalized_scores = semantic_scores(query)
+        ids = top_k_indices(normalized_scores, top_k)
+        return [(normalized_scores[i], product_info[i]) for i in ids]
+
+    # Cosine similarity with the ANN candidates only
+    similarities, ids = get_engine().ann_index.search(embed_query(query), top_k)
+    similarities, ids = similarities[0][ids[0] >= 0], ids[0][ids[0] >= 0]
+
+    # Same min-max scale as the exact search : the maximum is the best candidate, the minimum over the catalogue is
+    # estimated once, and can't be above a cosine seen (a min-max over the top_k alone would give 0 to the last result)
+    low = min(semantic_statistics()["min_mean"], similarities.min(initial=1.0))
+    high = similarities.max(initial=-1.0)
+    scores = np.clip((similarities - low) / (high - low), 0.0, 1.0) if high > low else np.zeros(len(ids))
+    return [(score, product_info[i]) for score, i in zip(scores, ids)]
 
 if __name__ == "__main__":
     # Example search
@@ -0,0 +1,330 @@
+import os
+import sys
+import json
+import zlib
+import threading
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+from inverted_index import load_inverted_index, save_inverted_index
+from ann_index import inverse_norms, normalize_queries
+from ranking import top_k_indices
+from search_cache import file_version
+from search_engine import get_engine
+
+# Number of shards (one worker process each) and where they are saved
+NUM_SHARDS = 4
+SHARDS_DIR = "shards/"
+
+# Per-shard arrays saved next to the shard's lexical index
+SHARD_ARRAYS = ("rows", "lexical_positions", "semantic_ids", "semantic_positions", "price_scores", "review_scores")
+
+
+def shard_of(product_id, num_shards=NUM_SHARDS):
+    """Shard of a product, from a hash of its id (crc32, the same in every process, unlike hash())."""
+    return zlib.crc32(str(product_id).encode("utf-8")) % num_shards
+
+
+def shards_version(engine):
+    """Version of the files the shards are built from (they are rebuilt when it changes)."""
+    return file_version(
+        os.path.join(engine.index_dir, "meta.json"),
+        os.path.join(engine.store_dir, "meta.json"),
+        engine.products_file
+    )
+
+
+def build_shards(num_shards=NUM_SHARDS, shards_dir=SHARDS_DIR, engine=None):
+    """
+    Split the catalogue into shards by product_id hash. Each shard gets its own lexical index (with the statistics of
+    the whole catalogue, so scores don't change), the rows of its products and their globally normalized price and
+    review scores. The vectors are not copied : the coordinator puts them in shared memory.
+    """
+    engine = engine or get_engine()
+    catalogue = engine.catalogue
+    assignment = np.array([shard_of(product_id, num_shards) for product_id in catalogue["products"].column("product_id")],
+                          dtype=np.int64)
+
+    counts = []
+    for shard in range(num_shards):
+        rows = np.flatnonzero(assignment == shard)
+
+        # Shard lexical doc j is the product at position lexical_positions[j] among the shard rows
+        lexical_ids = catalogue["lexical_ids"][rows]
+        lexical_positions = np.flatnonzero(lexical_ids >= 0)
+        lexical_positions = lexical_positions[np.argsort(lexical_ids[lexical_positions], kind="stable")]
+        semantic_ids = catalogue["semantic_ids"][rows]
+        semantic_positions = np.flatnonzero(semantic_ids >= 0)
+
+        directory = os.path.join(shards_dir, f"shard_{shard}")
+        save_inverted_index(engine.lexical_index.shard(lexical_ids[lexical_positions]), os.path.join(directory, "lexical_index"))
+        arrays = {
+            "rows": rows,
+            "lexical_positions": lexical_positions,
+            "semantic_ids": semantic_ids[semantic_positions],  # Vector store rows
+            "semantic_positions": semantic_positions,
+            "price_scores": catalogue["price_scores"][rows],
+            "review_scores": catalogue["review_scores"][rows],
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        counts.append(len(rows))
+
+    # meta.json is written last, so its presence means the shards are complete
+    meta = {"num_shards": num_shards, "counts": counts, "version": shards_version(engine)}
+    with open(os.path.join(shards_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=4)
+    return meta
+
+
+def load_or_build_shards(num_shards=NUM_SHARDS, shards_dir=SHARDS_DIR, engine=None):
+    """Return the shards meta, (re)building them if missing, split differently or older than the indexes."""
+    engine = engine or get_engine()
+    meta_file = os.path.join(shards_dir, "meta.json")
+    if os.path.exists(meta_file):
+        with open(meta_file, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["num_shards"] == num_shards and meta["version"] == shards_version(engine):
+            return meta
+    return build_shards(num_shards, shards_dir, engine)
+
+
+def min_max(values, mask=None):
+    """(min, max) of each row (over the masked values only), +inf / -inf for rows without any value."""
+    if values.shape[1] == 0:  # Empty shard
+        return np.full(len(values), np.inf), np.full(len(values), -np.inf)
+    if mask is None:
+        mask = np.ones(values.shape, dtype=bool)
+    return np.where(mask, values, np.inf).min(axis=1), np.where(mask, values, -np.inf).max(axis=1)
+
+
+def normalize_rows(values, mins, maxs, mask=None):
+    """Min-max normalize each row with the given (global) bounds, like `min_max_normalize` : 0 when min == max."""
+    spread = np.where(maxs > mins, maxs - mins, np.inf)[:, None]
+    mins = np.where(np.isfinite(mins), mins, 0.0)  # Queries without any match (every value is masked)
+    normalized = (values - mins[:, None]) / spread
+    return normalized if mask is None else np.where(mask, normalized, 0.0)
+
+
+class ShardWorker:
+    """Scores the products of one shard : raw scores first (to get the global bounds), then the shard's top k."""
+
+    def __init__(self, directory, vectors):
+        self.index = load_inverted_index(os.path.join(directory, "lexical_index"))
+        for name in SHARD_ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy")))
+        self.vectors = vectors  # This shard's rows of the shared vector block
+        self.inv_norms = inverse_norms(vectors)
+        self.pending = None  # Raw scores of the last batch, kept for its second phase
+
+    def raw_scores(self, token_lists, query_vectors):
+        """Score a batch, keep the raw scores and return the (min, max) of both methods for each query."""
+        tfidf_scores, bm25_scores = self.index.score_batch(token_lists)
+        lexical = 0.5 * tfidf_scores.toarray() + 0.5 * bm25_scores.toarray()
+        matches = tfidf_scores.toarray() > 0  # Products sharing at least one token with the query
+        semantic = (query_vectors @ self.vectors.T) * self.inv_norms
+        self.pending = (lexical, matches, semantic)
+        return min_max(lexical, matches) + min_max(semantic)
+
+    def top_k(self, bounds, weights, k):
+        """
+        Fuse the pending scores with the global bounds, return (final, lexical, semantic, review, price scores, product
+        rows) of the k best of each query.
+        """
+        lexical_min, lexical_max, semantic_min, semantic_max = bounds
+        lambda_lexical, lambda_semantic, lambda_reviews, lambda_price = weights
+        raw_lexical, matches, raw_semantic = self.pending
+        self.pending = None
+
+        shape = (len(raw_lexical), len(self.rows))
+        lexical = np.zeros(shape)
+        lexical[:, self.lexical_positions] = normalize_rows(raw_lexical, lexical_min, lexical_max, matches)
+        semantic = np.zeros(shape)
+        semantic[:, self.semantic_positions] = normalize_rows(raw_semantic, semantic_min, semantic_max)
+        final = (
+            lambda_lexical * lexical +
+            lambda_semantic * semantic +
+            lambda_price * self.price_scores +
+            lambda_reviews * self.review_scores
+        )
+
+        results = []
+        for q in range(len(final)):
+            best = top_k_indices(final[q], k)
+            results.append((final[q, best], lexical[q, best], semantic[q, best], self.review_scores[best],
+                            self.price_scores[best], self.rows[best]))
+        return results
+
+
+def shard_process(directory, memory_name, shape, start, count, connection):
+    """Worker process : attach the shared vectors, load the shard, answer the coordinator's commands until None."""
+    memory = shared_memory.SharedMemory(name=memory_name)
+    worker = ShardWorker(directory, np.ndarray(shape, dtype=np.float32, buffer=memory.buf)[start:start + count])
+    connection.send("ready")
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        command, arguments = message
+        try:
+            connection.send(getattr(worker, command)(*arguments))
+        except Exception as error:  # Sent back, the coordinator raises it
+            connection.send(error)
+    del worker  # Release the view before closing the block
+    memory.close()
+
+
+class ShardedSearch:
+    """
+    Hybrid search scattered over worker processes, one per shard (all the cores, one memory space per shard).
+
+    Queries are tokenized, expanded and embedded once by the coordinator. Each query then takes two round trips :
+    the shards return the min / max of their raw lexical and semantic scores, and once the global bounds are known
+    (the same as a single-process min-max over all the products), each shard returns its top k, merged here.
+
+    The workers keep the raw scores of a batch between both round trips, so batches are searched one at a time (a lock
+    makes concurrent calls wait) : send many queries in one batch rather than calling from many threads. The coordinator
+    only reads the memory-mapped product store, never the whole catalogue or the whole vector matrix.
+    """
+
+    def __init__(self, num_shards=NUM_SHARDS, shards_dir=SHARDS_DIR, engine=None):
+        self.num_shards = num_shards
+        self.shards_dir = shards_dir
+        self.engine = engine or get_engine()
+        self.processes = []
+        self.connections = []
+        self.memory = None
+        self.lock = threading.Lock()  # One batch at a time : the workers keep its raw scores between both phases
+
+    def start(self):
+        """Build the shards if needed, copy the vectors to shared memory (grouped by shard) and start the workers."""
+        load_or_build_shards(self.num_shards, self.shards_dir, self.engine)
+        directories = [os.path.join(self.shards_dir, f"shard_{shard}") for shard in range(self.num_shards)]
+        semantic_ids = [np.load(os.path.join(directory, "semantic_ids.npy")) for directory in directories]
+
+        vector_store = self.engine.vector_store  # Read shard by shard (no float32 copy of all the vectors)
+        shape = (sum(len(ids) for ids in semantic_ids), vector_store.dim)
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 4))
+        vectors = np.ndarray(shape, dtype=np.float32, buffer=self.memory.buf)
+
+        context = multiprocessing.get_context("spawn")  # No fork of the coordinator's threads
+        start = 0
+        for directory, ids in zip(directories, semantic_ids):
+            vectors[start:start + len(ids)] = vector_store.float_rows(ids)
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=shard_process, daemon=True, name=f"search-{os.path.basename(directory)}",
+                                      args=(directory, self.memory.name, shape, start, len(ids), child_connection))
+            process.start()
+            self.processes.append(process)
+            self.connections.append(connection)
+            start += len(ids)
+        del vectors
+
+        for shard in range(self.num_shards):
+            self.receive(shard)
+        return self
+
+    def receive(self, shard):
+        """Answer of a shard (raises its error, or RuntimeError if its process died)."""
+        connection, process = self.connections[shard], self.processes[shard]
+        while not connection.poll(0.1):
+            if not process.is_alive():
+                raise RuntimeError(f"Shard {shard} worker stopped (exit code {process.exitcode})")
+        result = connection.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def scatter(self, command, *arguments):
+        """Send a command to every shard (they work in parallel), return their answers."""
+        for connection in self.connections:
+            connection.send((command, arguments))
+        return [self.receive(shard) for shard in range(self.num_shards)]
+
+    def search_batch(self, queries, top_n=10, lambda_lexical=0.4, lambda_semantic=0.4, lambda_reviews=0.1, lambda_price=0.1):
+        """Same results as `hybrid_search_batch` (without filters), computed by the shards."""
+        from lexical_search import preprocess_query
+        from semantic_search import encode_queries
+
+        token_lists = [preprocess_query(query) for query in queries]
+        query_vectors = normalize_queries(encode_queries([" ".join(tokens) for tokens in token_lists]))
+
+        weights = (lambda_lexical, lambda_semantic, lambda_reviews, lambda_price)
+        with self.lock:
+            # Phase 1 : global min / max of the raw scores of each query
+            shard_bounds = np.array(self.scatter("raw_scores", token_lists, query_vectors))  # (shards, 4, queries)
+            bounds = (shard_bounds[:, 0].min(axis=0), shard_bounds[:, 1].max(axis=0),
+                      shard_bounds[:, 2].min(axis=0), shard_bounds[:, 3].max(axis=0))
+
+            # Phase 2 : top k of each shard with the global bounds, merged
+            shard_results = self.scatter("top_k", bounds, weights, top_n)
+
+        products = self.engine.product_store
+        prices = products.column("price ($)")
+        all_results = []
+        for q in range(len(queries)):
+            final, lexical, semantic, reviews, price_scores, rows = (
+                np.concatenate(arrays) for arrays in zip(*(shard[q] for shard in shard_results))
+            )
+            order = np.lexsort((rows, -final))[:top_n]  # Ties in catalogue order, like a single-process search
+            all_results.append([
+                (final[i], lexical[i], semantic[i], reviews[i], price_scores[i], prices[r], products[r])
+                for i, r in zip(order, rows[order])
+            ])
+        return all_results
+
+    def search(self, query, top_n=10, **weights):
+        return self.search_batch([query], top_n, **weights)[0]
+
+    def close(self):
+        """Stop the workers and free the shared memory."""
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+        self.processes, self.connections = [], []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def compare_with_hybrid(sharded, queries, top_n=10, tolerance=1e-5):
+    """
+    Check that the sharded search gives the same ranking as `hybrid_search_batch` : same score at every rank
+    (products may only swap places when their scores are tied within `tolerance`).
+
+    :return: The queries ranked differently
+    """
+    from hybrid_search import hybrid_search_batch
+
+    mismatches = []
+    expected = hybrid_search_batch(queries, top_n=top_n)
+    for query, single, scattered in zip(queries, expected, sharded.search_batch(queries, top_n)):
+        if len(single) != len(scattered) or any(abs(a[0] - b[0]) > tolerance for a, b in zip(single, scattered)):
+            mismatches.append(query)
+    return mismatches
+
+
+if __name__ == "__main__":
+    # python sharded_search.py [number of shards] : compare the sharded search with the single-process one
+    num_shards = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_SHARDS
+    with open("queries.json", "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    with ShardedSearch(num_shards) as sharded:
+        mismatches = compare_with_hybrid(sharded, queries)
+    if mismatches:
+        print(f"⚠️ {len(mismatches)} queries ranked differently by the {num_shards} shards: {mismatches}")
+    else:
+        print(f"✅ {num_shards} shards give the same top 10 as the single-process search for {len(queries)} queries.")
@@ -0,0 +1,111 @@
+import os
+import json
+from functools import lru_cache
+from nltk.corpus import wordnet  # Lazy : the corpus is only read on the first WordNet lookup
+from search_metrics import stage
+
+# File paths
+TOKENIZED_FILE = "tokenized_products.json"
+COUNTRY_SYNONYMS_FILE = "initial_index_files/origin_synonyms.json"
+SYNONYMS_FILE = "synonyms_table.json"
+
+MAX_SYNONYMS = 3  # WordNet synonyms kept per term
+FALLBACK_CACHE_SIZE = 100_000  # Memoized WordNet lookups for terms outside the table
+
+
+@lru_cache(maxsize=FALLBACK_CACHE_SIZE)
+def wordnet_synonyms(word):
+    """Retrieve up to 3 synonyms for a given word using WordNet (memoized)."""
+    synonyms = set()
+    for synset in wordnet.synsets(word):
+        for lemma in synset.lemmas():
+            synonyms.add(lemma.name().replace("_", " "))  # Convert to readable format
+
+    return tuple(sorted(synonyms)[:MAX_SYNONYMS])  # **Sort synonyms to make results stable**
+
+
+def build_synonym_table(vocabulary):
+    """Precompute term -> WordNet synonyms for the whole vocabulary."""
+    return {term: list(wordnet_synonyms(term)) for term in vocabulary}
+
+
+def load_country_synonyms(path=COUNTRY_SYNONYMS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_synonym_table(table, path=SYNONYMS_FILE):
+    """Save the table as compact JSON (terms without synonyms are kept, to know they were looked up)."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(table, f, separators=(",", ":"), ensure_ascii=False)
+
+
+def load_synonym_table(path=SYNONYMS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class SynonymService:
+    """
+    O(1) synonym lookups in the precomputed table, with a memoized WordNet fallback for unknown terms.
+    The country synonyms of `origin_synonyms.json` are kept apart : they are only added to the products (index side),
+    the queries are expanded with WordNet only.
+    """
+
+    def __init__(self, table, country_synonyms):
+        self.table = table
+        self.country_synonyms = country_synonyms
+
+    def get_synonyms(self, word):
+        synonyms = self.table.get(word)
+        if synonyms is None:
+            synonyms = wordnet_synonyms(word)
+        return list(synonyms)
+
+    def get_country_synonyms(self, word):
+        return list(self.country_synonyms.get(word, ()))
+
+
+synonym_service = None  # Loaded on first use
+
+
+def get_synonym_service(path=SYNONYMS_FILE):
+    """Return the shared synonym service (table loaded once, WordNet only as a fallback if there is no table)."""
+    global synonym_service
+    if synonym_service is None:
+        # No precomputed table yet : everything goes through WordNet
+        table = load_synonym_table(path) if os.path.exists(path) else {}
+        synonym_service = SynonymService(table, load_country_synonyms())
+    return synonym_service
+
+
+def get_synonyms(word):
+    """Retrieve the WordNet synonyms of a word (query expansion and product titles)."""
+    return get_synonym_service().get_synonyms(word)
+
+
+def get_country_synonyms(word):
+    """Retrieve the synonyms of a country from `origin_synonyms.json` (products only, not the queries)."""
+    return get_synonym_service().get_country_synonyms(word)
+
+
+def expand_query(query_tokens):
+    """Expand the query tokens with their synonyms (shared by the lexical and the semantic search)."""
+    with stage("expand_query"):
+        expanded_tokens = query_tokens[:]
+        for token in query_tokens:
+            expanded_tokens.extend(get_synonyms(token))
+
+    return sorted(expanded_tokens)  # **Sorting ensures stable results**
+
+
+if __name__ == "__main__":
+    from inverted_index import product_fields
+
+    # Precompute the table for all the terms of the tokenized products
+    with open(TOKENIZED_FILE, "r", encoding="utf-8") as f:
+        vocabulary = sorted({token for product in json.load(f) for tokens in product_fields(product).values() for token in tokens})
+    table = build_synonym_table(vocabulary)
+    save_synonym_table(table, SYNONYMS_FILE)
+
+    print(f"✅ Synonyms of {len(table)} terms saved in {SYNONYMS_FILE}.")
@@ -0,0 +1,393 @@
+import re
+import sys
+import json
+import time
+import random
+from functools import lru_cache
+from search_engine import get_engine
+from search_metrics import stage
+
+# Shared analyzer of the product texts and the queries : lowercase, tokenize, keep the alphanumeric tokens, remove
+# the stop words and lemmatize. It re-implements NLTK's pipeline (word_tokenize + isalnum + stop words + WordNet)
+# without running the ~30 regular expressions of the Treebank tokenizer on every text : only the alphanumeric runs
+# are found (one compiled regex), and the few rules that can glue a run to its neighbours are checked around it.
+# "python text_analyzer.py --check" compares both pipelines and fails on any difference.
+
+# Version of the tokens the analyzer gives : bump it when a change gives other tokens, so that incremental_build.py
+# tokenizes every product again
+ANALYZER_VERSION = 2
+
+# Lemmas already computed (the vocabulary is small compared to the number of words analyzed), and sentence break
+# decisions of Punkt around a period (a word and the token after it)
+LEMMA_CACHE_SIZE = 200_000
+PUNKT_CACHE_SIZE = 100_000
+
+# Alphanumeric runs (\w without the underscore = the characters for which str.isalnum() is true)
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+# Characters the Treebank tokenizer always surrounds with spaces (brackets, quotes, ?!;@#$%&*, unicode dashes),
+# and the ones among them padded before an apostrophe followed by a space is split from its word
+SEPARATORS = frozenset(";@#$%&?!*[](){}<>\"`«“‘„»”’‒–—―")
+EARLY_SEPARATORS = frozenset(";@#$%&?!`«“‘„‒–—―")
+
+# After the last period of a sentence : closing quotes or brackets, split from the period with it
+CLOSERS = frozenset("])}>\"'»”’")
+
+# Clitics an opening apostrophe stays attached to ('s, 're, ...), and the ones split from the previous word (in two
+# passes : "'s", "'m", "'d" or a lone apostrophe, then "'ll", "'re", "'ve")
+CLITICS = frozenset(("re", "ve", "ll", "m", "t", "s", "d", "n"))
+SHORT_CLITICS = ("s", "m", "d", "")
+LONG_CLITICS = ("ll", "re", "ve")
+
+# Words the Treebank tokenizer splits in two wherever they are ("cannot" -> "can not", ...), and the words it
+# splits from a following "'ye" / "'n" ("d'ye" -> "d 'ye")
+CONTRACTIONS = {"cannot": ("can", "not"), "gimme": ("gim", "me"), "gonna": ("gon", "na"),
+                "gotta": ("got", "ta"), "lemme": ("lem", "me"), "wanna": ("wan", "na")}
+APOSTROPHE_CONTRACTIONS = {"d": "'ye", "more": "'n"}
+
+# The space put after those splits turns a glued "'tis" / "'twas" into a contraction ("cannot'tis" -> "can not 't is")
+SPACED_CONTRACTIONS = ("cannot", "gimme", "gonna", "gotta", "lemme", "d'ye", "more'n")
+T_CONTRACTIONS = {"tis": "is", "twas": "was"}
+
+# Sentence splitting (Punkt) : a period followed by a space or a punctuation mark may end the sentence. The English
+# Punkt model of NLTK decides it from the word of the period and the token after it (abbreviations, initials, numbers,
+# collocations, orthographic context), it is asked directly (and memoized). When it ends the sentence, the period is
+# the last one of its sentence, and the Treebank tokenizer splits it from the word before.
+PUNKT_NON_WORD = r"[)\";}\]\*:@\'\({\[‘’“”«»!?]"  # Punctuation Punkt splits from the words
+SENTENCE_END_PATTERN = re.compile(rf"[.?!](?={PUNKT_NON_WORD}|\s+\S)")  # Potential sentence ends
+NEXT_TOKEN_PATTERN = re.compile(r"\s+\S+")
+REALIGNMENT_PATTERN = re.compile(r"[\"\')\]}‘’“”«»]+?(?:\s+|(?=--)|$)")  # Closing marks kept in the sentence
+OPENING_QUOTE_PATTERN = re.compile(r" (?:\"|'')")
+
+# Random strings of the parity check : words, abbreviations, numbers and contractions mixed with punctuation
+RANDOM_WORDS = ("shoes", "Mr", "e.g", "U.S", "i.e", "etc", "dr", "St", "vs", "inc", "co", "jan", "No", "5", "5.50",
+                "1,000", "3", "a", "I", "it", "don", "can", "cannot", "gonna", "gimme", "wanna", "lemme", "'tis",
+                "twas", "d'ye", "more'n", "s", "t", "ll", "re", "ve", "m", "d", "n", "n't", "'s", "'re", "'ll",
+                "O'Neil", "rock'n'roll", "café", "naïve", "x2", "A1", "hello", "world", "The", "what", "who")
+RANDOM_PUNCTUATION = tuple(".,;:!?'\"()[]{}<>-–—…/\\@#$%&*+=_`~^|«»“”‘’") + ("...", "--", "''", "``", ". .", "..", "?!")
+RANDOM_SPACES = (" ", " ", " ", "", "", "\n", "\t", "  ")
+RANDOM_CHECK_TEXTS = 20_000
+
+
+def run_length(text, end, character):
+    """Number of consecutive `character` in `text` ending at position `end` (included)."""
+    start = end
+    while start >= 0 and text[start] == character:
+        start -= 1
+    return end - start
+
+
+@lru_cache(maxsize=PUNKT_CACHE_SIZE)
+def punkt_break(context):
+    """Whether Punkt ends a sentence inside `context` (a word ending with a period and the token after it)."""
+    return get_engine().sentence_tokenizer.text_contains_sentbreak(context)
+
+
+def ends_sentence(text, position):
+    """Whether Punkt ends a sentence at the period at `position` (on lowercase text)."""
+    if not SENTENCE_END_PATTERN.match(text, position):
+        return False
+    # A later potential end in the same word takes the break (if any)
+    end = position + 1
+    while end < len(text) and not text[end].isspace():
+        if text[end] in ".?!" and SENTENCE_END_PATTERN.match(text, end):
+            return False
+        end += 1
+
+    # Punkt decides on the word of the period and the token after it
+    start = position
+    while start > 0 and not text[start - 1].isspace():
+        start -= 1
+    following = NEXT_TOKEN_PATTERN.match(text, position + 1)
+    context = text[start:position + 1] + (following.group() if following else text[position + 1])
+    return punkt_break(context)
+
+
+def final_period(text, position):
+    """Whether the period at `position` is the last one of its sentence (only closing quotes or brackets follow)."""
+    if ends_sentence(text, position):
+        # The closing marks after the period stay in the sentence
+        start = position + 1
+        while start < len(text) and text[start].isspace():
+            start += 1
+        closing = REALIGNMENT_PATTERN.match(text, start)
+        end = start + len(closing.group().rstrip()) if closing else position + 1
+    else:
+        end = len(text)
+    after = text[position + 1:end].rstrip()
+    # A double quote after a space opens a quotation (``) : the period is not the last token of the sentence
+    return all(character in CLOSERS or character == " " for character in after) \
+        and OPENING_QUOTE_PATTERN.search(after) is None
+
+
+def early_boundary(text, position):
+    """Whether a space is before `position` when the Treebank tokenizer splits the apostrophes followed by a space."""
+    if position >= len(text):
+        return False
+    character = text[position]
+    if character.isspace():
+        # Only a real space counts (the other whitespace is replaced later), not the trailing spaces (stripped)
+        return character == " " and not text[position:].isspace()
+    if character in EARLY_SEPARATORS:
+        return True
+    if character in ",:":
+        return position + 1 == len(text) or not text[position + 1].isdecimal()
+    if character == ".":
+        return text[position + 1:position + 2] == "." or (text[position - 1] != "." and final_period(text, position))
+    return False
+
+
+def is_boundary(text, position, apostrophes=True):
+    """
+    Whether a token of the Treebank tokenizer ends just before `position` (i.e. a space is there after it).
+
+    :param apostrophes: Whether any apostrophe split from the token before it counts (False for the clitics' pass :
+                        only the apostrophes followed by a space, split before it, count)
+    """
+    if position >= len(text) or text[position].isspace() or early_boundary(text, position):
+        return True
+    character = text[position]
+    if character in SEPARATORS:
+        return True
+    if character == "-":
+        return text[position + 1:position + 2] == "-"
+    if character == "'":
+        if text[position + 1:position + 2] == "'" or (text[position - 1] != "'" and early_boundary(text, position + 1)):
+            return True
+        return apostrophes and apostrophe_boundary(text, position)
+    return False
+
+
+def apostrophe_boundary(text, position):
+    """Whether the apostrophe at `position` (after a word) is split from the word, alone or with 's / 'm / 'd."""
+    if early_boundary(text, position + 1):
+        return True
+    return any(text.startswith(clitic, position + 1) and is_boundary(text, position + 1 + len(clitic), False)
+               for clitic in SHORT_CLITICS)
+
+
+def left_boundary(text, start, word):
+    """Whether the Treebank tokenizer splits the alphanumeric run `word` at `start` from the character before it."""
+    if start == 0:
+        return True
+    character = text[start - 1]
+    if character.isspace() or character in SEPARATORS:
+        return True
+    if character in ",:":
+        # ",:" followed by a non-digit are padded in pairs, from the beginning of a run like ",,"
+        run = 1
+        while start - 1 - run >= 0 and text[start - 1 - run] in ",:":
+            run += 1
+        return run % 2 == 1 and not word[0].isdecimal()
+    if character == ".":
+        return run_length(text, start - 1, ".") >= 2  # Ellipsis
+    if character == "-":
+        run = run_length(text, start - 1, "-")
+        return run >= 2 and run % 2 == 0  # "--" are padded in pairs
+    if character == "'":
+        run = run_length(text, start - 1, "'")
+        if run % 2 == 0:  # "''" (closing double quote)
+            return True
+        if run == 1 and start >= 2 and (text[start - 2].isalnum() or text[start - 2] == "_"):
+            return False  # Inside a word (o'clock, rock'n'roll) or a clitic ('s, n't) split from the previous word
+        # Opening quote, unless it begins a clitic ('s, 're, ...)
+        return not (word in CLITICS and text[start + len(word):start + len(word) + 1] != "_")
+    return False
+
+
+def right_boundary(text, end, word):
+    """
+    Whether the Treebank tokenizer splits the alphanumeric run `word` ending at `end` from what follows it.
+
+    :return: The token kept for the run ("do" for "don't"), None if the run is not a token
+    """
+    if end == len(text):
+        return word
+    character = text[end]
+    if character.isspace() or character in SEPARATORS:
+        return word
+    if character in ",:":
+        return word if end + 1 == len(text) or not text[end + 1].isdecimal() else None
+    if character == ".":
+        return word if text[end + 1:end + 2] == "." or final_period(text, end) else None
+    if character == "-":
+        return word if text[end + 1:end + 2] == "-" else None
+    if character == "'":
+        if text[end + 1:end + 2] == "'" or apostrophe_boundary(text, end):
+            return word
+        if any(text.startswith(clitic, end + 1) and is_boundary(text, end + 1 + len(clitic)) for clitic in LONG_CLITICS):
+            return word
+        if word.endswith("n") and text.startswith("t", end + 1) and is_boundary(text, end + 2):
+            return word[:-1] or None  # "don't" -> "do" + "n't"
+    return None
+
+
+def word_boundary(text, position):
+    """Whether the regex \\b matches at `position`, next to an alphanumeric character (only "_" is another \\w)."""
+    return position <= 0 or position >= len(text) or not (text[position - 1] == "_" or text[position] == "_")
+
+
+def word_tokens(text):
+    """Alphanumeric tokens of a (lowercase) text, the same as [w for w in word_tokenize(text) if w.isalnum()]."""
+    tokens = []
+    length = len(text)
+    for match in WORD_PATTERN.finditer(text):
+        start, end = match.span()
+        word = match.group()
+        before = text[start - 1] if start else " "
+        after = text[end] if end < length else " "
+        # Most words are between spaces / usual punctuation, the other rules are only checked when needed
+        if (before.isspace() or before in SEPARATORS) and (after.isspace() or after in SEPARATORS):
+            tokens.extend(CONTRACTIONS.get(word, (word,)))
+        elif word in CONTRACTIONS or word in APOSTROPHE_CONTRACTIONS or word[:-1] in CONTRACTIONS:
+            tokens.extend(contraction_tokens(text, start, end, word))
+        elif before == "'" and (word in T_CONTRACTIONS or word[:-1] in T_CONTRACTIONS) \
+                and spaced_contraction(text, start - 1):
+            # "'tis" / "'twas" glued to a split contraction, alone or before a "n't" ("lemme'tisn't" -> "is")
+            token = (word if after != "_" else None) if word in T_CONTRACTIONS else right_boundary(text, end, word)
+            if token in T_CONTRACTIONS:
+                tokens.append(T_CONTRACTIONS[token])
+        elif left_boundary(text, start, word):
+            token = right_boundary(text, end, word)
+            if token is not None:
+                tokens.append(token)
+    return tokens
+
+
+def spaced_contraction(text, end):
+    """Whether a contraction the Treebank tokenizer splits (and follows with a space) ends at `end` ("cannot", "d'ye")."""
+    for contraction in SPACED_CONTRACTIONS:
+        start = end - len(contraction)
+        if start >= 0 and text.startswith(contraction, start) \
+                and (start == 0 or not (text[start - 1].isalnum() or text[start - 1] == "_")):
+            return True
+    return False
+
+
+def contraction_tokens(text, start, end, word):
+    """Tokens of a run that the Treebank tokenizer may split as a contraction, whatever its neighbours."""
+    token = right_boundary(text, end, word)
+    if word_boundary(text, start):
+        if word in CONTRACTIONS and (token == word if word == "wanna" else word_boundary(text, end)):
+            return CONTRACTIONS[word]
+        if token in CONTRACTIONS and token != word:  # "cannotn't" -> "cannot n't"
+            return CONTRACTIONS[token]
+        clitic = APOSTROPHE_CONTRACTIONS.get(word)
+        following = WORD_PATTERN.match(text, end + 1) if clitic and text.startswith("'", end) else None
+        if following and (following.group() == clitic[1:] and word_boundary(text, following.end())
+                          or right_boundary(text, following.end(), following.group()) == clitic[1:]):
+            return (word,)
+    if token is not None and left_boundary(text, start, word):
+        return (token,)
+    return ()
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(word):
+    """WordNet lemma of a word (memoized)."""
+    return get_engine().lemmatizer.lemmatize(word)
+
+
+def analyze(text):
+    """Tokenize, remove stopwords, and lemmatize."""
+    stop_words = get_engine().stop_words
+    with stage("tokenize"):
+        return [lemmatize(w) for w in word_tokens(text.lower()) if w not in stop_words]
+
+
+def analyze_many(texts):
+    """Tokens of many texts (bulk indexing) : the same as [analyze(text) for text in texts]."""
+    stop_words = get_engine().stop_words
+    return [[lemmatize(w) for w in word_tokens(text.lower()) if w not in stop_words] for text in texts]
+
+
+def nltk_analyze(text):
+    """Reference pipeline (NLTK word_tokenize), used to check the analyzer."""
+    from nltk.tokenize import word_tokenize
+    engine = get_engine()
+    lemmatizer, stop_words = engine.lemmatizer, engine.stop_words
+    words = [w for w in word_tokenize(text.lower()) if w.isalnum()]
+    return [lemmatizer.lemmatize(w) for w in words if w not in stop_words]
+
+
+def parity_report(texts, max_examples=10):
+    """
+    Compare the analyzer with the NLTK pipeline on some texts.
+
+    :return: {"texts": number of texts, "identical": share of texts with the same tokens,
+             "examples": up to `max_examples` (text, NLTK tokens, analyzer tokens) that differ}
+    """
+    texts = list(texts)
+    examples, identical = [], 0
+    for text in texts:
+        expected, tokens = nltk_analyze(text), analyze(text)
+        if expected == tokens:
+            identical += 1
+        elif len(examples) < max_examples:
+            examples.append((text, expected, tokens))
+    return {"texts": len(texts), "identical": identical / max(len(texts), 1), "examples": examples}
+
+
+def random_texts(count, seed=0):
+    """`count` random strings of words and punctuation (the same ones for a given seed)."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 12)):
+            parts.append(rng.choice(RANDOM_WORDS) if rng.random() < 0.55 else rng.choice(RANDOM_PUNCTUATION))
+            parts.append(rng.choice(RANDOM_SPACES))
+        texts.append("".join(parts))
+    return texts
+
+
+def product_texts(input_file="extracted_products.json"):
+    """Text fields of the products of a file (the texts indexed by product_tokenization.py)."""
+    from json_lines import iter_records
+    from product_tokenization import TEXT_FIELDS
+    return [product[field] for product in iter_records(input_file) for field in TEXT_FIELDS]
+
+
+if __name__ == "__main__":
+    # python text_analyzer.py [--check [random texts]] [products file]
+    # Parity with NLTK on the product texts, the queries and seeded random strings (--check : exit code 1 on any
+    # difference, skipped if the NLTK data is not installed), then the speed of both on the products and the queries
+    args = sys.argv[1:]
+    check = args[:1] == ["--check"]
+    if check:
+        args.pop(0)
+        random_count = int(args.pop(0)) if args and args[0].isdigit() else RANDOM_CHECK_TEXTS
+        try:
+            get_engine().nltk_tools
+        except LookupError as error:
+            print(f"⏭️ Parity check skipped : {error}")
+            sys.exit(0)
+
+    texts = product_texts(args[0] if args else "extracted_products.json")
+    with open("queries.json", "r", encoding="utf-8") as f:
+        texts += json.load(f)
+
+    report = parity_report(texts)
+    print(f"\n🔍 ** Analyzer vs NLTK on {report['texts']} product texts and queries : {report['identical']:.2%} identical ** \n")
+    reports = [report]
+    if check:
+        reports.append(parity_report(random_texts(random_count)))
+        print(f"🔍 ** Analyzer vs NLTK on {random_count} random strings : {reports[-1]['identical']:.2%} identical ** \n")
+    for text, expected, tokens in [example for report in reports for example in report["examples"]]:
+        print(f"⚠️ {text[:80]!r}\n   NLTK     : {expected}\n   analyzer : {tokens}")
+    if check:
+        if any(report["examples"] for report in reports):
+            print("❌ The analyzer differs from the NLTK pipeline")
+            sys.exit(1)
+        print("✅ Same tokens as the NLTK pipeline on every text")
+        sys.exit(0)
+
+    start = time.perf_counter()
+    [nltk_analyze(text) for text in texts]
+    nltk_time = time.perf_counter() - start
+
+    lemmatize.cache_clear()  # Cold lemma cache
+    start = time.perf_counter()
+    analyze_many(texts)
+    analyzer_time = time.perf_counter() - start
+    print(f"⏱️ NLTK {nltk_time * 1000:.1f} ms | analyzer {analyzer_time * 1000:.1f} ms ({nltk_time / analyzer_time:.1f}x faster)")
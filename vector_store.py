@@ -0,0 +1,273 @@
+import os
+import json
+import shutil
+import numpy as np
+
+# File paths
+EMBEDDINGS_JSON_FILE = "embeddings_of_products.json"  # Legacy JSON format
+STORE_DIR = "vector_store/"
+
+# Supported storage types for the vectors
+STORE_DTYPES = ("float32", "float16", "int8")
+
+
+class VectorStore:
+    """Product embeddings stored as a memory-mapped matrix, with a side table of product info."""
+
+    def __init__(self, directory, vectors, scales, product_info, meta):
+        self.directory = directory
+        self.vectors = vectors  # (n_products, dim) matrix, float32, float16 or int8
+        self.scales = scales  # One float32 scale per row for int8 vectors, None otherwise
+        self.product_info = product_info  # product_id, url, title, variant for each row
+        self.meta = meta
+        self.dtype = meta["dtype"]
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def float_vectors(self):
+        """Return the vectors as float32 (no copy for a float32 store, dequantized otherwise)."""
+        if self.dtype == "float32":
+            return self.vectors
+        if self.dtype == "float16":
+            return self.vectors.astype(np.float32)
+        return self.vectors.astype(np.float32) * self.scales[:, None]
+
+    def float_rows(self, rows):
+        """Return some rows of the vectors as float32 (only these rows are read and dequantized)."""
+        if self.dtype == "int8":
+            return self.vectors[rows].astype(np.float32) * self.scales[rows, None]
+        return self.vectors[rows].astype(np.float32)
+
+
+def quantize_vectors(vectors, dtype="float32"):
+    """Convert float vectors to the storage type, return (stored vectors, per-row scales or None)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        # Symmetric scalar quantization, one scale per vector
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    raise ValueError(f"Unsupported vector store dtype: {dtype} (expected one of {STORE_DTYPES})")
+
+
+def save_array(path, array):
+    """Save a .npy file through a temporary file, so processes that memory-map the old file are not affected."""
+    temporary_path = path[:-len(".npy")] + ".tmp.npy"
+    np.save(temporary_path, array)
+    os.replace(temporary_path, path)
+
+
+def save_json(path, data, indent=None):
+    """Save a JSON file through a temporary file, so readers never see a partially written file."""
+    temporary_path = path[:-len(".json")] + ".tmp.json"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(temporary_path, path)
+
+
+def write_vector_store(vectors, product_info, directory=STORE_DIR, dtype="float32", model_name=None, backend=None):
+    """Write the vectors as a .npy matrix (+ scales for int8) and the product info as a JSON side table."""
+    if len(vectors) != len(product_info):
+        raise ValueError(f"{len(vectors)} vectors for {len(product_info)} products")
+
+    stored, scales = quantize_vectors(vectors, dtype)
+    os.makedirs(directory, exist_ok=True)
+    save_array(os.path.join(directory, "vectors.npy"), stored)
+    if scales is not None:
+        save_array(os.path.join(directory, "scales.npy"), scales)
+    elif os.path.exists(os.path.join(directory, "scales.npy")):
+        os.remove(os.path.join(directory, "scales.npy"))
+
+    save_json(os.path.join(directory, "products.json"), product_info)
+
+    meta = {"dtype": dtype, "count": int(stored.shape[0]), "dim": int(stored.shape[1]), "model": model_name,
+            "backend": backend}
+    # meta.json is written last, so its presence means the store is complete
+    save_json(os.path.join(directory, "meta.json"), meta, indent=4)
+
+    return load_vector_store(directory)
+
+
+class VectorStoreWriter:
+    """
+    Write a vector store incrementally, batch by batch, with bounded memory : the rows are appended to raw
+    binary files, and the .npy files are assembled (header + copy) when the writer is closed.
+    """
+
+    def __init__(self, directory=STORE_DIR, dtype="float32", model_name=None, backend=None):
+        quantize_vectors(np.zeros((1, 1)), dtype)  # Check the dtype before writing anything
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dtype = dtype
+        self.model_name = model_name
+        self.backend = backend  # Encoder backend of the vectors (the queries must be encoded by the same one)
+        self.count = 0
+        self.dim = None
+        self.vectors_file = open(os.path.join(directory, "vectors.raw"), "wb")
+        self.scales_file = open(os.path.join(directory, "scales.raw"), "wb")
+        self.products_file = open(os.path.join(directory, "products.tmp.json"), "w", encoding="utf-8")
+        self.products_file.write("[")
+
+    def add(self, vectors, product_info):
+        """Append a batch of vectors and the product info of their rows."""
+        if len(vectors) != len(product_info):
+            raise ValueError(f"{len(vectors)} vectors for {len(product_info)} products")
+        if not len(vectors):
+            return
+        stored, scales = quantize_vectors(vectors, self.dtype)
+        if self.dim is None:
+            self.dim = stored.shape[1]
+        elif stored.shape[1] != self.dim:
+            raise ValueError(f"Vectors of dimension {stored.shape[1]} added to a store of dimension {self.dim}")
+
+        self.vectors_file.write(np.ascontiguousarray(stored).tobytes())
+        if scales is not None:
+            self.scales_file.write(scales.tobytes())
+        for info in product_info:
+            self.products_file.write((", " if self.count else "") + json.dumps(info))
+            self.count += 1
+
+    def close(self):
+        """Assemble the .npy files and write meta.json (last, so its presence means the store is complete)."""
+        try:
+            for f in (self.vectors_file, self.scales_file):
+                f.close()
+            self.products_file.write("]")
+            self.products_file.close()
+
+            # The old store is incomplete from the first replaced file : without meta.json, nobody loads it
+            if os.path.exists(os.path.join(self.directory, "meta.json")):
+                os.remove(os.path.join(self.directory, "meta.json"))
+            shape = (self.count, self.dim or 0)
+            stored_dtype = quantize_vectors(np.zeros((1, 1)), self.dtype)[0].dtype
+            raw_to_npy(os.path.join(self.directory, "vectors.raw"), os.path.join(self.directory, "vectors.npy"), stored_dtype, shape)
+            if self.dtype == "int8":
+                raw_to_npy(os.path.join(self.directory, "scales.raw"), os.path.join(self.directory, "scales.npy"), np.float32, (self.count,))
+            else:
+                os.remove(os.path.join(self.directory, "scales.raw"))
+                if os.path.exists(os.path.join(self.directory, "scales.npy")):
+                    os.remove(os.path.join(self.directory, "scales.npy"))
+            os.replace(os.path.join(self.directory, "products.tmp.json"), os.path.join(self.directory, "products.json"))
+        except BaseException:
+            self.abort()
+            raise
+
+        meta = {"dtype": self.dtype, "count": self.count, "dim": shape[1], "model": self.model_name, "backend": self.backend}
+        save_json(os.path.join(self.directory, "meta.json"), meta, indent=4)
+        return load_vector_store(self.directory)
+
+    def abort(self):
+        """Stop writing and remove the temporary files (the previous store is left as is, unless close() had started)."""
+        for f in (self.vectors_file, self.scales_file, self.products_file):
+            f.close()
+        for name in ("vectors.raw", "scales.raw", "products.tmp.json", "vectors.tmp.npy", "scales.tmp.npy"):
+            if os.path.exists(os.path.join(self.directory, name)):
+                os.remove(os.path.join(self.directory, name))
+
+
+def raw_to_npy(raw_path, path, dtype, shape):
+    """Turn a raw binary file into a .npy file (header + streamed copy of the data), then remove it."""
+    temporary_path = path[:-len(".npy")] + ".tmp.npy"
+    with open(temporary_path, "wb") as out, open(raw_path, "rb") as raw:
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": shape}
+        np.lib.format.write_array_header_1_0(out, header)
+        shutil.copyfileobj(raw, out, 16 * 1024 * 1024)
+    os.replace(temporary_path, path)
+    os.remove(raw_path)
+
+
+def load_vector_store(directory=STORE_DIR):
+    """Load a vector store, the matrix is memory-mapped (zero-copy)."""
+    with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    with open(os.path.join(directory, "products.json"), "r", encoding="utf-8") as f:
+        product_info = json.load(f)
+
+    vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+    scales = np.load(os.path.join(directory, "scales.npy"), mmap_mode="r") if meta["dtype"] == "int8" else None
+    return VectorStore(directory, vectors, scales, product_info, meta)
+
+
+def patch_vector_store(product_info, updated_vectors, directory=STORE_DIR, dtype="float32", model_name=None,
+                       backend=None):
+    """
+    Apply changed embeddings to the store without re-encoding the other products.
+
+    :param product_info: Product info of every row of the new store, in order
+    :param updated_vectors: {product_id: vector} for the added and changed products
+    :return: The patched store
+    """
+    store = load_vector_store(directory) if os.path.exists(os.path.join(directory, "meta.json")) else None
+    new_ids = [p["product_id"] for p in product_info]
+
+    if store is not None and [p["product_id"] for p in store.product_info] == new_ids:
+        # Same products in the same rows : only the changed rows are re-encoded, the other stored rows are copied
+        rows = [i for i, product_id in enumerate(new_ids) if product_id in updated_vectors]
+        if rows:
+            stored, scales = quantize_vectors([updated_vectors[new_ids[i]] for i in rows], store.dtype)
+            vectors = np.array(store.vectors)
+            vectors[rows] = stored
+            save_array(os.path.join(directory, "vectors.npy"), vectors)
+            if scales is not None:
+                all_scales = np.array(store.scales)
+                all_scales[rows] = scales
+                save_array(os.path.join(directory, "scales.npy"), all_scales)
+
+        save_json(os.path.join(directory, "products.json"), product_info)
+        # Rewriting meta.json marks the store as modified (readers and the ANN index check its date)
+        save_json(os.path.join(directory, "meta.json"), store.meta, indent=4)
+        return load_vector_store(directory)
+
+    # Products were added or removed : the matrix is rewritten, reusing the stored vectors of unchanged products
+    old_rows = {p["product_id"]: i for i, p in enumerate(store.product_info)} if store is not None else {}
+    old_vectors = store.float_vectors() if store is not None else None
+    vectors = np.array([
+        updated_vectors[product_id] if product_id in updated_vectors else old_vectors[old_rows[product_id]]
+        for product_id in new_ids
+    ], dtype=np.float32)
+    return write_vector_store(vectors, product_info, directory, dtype=store.dtype if store is not None else dtype,
+                              model_name=store.meta.get("model") if store is not None else model_name,
+                              backend=store.meta.get("backend") if store is not None else backend)
+
+
+def convert_embeddings_json(json_file=EMBEDDINGS_JSON_FILE, directory=STORE_DIR, dtype="float32"):
+    """Convert the legacy embeddings_of_products.json file into a vector store."""
+    with open(json_file, "r", encoding="utf-8") as f:
+        product_embeddings = json.load(f)
+
+    vectors = np.array([p["embeddings"] for p in product_embeddings], dtype=np.float32)
+    product_info = [
+        {
+            "product_id": p["product_id"],
+            "url": p["url"],
+            "title": p["title"],
+            "variant": p.get("variant", "N/A")
+        }
+        for p in product_embeddings
+    ]
+    return write_vector_store(vectors, product_info, directory, dtype=dtype)
+
+
+def load_or_convert_vector_store(directory=STORE_DIR, json_file=EMBEDDINGS_JSON_FILE):
+    """Load the vector store, creating it from the legacy JSON embeddings the first time if needed."""
+    if not os.path.exists(os.path.join(directory, "meta.json")) and os.path.exists(json_file):
+        convert_embeddings_json(json_file, directory)
+    return load_vector_store(directory)
+
+
+if __name__ == "__main__":
+    # Convert the legacy JSON embeddings (python vector_store.py [float32|float16|int8])
+    import sys
+    dtype = sys.argv[1] if len(sys.argv) > 1 else "float32"
+    store = convert_embeddings_json(EMBEDDINGS_JSON_FILE, STORE_DIR, dtype=dtype)
+    print(f"✅ {len(store)} vectors ({store.dim} dims, {dtype}) saved in {STORE_DIR}.")